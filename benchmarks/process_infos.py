@@ -0,0 +1,154 @@
+#!/usr/bin/python
+"""
+Compares parsing of /proc/{pid}/status into a dict of every line with the
+early-stopping parser used by Linux.process_infos, and process_infos with
+stat-only process_summaries used by proc.num, on a synthetic proc root
+
+Usage: python benchmarks/process_infos.py [number of processes]
+"""
+from collections import namedtuple
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from zabby.core.utils import dict_from_file
+from zabby.hostos import ProcessInfo
+from zabby.hostos.linux import Linux, _parse_process_status
+
+STATUS = """Name:\tpython{pid}
+Umask:\t0022
+State:\tS (sleeping)
+Tgid:\t{pid}
+Ngid:\t0
+Pid:\t{pid}
+PPid:\t1
+TracerPid:\t0
+Uid:\t1000\t1000\t1000\t1000
+Gid:\t1000\t1000\t1000\t1000
+FDSize:\t64
+Groups:\t4 24 27 30 46 1000
+NStgid:\t{pid}
+NSpid:\t{pid}
+NSpgid:\t{pid}
+NSsid:\t{pid}
+VmPeak:\t  245396 kB
+VmSize:\t  245396 kB
+VmLck:\t       0 kB
+VmPin:\t       0 kB
+VmHWM:\t   22504 kB
+VmRSS:\t   22504 kB
+RssAnon:\t   10332 kB
+RssFile:\t   12172 kB
+RssShmem:\t       0 kB
+VmData:\t   19832 kB
+VmStk:\t     132 kB
+VmExe:\t    2820 kB
+VmLib:\t    7576 kB
+VmPTE:\t     160 kB
+VmSwap:\t       0 kB
+HugetlbPages:\t       0 kB
+CoreDumping:\t0
+THP_enabled:\t1
+Threads:\t1
+SigQ:\t0/63457
+SigPnd:\t0000000000000000
+ShdPnd:\t0000000000000000
+SigBlk:\t0000000000000000
+SigIgn:\t0000000001001000
+SigCgt:\t0000000180000002
+CapInh:\t0000000000000000
+CapPrm:\t0000000000000000
+CapEff:\t0000000000000000
+CapBnd:\t000001ffffffffff
+CapAmb:\t0000000000000000
+NoNewPrivs:\t0
+Seccomp:\t0
+Seccomp_filters:\t0
+Speculation_Store_Bypass:\tthread vulnerable
+Cpus_allowed:\tff
+Cpus_allowed_list:\t0-7
+Mems_allowed:\t00000000,00000001
+Mems_allowed_list:\t0
+voluntary_ctxt_switches:\t150
+nonvoluntary_ctxt_switches:\t545
+"""
+
+STAT = ("{pid} (python{pid}) S 1 {pid} {pid} 0 -1 4194560 2519 0 0 0 10 3 "
+        "0 0 20 0 1 0 4210 251285504 5626 18446744073709551615 1 1 0 0 0 0 "
+        "0 16781312 2 0 0 0 17 3 0 0 0 0 0\n")
+
+OldProcessInfo = namedtuple(
+    'OldProcessInfo',
+    ['name', 'uid', 'state', 'command_line', 'used_memory', 'pid', ]
+)
+
+
+def create_proc_root(processes):
+    proc_root = tempfile.mkdtemp(prefix='zabby_proc_')
+    for pid in range(1, processes + 1):
+        process_directory = os.path.join(proc_root, str(pid))
+        os.mkdir(process_directory)
+        with open(os.path.join(process_directory, 'status'), 'w') as f:
+            f.write(STATUS.format(pid=pid))
+        with open(os.path.join(process_directory, 'cmdline'), 'w') as f:
+            f.write('/usr/bin/python\0/srv/worker.py\0--id\0{0}\0'.format(
+                pid))
+        with open(os.path.join(process_directory, 'stat'), 'w') as f:
+            f.write(STAT.format(pid=pid))
+    return proc_root
+
+
+def status_as_dict(path):
+    status = dict_from_file(path, ':\t')
+    return (status['Name'], int(status['Uid'].split('\t')[0]),
+            status['State'], status['VmSize'])
+
+
+def status_parsed(path):
+    with open(path) as f:
+        return _parse_process_status(f)
+
+
+def measure(function, paths):
+    started = time.time()
+    for path in paths:
+        function(path)
+    return time.time() - started
+
+
+def main(processes):
+    print('creating {0} processes'.format(processes))
+    proc_root = create_proc_root(processes)
+    try:
+        paths = [os.path.join(proc_root, str(pid), 'status')
+                 for pid in range(1, processes + 1)]
+        measure(status_parsed, paths)  # warm up page cache
+
+        for name, function in [('dict_from_file', status_as_dict),
+                               ('early stopping', status_parsed)]:
+            elapsed = min(measure(function, paths) for _ in range(3))
+            print('{0:>15}: {1:.0f} ms, {2:.1f} us per process'.format(
+                name, elapsed * 1000, elapsed / processes * 1e6))
+
+        linux = Linux(proc_root=proc_root)
+        for name, function in [
+                ('process_infos', linux.process_infos),
+                ('summaries', linux.process_summaries),
+                ('uid summaries', lambda: linux.process_summaries(12345))]:
+            started = time.time()
+            found = len(list(function()))
+            print('{0:>15}: {1:.0f} ms for {2} processes'.format(
+                name, (time.time() - started) * 1000, found))
+
+        fields = ('python', 1000, 'sleep', '/usr/bin/python', 0, 1)
+        print('{0:>15}: {1} bytes namedtuple, {2} bytes __slots__'.format(
+            'record size', sys.getsizeof(OldProcessInfo(*fields)),
+            sys.getsizeof(ProcessInfo(*fields))))
+    finally:
+        shutil.rmtree(proc_root)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,60 @@
+#!/usr/bin/python
+"""
+Compares evaluation of a typical set of keys with sequential
+DataSource.process calls and with a single DataSource.process_many call
+
+Usage: python benchmarks/process_many.py [repetitions]
+"""
+import os
+import sys
+import timeit
+
+from zabby.agent import DataSource, KeyParser
+from zabby.config_manager import ModuleLoader
+from zabby.hostos import detect_host_os
+
+STANDARD_ITEMS = os.path.join(os.path.dirname(__file__), os.pardir, 'zabby',
+                              'examples', 'items', '10_standard.py')
+
+
+class Config(object):
+    def __init__(self):
+        self.items = ModuleLoader().load(STANDARD_ITEMS).items
+
+
+def keys(host_os):
+    keys = ['vm.memory.size[{0}]'.format(mode)
+            for mode in ['total', 'free', 'available', 'cached']]
+    for interface in sorted(host_os.net_interface_names()):
+        for mode in ['bytes', 'packets', 'errors', 'dropped']:
+            keys.append('net.if.in[{0},{1}]'.format(interface, mode))
+            keys.append('net.if.out[{0},{1}]'.format(interface, mode))
+    for cpu in range(host_os.cpu_count()):
+        keys.append('system.cpu.util[{0},user]'.format(cpu))
+    keys.append('proc.num')
+    for name in ['init', 'systemd', 'sshd', 'python']:
+        keys.append('proc.num[{0}]'.format(name))
+    return keys
+
+
+def main(repetitions):
+    host_os = detect_host_os()
+    data_source = DataSource(KeyParser(), Config(), host_os)
+    benchmarked_keys = keys(host_os)
+
+    def sequential():
+        return [data_source.process(key) for key in benchmarked_keys]
+
+    def bulk():
+        return data_source.process_many(benchmarked_keys)
+
+    print('{0} keys, {1} repetitions'.format(len(benchmarked_keys),
+                                             repetitions))
+    for name, function in [('process', sequential), ('process_many', bulk)]:
+        elapsed = min(timeit.repeat(function, number=repetitions, repeat=3))
+        print('{0:>14}: {1:.2f} ms per evaluation of all keys'.format(
+            name, elapsed / repetitions * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,40 @@
+#!/usr/bin/python
+"""
+Measures how Linux.process_infos scales with the number of process walker
+workers on a synthetic proc root
+
+Usage: python benchmarks/process_walker.py [number of processes]
+"""
+import shutil
+import sys
+import time
+
+from zabby.hostos.linux import Linux
+
+from process_infos import create_proc_root
+
+WORKERS = [0, 2, 4, 8, 16]
+
+
+def main(processes):
+    print('creating {0} processes'.format(processes))
+    proc_root = create_proc_root(processes)
+    try:
+        for workers in WORKERS:
+            linux = Linux(proc_root=proc_root)
+            linux.set_process_walker_workers(workers)
+            list(linux.process_infos())  # warm up page cache and pool
+
+            elapsed = list()
+            for _ in range(3):
+                started = time.time()
+                list(linux.process_infos())
+                elapsed.append(time.time() - started)
+            print('{0:>3} workers: {1:.0f} ms'.format(workers,
+                                                      min(elapsed) * 1000))
+    finally:
+        shutil.rmtree(proc_root)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -2,6 +2,8 @@ import string
 import struct
 import logging
 import sys
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from zabby.core.exceptions import WrongArgumentError
 
 try:
@@ -107,13 +109,13 @@ class ZBXDProtocol():
         client.sendall(message)
 
     def _calculate_message(self, value):
-        formatted_value = self._format(value)
+        formatted_value = b(self._format(value))
         data_length = len(formatted_value)
         response = struct.pack(
             self.RESPONSE_FORMAT.format(data_length=data_length),
             self.HEADER,
             data_length,
-            b(formatted_value)
+            formatted_value
         )
         return response
 
@@ -127,10 +129,16 @@ class ZBXDProtocol():
 
 class DataSource:
     DEFAULT_VALUE = "ZBX_NOTSUPPORTED"
+    MAX_WORKERS = 8
 
-    def __init__(self, key_parser, config):
+    def __init__(self, key_parser, config, host_os=None):
+        """
+        :param host_os: if supplied, process_many reads its data only once
+            for all keys
+        """
         self.key_parser = key_parser
         self.config = config
+        self.host_os = host_os
 
     def process(self, raw_key):
         """
@@ -140,6 +148,67 @@ class DataSource:
         is passed to it returns ZBX_NOTSUPPORTED
         """
         key, arguments = self.key_parser.parse(raw_key)
+        return self._call(key, arguments)
+
+    def process_many(self, raw_keys):
+        """
+        Returns a list of results of process for raw_keys in the same order
+
+        Keys handled by the same function are evaluated one after another,
+        different functions are evaluated concurrently in up to MAX_WORKERS
+        threads, host_os data such as /proc/stat or process list is read
+        once for all keys
+        """
+        results = [self.DEFAULT_VALUE] * len(raw_keys)
+
+        # functions are kept in order of keys, so that results are ordered
+        functions = list()
+        groups = dict()
+        for index, raw_key in enumerate(raw_keys):
+            try:
+                key, arguments = self.key_parser.parse(raw_key)
+            except WrongArgumentError as e:
+                LOG.warning("Unable to parse '{0}': {1}".format(raw_key, e))
+                continue
+            function = self.config.items.get(key)
+            if function not in groups:
+                functions.append(function)
+                groups[function] = list()
+            groups[function].append((index, key, arguments))
+        ordered_groups = [groups[function] for function in functions]
+
+        with self._batch() as batch_results:
+            def process_group(group):
+                # workers join the batch of the calling thread
+                with self._batch(batch_results):
+                    return [(index, self._call(key, arguments))
+                            for index, key, arguments in group]
+
+            if len(ordered_groups) > 1:
+                pool = ThreadPool(min(self.MAX_WORKERS, len(ordered_groups)))
+                try:
+                    processed_groups = pool.map(process_group, ordered_groups)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                processed_groups = [process_group(group)
+                                    for group in ordered_groups]
+
+        for processed_group in processed_groups:
+            for index, value in processed_group:
+                results[index] = value
+        return results
+
+    @contextmanager
+    def _batch(self, results=None):
+        if self.host_os is None:
+            yield None
+        else:
+            with self.host_os.batch(results) as batch_results:
+                yield batch_results
+
+    def _call(self, key, arguments):
         LOG.debug("Received request for '{0}' with arguments {1}".format(
             key, arguments))
 
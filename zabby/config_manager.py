@@ -4,6 +4,7 @@ import logging
 import logging.config
 from zabby.core.exceptions import ConfigurationError
 from zabby.core.six import string_types, integer_types
+from zabby.hostos.collectors import validate_history_resolutions
 
 LOG = logging.getLogger(__name__)
 
@@ -15,6 +16,13 @@ class ConfigManager:
 
         self._config = None
         self.listen_address = (None, None)
+        self.collector_history = dict()
+        self.state_dir = None
+        self.process_pool_size = 0
+        self.coalescing_ttl = 0
+        self.helper_pool_size = 0
+        self.process_walker_workers = 0
+        self.item_files = list()
         self.items = dict()
 
     def update_config(self):
@@ -29,6 +37,12 @@ class ConfigManager:
             logging.config.fileConfig(self._config.logging_conf,
                                       disable_existing_loggers=False)
             self._set_listen_address()
+            self._set_collector_history()
+            self._set_state_dir()
+            self._set_process_pool_size()
+            self._set_coalescing_ttl()
+            self._set_helper_pool_size()
+            self._set_process_walker_workers()
             self._load_items()
         except ConfigurationError as e:
             raise e
@@ -42,6 +56,42 @@ class ConfigManager:
         self.listen_address = (self._config.listen_host,
                                self._config.listen_port)
 
+    def _set_collector_history(self):
+        collector_history = getattr(self._config, 'collector_history', dict())
+        self._check_type(collector_history, dict)
+        for resolutions in collector_history.values():
+            validate_history_resolutions(resolutions)
+        self.collector_history = collector_history
+
+    def _set_state_dir(self):
+        state_dir = getattr(self._config, 'state_dir', None)
+        if state_dir is not None:
+            self._check_type(state_dir, string_types)
+        self.state_dir = state_dir
+
+    def _set_process_pool_size(self):
+        process_pool_size = getattr(self._config, 'process_pool_size', 0)
+        self._check_type(process_pool_size, integer_types)
+        self.process_pool_size = process_pool_size
+
+    def _set_coalescing_ttl(self):
+        coalescing_ttl = getattr(self._config, 'coalescing_ttl', 0)
+        self._check_type(coalescing_ttl, integer_types + (float, ))
+        if coalescing_ttl < 0:
+            raise ConfigurationError("coalescing_ttl should not be negative")
+        self.coalescing_ttl = coalescing_ttl
+
+    def _set_helper_pool_size(self):
+        helper_pool_size = getattr(self._config, 'helper_pool_size', 0)
+        self._check_type(helper_pool_size, integer_types)
+        self.helper_pool_size = helper_pool_size
+
+    def _set_process_walker_workers(self):
+        process_walker_workers = getattr(self._config,
+                                         'process_walker_workers', 0)
+        self._check_type(process_walker_workers, integer_types)
+        self.process_walker_workers = process_walker_workers
+
     def _check_type(self, var, desired_type):
         """ Raises ConfigurationError if var is not of desired_type """
         if not isinstance(var, desired_type):
@@ -56,9 +106,22 @@ class ConfigManager:
             self._check_type(item_module.items, dict)
             items.update(item_module.items)
 
+        self.item_files = list(self._config.item_files)
         self.items = items
 
 
+def load_modules(module_paths):
+    """
+    Loads every module from module_paths with ModuleLoader
+
+    Can be used as process pool initializer, so that functions from item
+    files could be unpickled in worker processes
+    """
+    module_loader = ModuleLoader()
+    for module_path in module_paths:
+        module_loader.load(module_path)
+
+
 class ModuleLoader():
     def load(self, module_path):
         """
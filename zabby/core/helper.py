@@ -0,0 +1,215 @@
+"""
+Long-lived helper processes that run commands for zabby.core.utils.sh
+
+Helpers are started as separate python interpreters, so commands are forked
+from a small helper process instead of the agent. Requests and responses are
+JSON documents prefixed with their length
+"""
+import json
+import logging
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from zabby.core.exceptions import OperatingSystemError
+from zabby.core.six import PY3
+from zabby.core.utils import monotonic, _run
+
+LOG = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('!I')
+HELPER_GRACE_PERIOD = 1.0
+HELPER_WAIT_STEP = 0.1
+
+_PACKAGE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def send_message(f, message):
+    data = json.dumps(message).encode('utf-8')
+    f.write(_LENGTH.pack(len(data)) + data)
+    f.flush()
+
+
+def receive_message(fd, deadline=None):
+    """
+    Reads a message from file descriptor fd
+
+    :returns: None if fd was closed before message started
+    :raises: OperatingSystemError if message is not received until deadline
+        or fd is closed in the middle of message
+    """
+    header = _read_exactly(fd, _LENGTH.size, deadline)
+    if header is None:
+        return None
+    data = _read_exactly(fd, _LENGTH.unpack(header)[0], deadline)
+    if data is None:
+        raise OperatingSystemError("Helper closed its output")
+    return json.loads(data.decode('utf-8'))
+
+
+def _read_exactly(fd, size, deadline):
+    chunks = list()
+    remaining = size
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    while remaining:
+        if deadline is not None:
+            poll_timeout = (deadline - monotonic()) * 1000
+            if poll_timeout <= 0 or not poller.poll(poll_timeout):
+                raise OperatingSystemError("Helper has not responded in time")
+        chunk = os.read(fd, remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise OperatingSystemError("Helper closed its output")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def serve(input_fd, output):
+    """
+    Runs commands received from input_fd until it is closed
+    """
+    while True:
+        request = receive_message(input_fd)
+        if request is None:
+            break
+        try:
+            out, err = _run(request['command'], request['timeout'],
+                            request['max_output_size'])
+            if not PY3:
+                # JSON carries text, latin-1 maps every byte to a character
+                out, err = out.decode('latin-1'), err.decode('latin-1')
+            response = {'out': out, 'err': err}
+        except OperatingSystemError as e:
+            response = {'error': str(e)}
+        send_message(output, response)
+
+
+class HelperPool(object):
+    """
+    Pool of helper processes, each of them runs one command at a time
+
+    Pool is bound to the process that created it, forked children should not
+    use it
+    """
+
+    def __init__(self, size):
+        self._owner_pid = os.getpid()
+        self._size = size
+        self._helpers = queue.Queue()
+        self._stopped = threading.Event()
+        for _ in range(size):
+            self._helpers.put(self._spawn())
+
+    def is_usable(self):
+        return os.getpid() == self._owner_pid and not self._stopped.is_set()
+
+    def run(self, command, timeout, max_output_size):
+        """
+        Runs command in one of helpers and returns its (stdout, stderr)
+
+        Helper that does not respond in time or dies is replaced with a new
+        one. Command is run by the calling process if pool is stopped while
+        waiting for a free helper
+
+        :raises: OperatingSystemError if command fails or helper does not
+            respond
+        """
+        deadline = None
+        if timeout:
+            deadline = monotonic() + timeout + HELPER_GRACE_PERIOD
+
+        while True:
+            if self._stopped.is_set():
+                return _run(command, timeout, max_output_size)
+            try:
+                helper = self._helpers.get(timeout=HELPER_WAIT_STEP)
+                break
+            except queue.Empty:
+                pass
+
+        try:
+            if helper is None:  # previous helper could not be restarted
+                helper = self._spawn()
+            send_message(helper.stdin, {
+                'command': command,
+                'timeout': timeout,
+                'max_output_size': max_output_size,
+            })
+            response = receive_message(helper.stdout.fileno(), deadline)
+            if response is None:
+                raise OperatingSystemError("Helper has exited")
+        except (IOError, OSError, ValueError, OperatingSystemError) as e:
+            if helper is not None:
+                LOG.warning("Restarting helper {0}: {1}".format(helper.pid, e))
+                self._terminate(helper)
+                helper = self._respawn()
+            raise OperatingSystemError(
+                "Unable to run '{0}' in helper: {1}".format(command, e))
+        finally:
+            self._helpers.put(helper)
+
+        if 'error' in response:
+            raise OperatingSystemError(response['error'])
+        out, err = response['out'], response['err']
+        if not PY3:
+            out, err = out.encode('latin-1'), err.encode('latin-1')
+        return out, err
+
+    def stop(self):
+        """
+        Waits for running commands and stops all helpers
+        """
+        self._stopped.set()
+        for _ in range(self._size):
+            helper = self._helpers.get()
+            if helper is not None:
+                self._terminate(helper)
+
+    def _spawn(self):
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(
+            [_PACKAGE_DIR] + [path for path in
+                              [environment.get('PYTHONPATH')] if path])
+        return subprocess.Popen([sys.executable, '-m', 'zabby.core.helper'],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                close_fds=True, env=environment)
+
+    def _respawn(self):
+        """
+        Returns a new helper or None if it can not be started, in which case
+        it is started by the next command
+        """
+        try:
+            return self._spawn()
+        except OSError as e:
+            LOG.warning("Unable to start helper: {0}".format(e))
+            return None
+
+    @staticmethod
+    def _terminate(helper):
+        try:
+            helper.stdin.close()
+        except (IOError, OSError):
+            pass
+        try:
+            helper.kill()
+        except OSError:
+            pass  # helper has already exited
+        helper.wait()
+        helper.stdout.close()
+
+
+if __name__ == '__main__':
+    serve(sys.stdin.fileno(), getattr(sys.stdout, 'buffer', sys.stdout))
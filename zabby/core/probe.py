@@ -0,0 +1,316 @@
+"""
+Event loop that checks network services concurrently without blocking a
+thread per connection
+"""
+import errno
+import fcntl
+import logging
+import os
+import select
+import socket
+import threading
+from collections import namedtuple
+
+from zabby.core.utils import monotonic
+
+LOG = logging.getLogger(__name__)
+
+
+class Service(namedtuple('Service', [
+        'port', 'receive_first', 'request', 'expect', 'quit', 'reusable', ])):
+    """
+    Expected behaviour of a service
+
+    :param port: default port of service
+    :param receive_first: whether service sends greeting upon connection
+    :param request: what should be sent to service, None if nothing
+    :param expect: compiled binary regular expression that response should
+        match, service is considered running upon connection if None
+    :param quit: what should be sent to service before disconnecting
+    :param reusable: whether connection may be used by the next probe
+    """
+    __slots__ = ()
+
+
+READ_SIZE = 4096
+MAX_RESPONSE_SIZE = 65536
+IDLE_CONNECTION_TIMEOUT = 60.0
+
+
+class _Probe(object):
+    def __init__(self, service, family, address, started, deadline):
+        self.service = service
+        self.family = family
+        self.address = address
+        self.started = started
+        self.deadline = deadline
+        self.sock = None
+        self.reused = False
+        self.state = None
+        self.to_send = b''
+        self.received = b''
+        self.elapsed = None
+        self.completed = threading.Event()
+
+
+class ProbeEngine(object):
+    """
+    Checks services on a single event loop thread, callers wait for their
+    checks to complete
+
+    :param pool_connections: if true, connections to reusable services are
+        kept open after successful check and used by the next check of the
+        same service
+    """
+
+    def __init__(self, pool_connections=False, max_idle_connections=4):
+        self.pool_connections = pool_connections
+        self.max_idle_connections = max_idle_connections
+
+        self._lock = threading.Lock()
+        self._submitted = list()
+        self._thread = None
+        self._stopped = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        # a full pipe already guarantees a wakeup, so writes may be dropped
+        fcntl.fcntl(self._wakeup_write, fcntl.F_SETFL,
+                    fcntl.fcntl(self._wakeup_write, fcntl.F_GETFL) |
+                    os.O_NONBLOCK)
+        # accessed only by event loop thread
+        self._idle_connections = dict()
+
+    def check(self, service, host, port, timeout):
+        """
+        Returns number of seconds service at host:port took to connect and
+        respond as expected, None if it did not do so in timeout seconds
+        """
+        started = monotonic()
+        try:
+            family, _, _, _, address = socket.getaddrinfo(
+                host, port, 0, socket.SOCK_STREAM)[0]
+        except socket.error as e:
+            LOG.debug("Unable to resolve {0}: {1}".format(host, e))
+            return None
+
+        probe = _Probe(service, family, address, started, started + timeout)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='probe-engine')
+                self._thread.daemon = True
+                self._thread.start()
+            self._submitted.append(probe)
+        self._wake_up()
+
+        probe.completed.wait(timeout + 1.0)
+        return probe.elapsed
+
+    def stop(self):
+        """
+        Stops event loop thread and closes idle connections
+        """
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._wake_up()
+        if thread is not None:
+            thread.join()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def _wake_up(self):
+        try:
+            os.write(self._wakeup_write, b'.')
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._wakeup_read, select.POLLIN)
+        probes = dict()
+
+        while True:
+            poll_timeout = None
+            if probes:
+                nearest_deadline = min(probe.deadline
+                                       for probe in probes.values())
+                poll_timeout = max(nearest_deadline - monotonic(), 0) * 1000
+            try:
+                events = poller.poll(poll_timeout)
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, event in events:
+                if fd == self._wakeup_read:
+                    os.read(fd, READ_SIZE)
+                    with self._lock:
+                        if self._stopped:
+                            self._close_all(probes)
+                            return
+                        submitted, self._submitted = self._submitted, list()
+                    for probe in submitted:
+                        self._step(self._start, probe, poller, probes)
+                elif fd in probes:
+                    self._step(self._advance, probes[fd], poller, probes,
+                               event)
+
+            now = monotonic()
+            for probe in list(probes.values()):
+                if probe.deadline <= now:
+                    self._step(self._finish, probe, poller, probes, False)
+
+    def _step(self, function, probe, poller, probes, *args):
+        """
+        Calls function(probe, *args, poller, probes), probe fails on
+        unexpected errors, so that event loop keeps running for other probes
+        """
+        try:
+            function(probe, *(args + (poller, probes)))
+        except Exception as e:
+            LOG.exception("Probe of {0} failed unexpectedly: {1}".format(
+                probe.address, e))
+            if probe.sock is not None:
+                for fd, other in list(probes.items()):
+                    if other is probe:
+                        poller.unregister(fd)
+                        del probes[fd]
+                probe.sock.close()
+            probe.completed.set()
+
+    def _start(self, probe, poller, probes, reuse=True):
+        if reuse and self.pool_connections:
+            probe.sock = self._take_idle_connection(probe)
+        probe.reused = probe.sock is not None
+
+        if probe.reused:
+            probes[probe.sock.fileno()] = probe
+            poller.register(probe.sock.fileno(), select.POLLOUT)
+            self._exchange(probe, poller, probes)
+            return
+
+        probe.sock = None
+        try:
+            probe.sock = socket.socket(probe.family, socket.SOCK_STREAM)
+            probe.sock.setblocking(False)
+            error = probe.sock.connect_ex(probe.address)
+        except socket.error as e:
+            error = e.args[0]
+        if error not in (0, errno.EINPROGRESS):
+            LOG.debug("Unable to connect to {0}: {1}".format(
+                probe.address, os.strerror(error)))
+            if probe.sock is not None:
+                probe.sock.close()
+            probe.completed.set()
+            return
+
+        probe.state = 'connecting'
+        probes[probe.sock.fileno()] = probe
+        poller.register(probe.sock.fileno(), select.POLLOUT)
+
+    def _advance(self, probe, event, poller, probes):
+        try:
+            if probe.state == 'connecting':
+                error = probe.sock.getsockopt(socket.SOL_SOCKET,
+                                              socket.SO_ERROR)
+                if error:
+                    raise socket.error(error, os.strerror(error))
+                self._exchange(probe, poller, probes)
+            elif event & (select.POLLERR | select.POLLNVAL):
+                raise socket.error(errno.ECONNRESET, 'Connection error')
+            elif probe.state == 'sending':
+                sent = probe.sock.send(probe.to_send)
+                probe.to_send = probe.to_send[sent:]
+                if not probe.to_send:
+                    self._receive(probe, poller)
+            elif probe.state == 'receiving':
+                data = probe.sock.recv(READ_SIZE)
+                if not data:
+                    raise socket.error(errno.ECONNRESET,
+                                       'Connection closed by service')
+                probe.received += data
+                if probe.service.expect.search(probe.received):
+                    self._finish(probe, True, poller, probes)
+                elif len(probe.received) > MAX_RESPONSE_SIZE:
+                    raise socket.error(errno.EMSGSIZE,
+                                       'Unexpected response')
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            LOG.debug("Probe of {0} failed: {1}".format(probe.address, e))
+            self._finish(probe, False, poller, probes)
+
+    def _exchange(self, probe, poller, probes):
+        service = probe.service
+        if service.expect is None:
+            self._finish(probe, True, poller, probes)
+        elif service.receive_first and not probe.reused:
+            self._receive(probe, poller)
+        else:
+            probe.state = 'sending'
+            probe.to_send = service.request
+            poller.modify(probe.sock.fileno(), select.POLLOUT)
+
+    @staticmethod
+    def _receive(probe, poller):
+        probe.state = 'receiving'
+        probe.received = b''
+        poller.modify(probe.sock.fileno(), select.POLLIN)
+
+    def _finish(self, probe, success, poller, probes):
+        fd = probe.sock.fileno()
+        poller.unregister(fd)
+        del probes[fd]
+
+        if not success and probe.reused and monotonic() < probe.deadline:
+            # idle connection might have been closed by service
+            probe.sock.close()
+            probe.sock = None
+            self._start(probe, poller, probes, reuse=False)
+            return
+
+        if success:
+            probe.elapsed = monotonic() - probe.started
+            if not self._keep_idle_connection(probe):
+                if probe.service.quit:
+                    try:
+                        probe.sock.send(probe.service.quit)
+                    except socket.error:
+                        pass
+                probe.sock.close()
+        else:
+            probe.sock.close()
+        probe.completed.set()
+
+    def _take_idle_connection(self, probe):
+        idle = self._idle_connections.get((probe.address, probe.service), [])
+        while idle:
+            sock, last_used = idle.pop()
+            if monotonic() - last_used < IDLE_CONNECTION_TIMEOUT:
+                return sock
+            sock.close()
+        return None
+
+    def _keep_idle_connection(self, probe):
+        if not (self.pool_connections and probe.service.reusable and
+                probe.received.endswith(b'\n')):
+            return False
+        idle = self._idle_connections.setdefault(
+            (probe.address, probe.service), [])
+        if len(idle) >= self.max_idle_connections:
+            return False
+        idle.append((probe.sock, monotonic()))
+        return True
+
+    def _close_all(self, probes):
+        for probe in self._submitted:
+            probe.completed.set()
+        for probe in probes.values():
+            probe.sock.close()
+            probe.completed.set()
+        for idle in self._idle_connections.values():
+            for sock, _ in idle:
+                sock.close()
+        self._idle_connections.clear()
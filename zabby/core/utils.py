@@ -1,12 +1,73 @@
 from __future__ import division
+import errno
+import json
+import locale
+import os
+import re
+import select
+import shlex
+import signal
 import socket
+import sys
 import logging
-from subprocess import Popen, PIPE
-
-from itertools import islice
+import multiprocessing
+import threading
 import time
+import warnings
+from subprocess import Popen, PIPE
+try:
+    from subprocess import TimeoutExpired
+except ImportError:  # python < 3.3 can not wait with timeout
+    TimeoutExpired = None
+
+from itertools import count, islice
+try:
+    from time import monotonic
+except ImportError:  # python < 3.3 has no monotonic clock in stdlib
+    monotonic = None
 from zabby.core.exceptions import WrongArgumentError, OperatingSystemError
-from zabby.core.six import binary_type
+from zabby.core.six import binary_type, PY3
+
+LOG = logging.getLogger(__name__)
+
+
+def _libc_monotonic():
+    """
+    Returns monotonic clock that reads CLOCK_MONOTONIC with clock_gettime,
+    falls back to time.time where clock_gettime is not available
+    """
+    import ctypes
+    import ctypes.util
+
+    class Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    clock_monotonic = 1  # value of CLOCK_MONOTONIC on linux
+    if not sys.platform.startswith('linux'):
+        return time.time
+    try:
+        # glibc older than 2.17 provides clock_gettime in librt only
+        library = ctypes.CDLL(ctypes.util.find_library('rt'), use_errno=True)
+        clock_gettime = library.clock_gettime
+    except (OSError, AttributeError):
+        LOG.warning("clock_gettime is not available, "
+                    "time steps will affect scheduling")
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+    clock_gettime.restype = ctypes.c_int
+
+    def libc_monotonic():
+        timespec = Timespec()
+        if clock_gettime(clock_monotonic, ctypes.byref(timespec)) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+    return libc_monotonic
+
+
+if monotonic is None:
+    monotonic = _libc_monotonic()
 
 
 def write_to_file(file_path, value):
@@ -123,6 +184,97 @@ def to_bytes(value, factor):
     return int(value) * BYTE_SCALE[factor]
 
 
+def parse_port(port):
+    """
+    Converts port to int
+
+    :raises: WrongArgumentError if port is not an integer in range [0,65535]
+    """
+    try:
+        port = int(port)
+        if port < 0 or 65535 < port:
+            raise ValueError()
+    except ValueError:
+        raise WrongArgumentError(
+            "Port must be an integer in range [0,65535], got '{0}'".format(
+                port))
+    return port
+
+
+def discovery_json(entries):
+    """
+    Returns low-level discovery JSON that contains entries
+
+    :param entries: iterable of dicts that map macro names without braces and
+        hash sign, such as FSNAME, to their values
+    """
+    return json.dumps({'data': [
+        dict(('{{#{0}}}'.format(macro), value)
+             for macro, value in entry.items())
+        for entry in entries
+    ]}, sort_keys=True)
+
+
+def compile_filter(pattern):
+    """
+    Compiles regular expression that should match the whole value
+
+    :raises: WrongArgumentError if pattern is not a valid regular expression
+    """
+    try:
+        return re.compile('(?:{0})\\Z'.format(pattern))
+    except re.error as e:
+        raise WrongArgumentError(
+            "Invalid regular expression '{0}': {1}".format(pattern, e))
+
+
+def filter_names(names, include='', exclude=''):
+    """
+    Returns sorted list of names that completely match include and do not
+    completely match exclude regular expressions, empty expressions are
+    ignored
+
+    :raises: WrongArgumentError if include or exclude is not a valid regular
+        expression
+    """
+    include_filter = compile_filter(include) if include else None
+    exclude_filter = compile_filter(exclude) if exclude else None
+    return sorted(
+        name for name in names
+        if (include_filter is None or include_filter.match(name)) and
+        (exclude_filter is None or not exclude_filter.match(name)))
+
+
+class DiscoveryCache(object):
+    """
+    Remembers discovery JSON built for the latest snapshot of every key, so
+    that JSON is built again only after snapshot changes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._discoveries = dict()
+
+    def get(self, key, snapshot, build):
+        """
+        Returns JSON remembered for key if it was built for snapshot equal to
+        supplied one, calls build otherwise
+        """
+        with self._lock:
+            cached = self._discoveries.get(key)
+        if cached is not None and cached[0] == snapshot:
+            return cached[1]
+
+        result = build()
+        with self._lock:
+            self._discoveries[key] = (snapshot, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._discoveries.clear()
+
+
 AVERAGE_MODE = {
     'avg1': 60,
     'avg5': 300,
@@ -130,29 +282,106 @@ AVERAGE_MODE = {
 }
 
 
-def sh(command, timeout=1.0, wait_step=0.01, raise_on_empty_out=True,
-       raise_on_nonempty_err=False):
+class TimedCache(object):
+    """
+    Thread safe cache of values that expire ttl seconds after being set
+
+    :param max_size: if set, arbitrary entries are forgotten when cache grows
+        over max_size
+    """
+
+    def __init__(self, ttl, max_size=None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = dict()
+
+    def get(self, key, default=None):
+        """
+        Returns value set for key or default if there is none or it expired
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        expires_at = monotonic() + self._ttl
+        with self._lock:
+            if (self._max_size is not None and key not in self._entries and
+                    len(self._entries) >= self._max_size):
+                self._evict(expires_at - self._ttl)
+            self._entries[key] = (value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        for key, (_, expires_at) in list(self._entries.items()):
+            if expires_at <= now:
+                del self._entries[key]
+        if len(self._entries) >= self._max_size:
+            self._entries.popitem()
+
+
+SHELL_SYNTAX = re.compile(r'[|&;<>()$`\\"\'*?\[\]#~=%{}!\n]')
+SH_READ_SIZE = 65536
+SH_WAIT_STEP = 0.01
+
+
+def sh(command, timeout=1.0, wait_step=None, raise_on_empty_out=True,
+       raise_on_nonempty_err=False, max_output_size=1024 * 1024, cache_ttl=0,
+       stale_ttl=0):
     """
-    Creates and returns a function that when called will run command with shell
-    and return it's output.
+    Creates and returns a function that when called will run command and
+    return it's output.
 
     Command can contain replacement fields as described in python documentation
     http://docs.python.org/library/string.html?highlight=formatter#format-string-syntax
 
     sh('command {0}')('argument') will call 'command argument'
 
+    Commands without shell syntax, such as pipes, redirections or quotes, are
+    executed directly if their executable is found in PATH, other commands,
+    including shell builtins such as 'ulimit -n', are executed with shell.
+    Command is started in a new session, so that it is killed with all its
+    children
+
     :param timeout: if command does not terminate in it will be killed and
         OperatingSystemError will be raised
-    :param wait_step: poll interval for process running command
+    :param wait_step: deprecated and ignored, output of command is read as
+        soon as it is written instead of checking it every wait_step seconds,
+        passing it issues DeprecationWarning
     :param raise_on_empty_out: whether exception should be raised if command
         does not write anything to stdout
     :param raise_on_nonempty_err: whether exception should be raised if command
         writes to stderr
+    :param max_output_size: if command writes more bytes to stdout and stderr
+        it will be killed and OperatingSystemError will be raised
+    :param cache_ttl: output of command is shared for this number of seconds
+        by every function created by sh that runs the same formatted command,
+        including failures
+    :param stale_ttl: for this number of seconds after cache_ttl expires
+        previous output is returned, while command is run again in background
+
+    Commands are run by helper processes if start_helper_pool was called
 
     :raises: WrongArgumentError if command contains replacement fields and
         resulting function is called without arguments
-    :raises: OperatingSystemError if command does not terminate until timeout
+    :raises: OperatingSystemError if command does not terminate until timeout,
+        writes too much or can not be executed
     """
+    if wait_step is not None:
+        warnings.warn("sh() ignores wait_step, output of command is read as "
+                      "soon as it is written", DeprecationWarning,
+                      stacklevel=2)
 
     def call_command(*args):
         try:
@@ -161,22 +390,14 @@ def sh(command, timeout=1.0, wait_step=0.01, raise_on_empty_out=True,
             raise WrongArgumentError(
                 "'{0}' not enough arguments. Called with {1}".format(command,
                                                                      args))
-        process = Popen(formatted_command, stdout=PIPE, stderr=PIPE,
-                        shell=True, close_fds=True, universal_newlines=True)
-        try:
-            if timeout:
-                wait_time_remaining = timeout
-                while process.poll() is None and wait_time_remaining > 0:
-                    time.sleep(wait_step)
-                    wait_time_remaining -= wait_step
-
-                if wait_time_remaining <= 0:
-                    process.kill()
-                    raise OperatingSystemError(
-                        "{0} have not completed in {1} seconds".format(
-                            formatted_command, timeout))
-        finally:
-            (out, err) = process.communicate()
+        if cache_ttl:
+            (out, err) = _command_results.get(
+                formatted_command, cache_ttl, stale_ttl,
+                lambda: _dispatch(formatted_command, timeout,
+                                  max_output_size))
+        else:
+            (out, err) = _dispatch(formatted_command, timeout,
+                                   max_output_size)
 
         (out, err) = (out.rstrip(), err.rstrip())
 
@@ -199,6 +420,311 @@ def sh(command, timeout=1.0, wait_step=0.01, raise_on_empty_out=True,
     return call_command
 
 
+def sh_field(command, parse=None, **kwargs):
+    """
+    Creates and returns a function that when called will run command, parse
+    its output and return one of the fields
+
+    sh_field('mysqladmin status', cache_ttl=30)('Threads') will return
+    number of threads, every field is obtained from a single run of the
+    command if cache_ttl is set
+
+    :param parse: function that converts command output to a dict of fields,
+        parse_key_values if None
+    :param kwargs: passed to sh
+
+    :raises: WrongArgumentError if there is no such field in output
+    """
+    if parse is None:
+        parse = parse_key_values
+    call_command = sh(command, **kwargs)
+    last_parsed = [(None, None)]
+
+    def get_field(field, *args):
+        out = call_command(*args)
+        parsed_out, fields = last_parsed[0]
+        if parsed_out != out:
+            fields = parse(out)
+            last_parsed[0] = (out, fields)
+        try:
+            return fields[field]
+        except KeyError:
+            raise WrongArgumentError(
+                "'{0}' has not written field '{1}'".format(command, field))
+
+    return get_field
+
+
+KEY_VALUE_PAIR = re.compile(r'([^\s:=][^:=]*?)\s*[:=]\s*(\S+)')
+
+
+def parse_key_values(out):
+    """
+    Returns dict of 'key: value' or 'key = value' pairs found in out
+
+    'Uptime: 10  Threads: 2' will be parsed as {'Uptime': '10', 'Threads': '2'}
+    """
+    return dict(KEY_VALUE_PAIR.findall(out))
+
+
+class CommandResults(object):
+    """
+    Remembers outputs and failures of commands for a period of time
+
+    Only one run of each command is in progress at any time, callers that
+    need the same command wait for that run to complete
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._command_locks = dict()
+        self._results = dict()
+        self._refreshing = set()
+
+    def get(self, command, cache_ttl, stale_ttl, run):
+        """
+        Returns remembered result of command or result of run, which is
+        called if remembered result is older than cache_ttl, results that are
+        older than cache_ttl but not older than cache_ttl + stale_ttl are
+        returned while run is called in background
+
+        :raises: OperatingSystemError raised by run
+        """
+        with self._lock:
+            result = self._results.get(command)
+            command_lock = self._command_locks.setdefault(command,
+                                                          threading.Lock())
+        if result is not None:
+            age = monotonic() - result[0]
+            if age < cache_ttl:
+                return self._unpack(result)
+            if age < cache_ttl + stale_ttl:
+                self._refresh(command, command_lock, cache_ttl + stale_ttl,
+                              run)
+                return self._unpack(result)
+
+        with command_lock:
+            with self._lock:
+                result = self._results.get(command)
+            if result is None or monotonic() - result[0] >= cache_ttl:
+                result = self._run(command, cache_ttl + stale_ttl, run)
+        return self._unpack(result)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def _refresh(self, command, command_lock, keep_for, run):
+        with self._lock:
+            if command in self._refreshing:
+                return
+            self._refreshing.add(command)
+
+        def refresh():
+            try:
+                with command_lock:
+                    self._run(command, keep_for, run)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(command)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, command, keep_for, run):
+        try:
+            outputs, error = run(), None
+        except OperatingSystemError as e:
+            outputs, error = None, e
+
+        now = monotonic()
+        result = (now, outputs, error, now + keep_for)
+        with self._lock:
+            for remembered_command, remembered in list(self._results.items()):
+                if remembered[3] <= now:
+                    del self._results[remembered_command]
+                    self._forget_lock(remembered_command)
+            self._results[command] = result
+        return result
+
+    def _forget_lock(self, command):
+        """
+        Forgets lock of command whose result expired unless command is being
+        run, should be called with self._lock held
+        """
+        command_lock = self._command_locks.get(command)
+        if command_lock is not None and not command_lock.locked():
+            del self._command_locks[command]
+
+    @staticmethod
+    def _unpack(result):
+        _, outputs, error, _ = result
+        if error is not None:
+            raise error
+        return outputs
+
+
+_command_results = CommandResults()
+
+
+_helper_pool = None
+
+
+def start_helper_pool(size):
+    """
+    Starts size helper processes that will run commands of functions created
+    by sh, so that commands are not forked from the agent
+    """
+    from zabby.core.helper import HelperPool
+
+    global _helper_pool
+    _helper_pool = HelperPool(size)
+
+
+def stop_helper_pool():
+    """
+    Stops helpers started by start_helper_pool, commands will be run by the
+    agent from now on
+    """
+    global _helper_pool
+    if _helper_pool is not None:
+        pool, _helper_pool = _helper_pool, None
+        pool.stop()
+
+
+def _dispatch(command, timeout, max_output_size):
+    pool = _helper_pool
+    if pool is not None and pool.is_usable():
+        return pool.run(command, timeout, max_output_size)
+    return _run(command, timeout, max_output_size)
+
+
+def _run(command, timeout, max_output_size):
+    """
+    Runs command and returns its (stdout, stderr) as native strings
+
+    Output is read as soon as pipes become readable, so there is no delay
+    between command completion and return
+    """
+    arguments, shell = command, True
+    if not SHELL_SYNTAX.search(command):
+        split_command = shlex.split(command)
+        if split_command and _is_executable(split_command[0]):
+            arguments, shell = split_command, False
+    new_session = (dict(start_new_session=True) if PY3
+                   else dict(preexec_fn=os.setsid))
+    deadline = monotonic() + timeout if timeout else None
+
+    try:
+        process = Popen(arguments, stdout=PIPE, stderr=PIPE, shell=shell,
+                        close_fds=True, **new_session)
+    except OSError as e:
+        raise OperatingSystemError("Unable to run '{0}': {1}".format(command,
+                                                                     e))
+    try:
+        outputs = _read_outputs(process, command, timeout, deadline,
+                                max_output_size)
+        _wait(process, command, timeout, deadline)
+    except OperatingSystemError:
+        _kill_session(process)
+        raise
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+
+    outputs = [b''.join(output) for output in outputs]
+    if PY3:
+        encoding = locale.getpreferredencoding(False)
+        outputs = [output.decode(encoding, 'replace') for output in outputs]
+    return tuple(output.replace('\r\n', '\n') for output in outputs)
+
+
+def _is_executable(name):
+    """
+    Checks if name is a path to an executable or an executable in PATH,
+    commands that are not, such as shell builtins, should be run with shell
+    """
+    if os.sep in name:
+        candidates = [name]
+    else:
+        candidates = [os.path.join(directory, name) for directory in
+                      os.environ.get('PATH', os.defpath).split(os.pathsep)]
+    return any(os.path.isfile(candidate) and os.access(candidate, os.X_OK)
+               for candidate in candidates)
+
+
+def _read_outputs(process, command, timeout, deadline, max_output_size):
+    outputs = {process.stdout.fileno(): list(),
+               process.stderr.fileno(): list()}
+    poller = select.poll()
+    for fd in outputs:
+        poller.register(fd, select.POLLIN)
+
+    output_size = 0
+    open_fds = set(outputs)
+    while open_fds:
+        poll_timeout = None
+        if deadline is not None:
+            poll_timeout = (deadline - monotonic()) * 1000
+            if poll_timeout <= 0:
+                raise OperatingSystemError(
+                    "{0} have not completed in {1} seconds".format(command,
+                                                                  timeout))
+        try:
+            events = poller.poll(poll_timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+
+        for fd, _ in events:
+            chunk = os.read(fd, SH_READ_SIZE)
+            if not chunk:
+                poller.unregister(fd)
+                open_fds.discard(fd)
+                continue
+            output_size += len(chunk)
+            if max_output_size and output_size > max_output_size:
+                raise OperatingSystemError(
+                    "{0} has written more than {1} bytes".format(
+                        command, max_output_size))
+            outputs[fd].append(chunk)
+
+    return (outputs[process.stdout.fileno()],
+            outputs[process.stderr.fileno()])
+
+
+def _wait(process, command, timeout, deadline):
+    """
+    Waits for process that has already closed its output
+    """
+    if deadline is None:
+        process.wait()
+        return
+    if TimeoutExpired is None:  # python < 3.3 has no timeout for wait
+        while process.poll() is None and monotonic() < deadline:
+            time.sleep(max(min(deadline - monotonic(), SH_WAIT_STEP), 0))
+        if process.returncode is not None:
+            return
+    else:
+        try:
+            process.wait(max(deadline - monotonic(), 0))
+            return
+        except TimeoutExpired:
+            pass
+    raise OperatingSystemError(
+        "{0} have not completed in {1} seconds".format(command, timeout))
+
+
+def _kill_session(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass  # process and its children have already exited
+    process.wait()
+
+
 def tcp_communication(port, host='localhost', requests=list(),
                       receive_first=False, timeout=1.0):
     """
@@ -247,3 +773,157 @@ def exception_guard(function, exception_class=Exception, sentinel=0):
             return sentinel
 
     return wrapper
+
+
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = threading.Lock()
+_task_numbers = count(1)
+_worker_slot = None
+
+
+def _process_pool_context():
+    """
+    Returns multiprocessing context of the process pool, on python 3 workers
+    are forked by a fork server, so that workers that replace killed ones are
+    not forked from the threaded agent
+    """
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return multiprocessing
+    return get_context('forkserver')
+
+
+def start_process_pool(processes, initializer=None, initargs=()):
+    """
+    Pre-forks worker processes that will run functions wrapped with
+    in_process_pool
+
+    Should be called once before any threads are started, the pool can not
+    be resized without restarting the agent
+
+    :param initializer: is called once in every worker with initargs, it
+        should import modules containing wrapped functions
+    """
+    global _process_pool, _process_pool_workers
+    context = _process_pool_context()
+    # pairs of worker pid and number of the task it runs
+    _process_pool_workers = context.Array('l', 2 * processes)
+    _process_pool = context.Pool(processes, _init_worker,
+                                 (_process_pool_workers, initializer,
+                                  initargs))
+
+
+def stop_process_pool():
+    """
+    Terminates worker processes started with start_process_pool, wrapped
+    functions will be called in calling thread from now on
+    """
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+
+
+def _init_worker(workers, initializer, initargs):
+    """
+    Takes a slot of an exited worker in workers, so that tasks run by this
+    worker can be found by the agent
+    """
+    global _process_pool_workers, _worker_slot
+    _process_pool_workers = workers
+    with workers.get_lock():
+        for slot in range(0, len(workers), 2):
+            if not _is_running(workers[slot]):
+                workers[slot], workers[slot + 1] = os.getpid(), 0
+                _worker_slot = slot
+                break
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _is_running(pid):
+    if pid == 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def _call_in_worker(task, function, args, max_result_size):
+    workers, slot = _process_pool_workers, _worker_slot
+    if slot is not None:
+        workers[slot + 1] = task
+    try:
+        return _call_with_result_limit(function, args, max_result_size)
+    finally:
+        if slot is not None:
+            workers[slot + 1] = 0
+
+
+def _kill_worker_running(workers, task):
+    """
+    Kills worker that runs task, the pool replaces it with a new worker,
+    calls running in other workers are not affected
+    """
+    with workers.get_lock():
+        for slot in range(0, len(workers), 2):
+            if workers[slot + 1] == task:
+                LOG.warning("Worker {0} is killed after a timed out "
+                            "call".format(workers[slot]))
+                os.kill(workers[slot], signal.SIGKILL)
+                workers[slot + 1] = 0
+                return
+
+
+def in_process_pool(function, timeout=10.0, max_result_size=65536):
+    """
+    Returns a wrapper over function that calls function in a worker process
+    started by start_process_pool, so that CPU-heavy functions do not hold
+    the GIL of the agent process
+
+    Function and its arguments are pickled, so function should be defined at
+    module level. If pool is not started function is called in calling
+    thread.
+
+    :param timeout: if function does not complete in timeout seconds
+        OperatingSystemError will be raised and the worker running it will be
+        replaced with a new one, so that busy worker does not reduce pool size
+    :param max_result_size: if result converted to string is longer
+        OperatingSystemError will be raised instead of returning it
+
+    :raises: OperatingSystemError if function does not complete until
+        timeout or returns result that is too large
+    """
+
+    def wrapper(*args):
+        pool, workers = _process_pool, _process_pool_workers
+        if pool is None:
+            return _call_with_result_limit(function, args, max_result_size)
+
+        task = next(_task_numbers)
+        async_result = pool.apply_async(_call_in_worker,
+                                        (task, function, args,
+                                         max_result_size))
+        try:
+            return async_result.get(timeout)
+        except multiprocessing.TimeoutError:
+            _kill_worker_running(workers, task)
+            raise OperatingSystemError(
+                "{0}{1} have not completed in {2} seconds".format(
+                    function.__name__, args, timeout))
+
+    return wrapper
+
+
+def _call_with_result_limit(function, args, max_result_size):
+    result = function(*args)
+    if len(str(result)) > max_result_size:
+        raise OperatingSystemError(
+            "{0}{1} result is longer than {2}".format(function.__name__, args,
+                                                      max_result_size))
+    return result
@@ -3,6 +3,38 @@ import os
 listen_host = '0.0.0.0'
 listen_port = 10052
 
+# History kept by collectors for avg1/avg5/avg15 items as a list of
+# (resolution, depth) pairs in seconds, ordered from the finest resolution.
+# Changes are applied on restart only.
+# collector_history = {
+#     'cpu_times': [(1, 60), (5, 900)],
+#     'disk_device_stats': [(1, 60), (5, 900)],
+#     'net_counters': [(1, 60), (5, 900)],
+#     'process_cpu_times': [(5, 900)],
+# }
+
+# Directory where zabby keeps state between restarts, such as collector
+# history and log file positions. Nothing is kept if it is not set.
+# state_dir = '/var/lib/zabby'
+
+# Number of worker processes for items wrapped with
+# zabby.core.utils.in_process_pool, such items are run in calling thread if
+# it is 0. Changes take effect after restart, not on SIGHUP
+process_pool_size = 2
+
+# Number of seconds during which data read from the operating system, such as
+# /proc/stat or the process list, is shared by all items. Only concurrent
+# requests share data if it is 0
+coalescing_ttl = 0.5
+
+# Number of helper processes that run commands of items created with
+# zabby.core.utils.sh, commands are started by the agent itself if it is 0
+helper_pool_size = 0
+
+# Number of threads that read /proc/{pid} files for process items on hosts
+# with many processes, the process list is read by calling thread if it is 0
+process_walker_workers = 0
+
 _config_dir = os.path.dirname(os.path.abspath(__file__))
 
 _item_dir = os.path.join(_config_dir, 'items')
@@ -1,4 +1,5 @@
 from zabby import __version__
+from zabby.core.utils import in_process_pool
 
 from zabby.items import vfs, net, proc, vm, system, kernel
 
@@ -8,21 +9,35 @@ items = {
 
     'vfs.fs.size': vfs.fs.size,
     'vfs.fs.inode': vfs.fs.inode,
+    'vfs.fs.discovery': vfs.fs.discovery,
 
     'net.if.in': net.interface.incoming,
     'net.if.out': net.interface.outgoing,
+    'net.if.discovery': net.interface.discovery,
 
     'net.tcp.service': net.tcp.service,
+    'net.tcp.service.perf': net.tcp.service_perf,
+    'net.tcp.listen': net.tcp.listen,
+    'net.tcp.count': net.tcp.count,
+    'net.udp.listen': net.udp.listen,
+    'net.snmp': net.snmp.counter,
+    'net.snmp.rate': net.snmp.rate,
+    'net.sockstat': net.snmp.sockstat,
 
     'proc.num': proc.num,
+    'proc.mem': proc.mem,
+    'proc.cpu.util': proc.cpu_util,
+    'proc.user.discovery': proc.user_discovery,
 
     'vm.memory.size': vm.memory.size,
 
     'vfs.dev.read': vfs.dev.read,
     'vfs.dev.write': vfs.dev.write,
+    'vfs.dev.discovery': vfs.dev.discovery,
 
     'system.cpu.util': system.cpu.util,
     'system.cpu.load': system.cpu.load,
+    'system.cpu.discovery': system.cpu.discovery,
 
     'system.hostname': system.hostname,
     'system.uname': system.uname,
@@ -34,5 +49,14 @@ items = {
 
     'kernel.maxproc': kernel.maxproc,
 
-    'vfs.file.md5sum': vfs.file.md5sum,
+    'vfs.file.md5sum': in_process_pool(vfs.file.md5sum),
+    'vfs.file.digest': in_process_pool(vfs.file.digest),
+    'vfs.file.size': vfs.file.size,
+    'vfs.file.exists': vfs.file.exists,
+    'vfs.file.time': vfs.file.time,
+    'vfs.file.regmatch': vfs.file.regmatch,
+    'vfs.file.regexp': vfs.file.regexp,
+
+    'log': vfs.log.lines,
+    'log.count': vfs.log.count,
 }
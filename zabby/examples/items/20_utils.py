@@ -1,6 +1,12 @@
 # from zabby.core.six import b
 # from zabby.core.exceptions import OperatingSystemError
-# from zabby.core.utils import sh, exception_guard, tcp_communication
+# from zabby.core.utils import (sh, sh_field, exception_guard,
+#                               tcp_communication)
+# from zabby.items.net import tcp
+
+# keep connections of net.tcp.service[redis] and [memcached] open between
+# checks
+# tcp.engine.pool_connections = True
 
 
 # def redis_ping():
@@ -13,5 +19,8 @@ items = {
     # 'cat': sh('cat {0}'),
     # 'sleep': exception_guard(sh('sleep 1; echo 1', timeout=0.5),
     #                          OperatingSystemError, 0),
-    # 'redis.ping': exception_guard(redis_ping, IOError, 0)
+    # 'redis.ping': exception_guard(redis_ping, IOError, 0),
+    # every mysql.status[field] shares one run of mysqladmin for 30 seconds
+    # 'mysql.status': sh_field('mysqladmin status', cache_ttl=30,
+    #                          stale_ttl=30),
 }
@@ -1,9 +1,15 @@
 from collections import namedtuple
+from contextlib import contextmanager
+import functools
 import sys
-import threading
 import logging
+import threading
+import types
 
-from zabby.core.utils import AVERAGE_MODE
+from zabby.core.utils import AVERAGE_MODE, monotonic
+from zabby.hostos.collectors import (CollectorScheduler, CollectorStateSaver,
+                                     NetCounter, ProcessCpuTimes,
+                                     load_collector_state)
 
 LOG = logging.getLogger(__name__)
 
@@ -40,10 +46,43 @@ NetworkInterfaceInfo = namedtuple(
     NETWORK_INTERFACE_INFO_FIELDS
 )
 
-ProcessInfo = namedtuple(
-    'ProcessInfo',
-    ['name', 'uid', 'state', 'command_line', 'used_memory', ]
-)
+
+class ProcessInfo(object):
+    """
+    Information about a process
+
+    Hosts may have tens of thousands of processes, so records have no
+    per-instance dict
+    """
+    __slots__ = ('name', 'uid', 'state', 'command_line', 'used_memory',
+                 'pid', )
+
+    def __init__(self, name, uid, state, command_line, used_memory, pid):
+        self.name = name
+        self.uid = uid
+        self.state = state
+        self.command_line = command_line
+        self.used_memory = used_memory
+        self.pid = pid
+
+    def _values(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return (isinstance(other, ProcessInfo) and
+                self._values() == other._values())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return 'ProcessInfo({0})'.format(', '.join(
+            '{0}={1!r}'.format(field, getattr(self, field))
+            for field in self.__slots__))
+
 
 DISK_DEVICE_STATS_FIELDS = [
     'read_sectors', 'read_operations', 'read_bytes',
@@ -59,6 +98,97 @@ SystemLoad = namedtuple('SystemLoad', list(AVERAGE_MODE.keys()))
 
 SwapInfo = namedtuple('SwapInfo', ['read', 'write', ])
 
+MountInfo = namedtuple('MountInfo', ['mount_point', 'fstype', 'source', ])
+
+TCP_STATES = [
+    'established', 'syn_sent', 'syn_recv', 'fin_wait1', 'fin_wait2',
+    'time_wait', 'close', 'close_wait', 'last_ack', 'listen', 'closing',
+    'new_syn_recv',
+]
+
+
+class _Read(object):
+    """
+    Result of a read that is in progress, shared with concurrent callers
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.completed = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def batched(method):
+    """
+    Decorates HostOS method that reads operating system data, so that
+    concurrent callers with the same arguments share one read
+
+    Results are also shared by callers inside HostOS.batch of the same thread
+    and by all callers for coalescing_ttl seconds if it is set. Results that
+    are generators are stored as tuples. HostOS.last_read_time tells when
+    the result returned to calling thread was read
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (name, args)
+        started = monotonic()
+        batch_results = getattr(self._batch, 'results', None)
+        with self._coalescing_lock:
+            reads = self._reads.setdefault(name, [0, 0])
+            shared = None
+            if batch_results is not None and key in batch_results:
+                shared = batch_results[key]
+            else:
+                recent = self._recent_results.get(key)
+                if (recent is not None and
+                        started - recent[0] < self._coalescing_ttl):
+                    shared = recent
+            if shared is not None:
+                reads[1] += 1
+                self._last_read.time = shared[0]
+                return shared[1]
+            read = self._reads_in_progress.get(key)
+            in_progress = read is not None
+            if in_progress:
+                reads[1] += 1
+            else:
+                read = self._reads_in_progress[key] = _Read(started)
+
+        if in_progress:
+            read.completed.wait()
+            if read.error is not None:
+                raise read.error
+            if batch_results is not None:
+                batch_results[key] = (read.started, read.result)
+            self._last_read.time = read.started
+            return read.result
+
+        try:
+            result = method(self, *args)
+            if isinstance(result, types.GeneratorType):
+                result = tuple(result)
+            read.result = result
+        except Exception as e:
+            read.error = e
+            raise
+        finally:
+            with self._coalescing_lock:
+                del self._reads_in_progress[key]
+                reads[0] += 1
+                if read.error is None:
+                    if batch_results is not None:
+                        batch_results[key] = (started, read.result)
+                    if self._coalescing_ttl:
+                        self._remember_recent(key, started, read.result)
+            read.completed.set()
+        self._last_read.time = started
+        return result
+
+    return wrapper
+
 
 class HostOS(object):
     """
@@ -69,31 +199,167 @@ class HostOS(object):
     methods
     """
 
+    AVAILABLE_MEMORY_TYPES = set()
+    AVAILABLE_PROCESS_MEMORY_TYPES = set()
+    AVAILABLE_DISK_DEVICE_STATS_TYPES = set()
+    AVAILABLE_HOSTNAME_TYPES = set(['host'])
+
+    COLLECTOR_STATE_SAVE_INTERVAL = 300
+    COLLECTOR_STATE_MAX_AGE = 900
+
     def __init__(self):
         self._collectors = list()
+        self._added_collectors = list()
+        self._scheduled_collectors = list()
+        self._collector_scheduler = None
+        self._collector_state_file = None
 
-    def start_collectors(self):
-        for collector in self._collectors:
-            threading.Thread(target=collector.run).start()
+        self._coalescing_lock = threading.Lock()
+        self._coalescing_ttl = 0
+        self._reads = dict()
+        self._reads_in_progress = dict()
+        self._recent_results = dict()
+        self._recent_results_pruned_at = 0
+        self._batch = threading.local()
+        self._last_read = threading.local()
 
-    def stop_collectors(self):
+        self._process_walker_workers = 0
+
+    @contextmanager
+    def batch(self, results=None):
+        """
+        Context manager, inside of which methods decorated with batched read
+        operating system data only once, it yields results of the batch
+
+        Batches belong to the thread that entered them and may be nested,
+        results are forgotten when the outermost batch exits
+
+        :param results: results yielded by a batch of another thread, worker
+            threads started inside that batch share it by passing them
+        """
+        outermost = getattr(self._batch, 'results', None) is None
+        if outermost:
+            self._batch.results = results if results is not None else dict()
+        try:
+            yield self._batch.results
+        finally:
+            if outermost:
+                self._batch.results = None
+
+    def last_read_time(self):
+        """
+        Returns monotonic time at which result of the last method decorated
+        with batched called by current thread was read, which may be earlier
+        than the call if result was shared
+
+        Rates should be computed against this time rather than the time of
+        the call
+        """
+        read_time = getattr(self._last_read, 'time', None)
+        return read_time if read_time is not None else monotonic()
+
+    def _remember_recent(self, key, started, result):
+        """
+        Should be called with coalescing lock held, expired results are
+        pruned at most once per coalescing_ttl
+        """
+        if started - self._recent_results_pruned_at >= self._coalescing_ttl:
+            for recent_key, recent in list(self._recent_results.items()):
+                if started - recent[0] >= self._coalescing_ttl:
+                    del self._recent_results[recent_key]
+            self._recent_results_pruned_at = started
+        self._recent_results[key] = (started, result)
+
+    def set_coalescing_ttl(self, ttl):
+        """
+        Results of methods decorated with batched will be shared by all
+        callers for ttl seconds, results are shared only by concurrent
+        callers if ttl is 0
+        """
+        with self._coalescing_lock:
+            self._coalescing_ttl = ttl
+            self._recent_results.clear()
+
+    def set_process_walker_workers(self, workers):
+        """
+        Process information will be read by up to workers threads, it is read
+        by calling thread if workers is less than 2
+        """
+        self._process_walker_workers = workers
+
+    def read_stats(self):
+        """
+        Returns a dict that maps names of methods decorated with batched to
+        (number of reads, number of calls that were answered without reading)
+        """
+        with self._coalescing_lock:
+            return dict((name, tuple(reads))
+                        for name, reads in self._reads.items())
+
+    def configure_collectors(self, history_resolutions):
+        """
+        Sets history resolutions of collectors, should be called before
+        collectors are started
+
+        :param history_resolutions: dict mapping collector name to a list of
+            (resolution, depth) pairs, collectors that are not mentioned keep
+            their defaults
+        :raises: ConfigurationError if resolutions are not valid
+        """
         for collector in self._collectors:
-            collector.stop()
+            if collector.name in history_resolutions:
+                collector.set_history_resolutions(
+                    history_resolutions[collector.name])
 
-    AVAILABLE_MEMORY_TYPES = set()
-    AVAILABLE_DISK_DEVICE_STATS_TYPES = set()
-    AVAILABLE_HOSTNAME_TYPES = set(['host'])
+    def persist_collectors(self, state_file):
+        """
+        Restores history of collectors from state_file if it is still fresh,
+        history will be saved to state_file periodically and when collectors
+        are stopped
 
-    def __init__(self):
-        self._collectors = list()
+        Should be called before collectors are started
+        """
+        self._collector_state_file = state_file
+        load_collector_state(self._collectors, state_file,
+                             self.COLLECTOR_STATE_MAX_AGE, self.boot_id())
+
+    def add_collector(self, collector):
+        """
+        Adds collector that is not a part of host os, such as a saver of
+        state of items, to be run with host os collectors
+
+        Should be called before collectors are started
+        """
+        self._added_collectors.append(collector)
 
     def start_collectors(self):
-        for collector in self._collectors:
-            threading.Thread(target=collector.run).start()
+        """
+        Starts running every collector from a single scheduler thread
+        """
+        collectors = list(self._collectors)
+        if self._collector_state_file is not None:
+            collectors.append(CollectorStateSaver(
+                self.COLLECTOR_STATE_SAVE_INTERVAL, self._collectors,
+                self._collector_state_file, self.boot_id()))
+        collectors.extend(self._added_collectors)
+
+        self._scheduled_collectors = collectors
+        self._collector_scheduler = CollectorScheduler(collectors)
+        self._collector_scheduler.start()
 
     def stop_collectors(self):
-        for collector in self._collectors:
-            collector.stop()
+        """
+        Stops collectors started by start_collectors and waits for them to
+        finish, then lets every collector save its state, so history is saved
+        if persist_collectors was called
+        """
+        if self._collector_scheduler is not None:
+            self._collector_scheduler.stop()
+            self._collector_scheduler = None
+
+            for collector in self._scheduled_collectors:
+                collector.stop()
+            self._scheduled_collectors = list()
 
     def fs_size(self, filesystem):
         """
@@ -115,6 +381,15 @@ class HostOS(object):
         """
         raise NotImplementedError
 
+    def mounts(self):
+        """
+        Returns a tuple of MountInfo for every mounted filesystem in order of
+        mounting
+
+        The same tuple is returned while mount table does not change
+        """
+        raise NotImplementedError
+
     def net_interface_names(self):
         """
         Returns a set that contains all interface names available on this host
@@ -130,18 +405,113 @@ class HostOS(object):
         """
         raise NotImplementedError
 
+    def listening_ports(self, protocol):
+        """
+        Returns a frozenset of local ports that have listening sockets
+
+        :param protocol: tcp or udp
+        """
+        raise NotImplementedError
+
+    def socket_states(self, protocol):
+        """
+        Returns a dict mapping one of TCP_STATES to the number of sockets of
+        protocol in that state, states without sockets may be missing
+        """
+        raise NotImplementedError
+
+    def net_counters(self):
+        """
+        Returns a dict mapping group of network statistics, such as Tcp, to
+        a dict mapping counter name to its value
+        """
+        raise NotImplementedError
+
+    def net_counter_shifted(self, group, counter, shift, now):
+        """
+        Returns (NetCounter, timestamp) for counter of group shifted for
+        shift seconds from now or (None, None) if nothing was collected yet
+
+        :param now: should be obtained from zabby.core.utils.monotonic
+        """
+        raise NotImplementedError
+
+    def socket_stats(self):
+        """
+        Returns a dict mapping socket group, such as TCP, to a dict mapping
+        field name, such as inuse, to its value
+        """
+        raise NotImplementedError
+
     def process_infos(self):
         """
         Returns an iterable of ProcessInfo
         """
         raise NotImplementedError
 
+    def process_summaries(self, uid=None):
+        """
+        Returns iterable of (name, state) of userspace processes, only of
+        processes owned by uid if it is not None
+
+        Should be cheaper than process_infos
+        """
+        raise NotImplementedError
+
+    def process_cpu_summaries(self, uid=None):
+        """
+        Returns iterable of (pid, name, ProcessCpuTimes) of userspace
+        processes, only of processes owned by uid if it is not None
+
+        Should be cheaper than process_infos followed by process_cpu_times
+        """
+        raise NotImplementedError
+
+    def process_memory(self, pid, memory_type):
+        """
+        Returns memory used by process in bytes
+
+        :param memory_type: one of AVAILABLE_PROCESS_MEMORY_TYPES
+        """
+        raise NotImplementedError
+
+    def process_cpu_times(self, pid):
+        """
+        Returns ProcessCpuTimes of process in milliseconds
+        """
+        raise NotImplementedError
+
+    def process_cpu_times_shifted(self, name, uid, cmdline, shift, now):
+        """
+        Returns (ProcessCpuTimes, timestamp) accumulated by processes
+        matching filter shifted for shift seconds from now or (None, None) if
+        nothing was collected yet
+
+        :param now: should be obtained from zabby.core.utils.monotonic
+        """
+        raise NotImplementedError
+
     def uid(self, username):
         """
         Returns UID compatible with ProcessInfo.uid
         """
         raise NotImplementedError
 
+    def username(self, uid):
+        """
+        Returns name of user with uid
+
+        :raises: OperatingSystemError if there is no such user
+        """
+        raise NotImplementedError
+
+    def process_owners(self):
+        """
+        Returns a set of UIDs that own processes, compatible with uid argument
+        of process_summaries
+        """
+        raise NotImplementedError
+
     def memory(self):
         """
         Returns a dict containing information about memory usage
@@ -168,6 +538,8 @@ class HostOS(object):
         """
         Returns DiskDeviceStats for device shifted for shift seconds from now
         and timestamp for when this stats were taken
+
+        now and returned timestamp are taken from zabby.core.utils.monotonic
         """
         raise NotImplementedError
 
@@ -185,8 +557,7 @@ class HostOS(object):
 
     def cpu_times_shifted(self, cpu_id, shift):
         """
-        Returns CpuTimes for cpu shifted for shift second from latest collected
-        CpuTimes
+        Returns CpuTimes for cpu shifted for shift seconds from now
         """
         raise NotImplementedError
 
@@ -210,6 +581,13 @@ class HostOS(object):
         """
         raise NotImplementedError
 
+    def boot_id(self):
+        """
+        Returns string that changes every time the host boots or None if it
+        is unknown
+        """
+        return None
+
     def max_number_of_running_processes(self):
         """
         Returns maximum number of running processes
@@ -1,93 +1,719 @@
-from collections import defaultdict, deque
+from __future__ import division
+from collections import deque, namedtuple
+import heapq
 import logging
-from time import time, sleep
+from math import ceil
+import os
+import re
+import struct
+import threading
+
+from zabby.core.exceptions import ConfigurationError
+from zabby.core.six import integer_types
+from zabby.core.utils import monotonic
 
 LOG = logging.getLogger(__name__)
 
+NetCounter = namedtuple('NetCounter', ['value', ])
+ProcessCpuTimes = namedtuple('ProcessCpuTimes', ['user', 'system', ])
+
 
 class Collector(object):
     """
-    Collector continuously runs in the background and collects information
-    (usually from host_os) for later aggregation
+    Collector is periodically run in the background by CollectorScheduler and
+    collects information (usually from host_os) for later aggregation
+
+    Collectors are identified by name in configuration
     """
+    name = None
+
     def __init__(self, interval):
-        self._running = False
         self._interval = interval
+        self.skipped_ticks = 0
+
+    @property
+    def interval(self):
+        return self._interval
 
     def _collect(self):
         raise NotImplementedError
 
-    def run(self):
-        self._running = True
-        while self._running:
+    def stop(self):
+        """
+        Is called once after the scheduler running collector was stopped
+        """
+        pass
+
+    def tick(self):
+        """
+        Collects information once
+
+        Exceptions are logged and swallowed so that a single failing collector
+        does not stop other collectors run by the same scheduler
+        """
+        try:
             self._collect()
-            sleep(self._interval)
+        except Exception as e:
+            LOG.exception(
+                "{0} failed to collect: {1}".format(self.__class__.__name__,
+                                                    e))
+
+
+class CollectorScheduler(object):
+    """
+    Runs collectors from a single thread
+
+    Deadlines are kept on a monotonic clock and the next deadline of a
+    collector is calculated from its previous deadline rather than from the
+    moment collection finished, so time spent collecting does not accumulate
+    as drift. If a deadline was missed by more than an interval, missed ticks
+    are skipped and accounted for in collector.skipped_ticks.
+    """
+
+    def __init__(self, collectors):
+        self._collectors = list(collectors)
+        self._queue = list()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        now = monotonic()
+        self._queue = [(now, index, collector)
+                       for index, collector in enumerate(self._collectors)]
+        heapq.heapify(self._queue)
+        self._stopped.clear()
+
+        self._thread = threading.Thread(target=self.run,
+                                        name='collector-scheduler')
+        self._thread.start()
+
+    def run(self):
+        while not self._stopped.is_set():
+            delay = self.run_pending(monotonic())
+            self._stopped.wait(delay)
+
+    def run_pending(self, now):
+        """
+        Ticks every collector whose deadline is not later than now
+
+        :returns: seconds until the next deadline or None if there are no
+            collectors to run
+        """
+        while self._queue and self._queue[0][0] <= now:
+            deadline, index, collector = heapq.heappop(self._queue)
+
+            missed_ticks = int((now - deadline) // collector.interval)
+            if missed_ticks > 0:
+                collector.skipped_ticks += missed_ticks
+                deadline += missed_ticks * collector.interval
+
+            collector.tick()
+
+            heapq.heappush(self._queue,
+                           (deadline + collector.interval, index, collector))
+
+        if not self._queue:
+            return None
+        return self._queue[0][0] - now
 
     def stop(self):
-        self._running = False
+        """
+        Stops scheduling and waits for a collector that is being run to finish
+        """
+        self._stopped.set()
+        if (self._thread is not None and
+                self._thread is not threading.current_thread()):
+            self._thread.join()
+        self._thread = None
+
+
+DEFAULT_HISTORY_RESOLUTIONS = [(1, 60), (5, 900)]
+# sampling every process is more expensive than reading system counters
+PROCESS_HISTORY_RESOLUTIONS = [(5, 900)]
 
 
-class DiskDeviceStatsCollector(Collector):
+def validate_history_resolutions(resolutions):
     """
-    Collects disk device stats
+    Checks that resolutions is a non empty list of (resolution, depth) pairs
+    of positive numbers ordered from the finest to the coarsest resolution
 
-    :depends on: [host_os.disk_device_names, host_os.disk_device_stats]
+    :raises: ConfigurationError if resolutions are not valid
     """
+    try:
+        valid = len(resolutions) > 0
+        previous_resolution = 0
+        for resolution, depth in resolutions:
+            # python 2 compares numbers with strings without raising
+            valid = (valid and
+                     isinstance(resolution, integer_types + (float, )) and
+                     isinstance(depth, integer_types + (float, )) and
+                     previous_resolution < resolution <= depth)
+            previous_resolution = resolution
+    except (TypeError, ValueError):
+        valid = False
 
-    def __init__(self, max_shift, host_os):
-        super(DiskDeviceStatsCollector, self).__init__(1)
-        self._host_os = host_os
-        self._history = defaultdict(lambda: deque(maxlen=max_shift + 1))
+    if not valid:
+        raise ConfigurationError(
+            "History resolutions should be a list of (resolution, depth) "
+            "pairs ordered by resolution, got {0}".format(resolutions))
+
+
+class History(object):
+    """
+    Timestamped history of values kept with decreasing resolution
+
+    History consists of tiers described by (resolution, depth) pairs in
+    seconds, [(1, 60), (5, 900)] keeps a value per second for the last minute
+    and a value per 5 seconds for the last 15 minutes. Values are downsampled
+    on insert: a tier keeps a value only if its newest value is about
+    resolution seconds old.
+    """
+    RESOLUTION_TOLERANCE = 0.1
+
+    def __init__(self, resolutions):
+        self._tiers = [
+            (resolution * (1 - self.RESOLUTION_TOLERANCE),
+             deque(maxlen=int(ceil(depth / resolution)) + 1))
+            for resolution, depth in resolutions
+        ]
+
+    def __len__(self):
+        return sum(len(values) for _, values in self._tiers)
+
+    def items(self):
+        """
+        Returns (value, timestamp) pairs from every tier ordered from oldest
+        to newest
+        """
+        items = dict()
+        for _, values in self._tiers:
+            for value, timestamp in values:
+                items[timestamp] = value
+        return [(items[timestamp], timestamp)
+                for timestamp in sorted(items.keys())]
+
+    def append(self, value, timestamp):
+        for min_distance, values in self._tiers:
+            if not values or timestamp - values[0][1] >= min_distance:
+                values.appendleft((value, timestamp))
+
+    def find_shifted(self, now, shift):
+        """
+        Returns the newest (value, timestamp) pair that is at least shift
+        seconds older than now, using the finest tier that goes back far
+        enough, or the oldest pair if there is no such pair
+        """
+        oldest = (None, None)
+        for _, values in self._tiers:
+            if not values:
+                continue
+            candidate = _find_shifted(values, now, shift)
+            if now - candidate[1] >= shift:
+                return candidate
+            if oldest[1] is None or candidate[1] < oldest[1]:
+                oldest = candidate
+        return oldest
+
+
+class HistoryCollector(Collector):
+    """
+    Keeps timestamped history of values for keys that were requested
+
+    A key is sampled only after it was requested for the first time and stops
+    being sampled, with its history dropped, after idle_timeout seconds
+    without requests, so hosts that never ask for a key never pay for it
+
+    Collector is run with the finest history resolution as an interval
+    """
+    DEFAULT_IDLE_TIMEOUT = 3600
+
+    def __init__(self, resolutions, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        super(HistoryCollector, self).__init__(resolutions[0][0])
+        self._resolutions = resolutions
+        self._idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._last_requested = dict()
+        self._history = dict()
+
+    def set_history_resolutions(self, resolutions):
+        """
+        Changes history resolutions, history collected so far is dropped
+
+        Should be called before collector is scheduled, since scheduler reads
+        interval only once
+
+        :raises: ConfigurationError if resolutions are not valid
+        """
+        validate_history_resolutions(resolutions)
+        with self._lock:
+            self._resolutions = resolutions
+            self._interval = resolutions[0][0]
+            self._history = dict()
+
+    def _sample(self, key):
+        """
+        Returns current value for key
+
+        :raises: KeyError or IndexError if key is no longer present on host
+        """
+        raise NotImplementedError
+
+    def _sample_time(self):
+        """
+        Returns monotonic time at which value returned by _sample was read
+        """
+        return monotonic()
+
+    def requested_keys(self):
+        with self._lock:
+            return set(self._last_requested.keys())
 
     def _collect(self):
-        devices = self._host_os.disk_device_names()
+        now = monotonic()
+        with self._lock:
+            for key, last_requested in list(self._last_requested.items()):
+                if now - last_requested > self._idle_timeout:
+                    LOG.debug("{0} is idle, no longer collecting {1}".format(
+                        self.__class__.__name__, key))
+                    del self._last_requested[key]
+                    self._history.pop(key, None)
+            keys = list(self._last_requested.keys())
+
+        for key in keys:
+            try:
+                value = self._sample(key)
+            except (KeyError, IndexError):
+                continue
+            timestamp = self._sample_time()
+
+            with self._lock:
+                if key not in self._last_requested:
+                    continue
+                if key not in self._history:
+                    self._history[key] = History(self._resolutions)
+                self._history[key].append(value, timestamp)
+
+    def snapshot(self):
+        """
+        Returns a dict mapping every collected key to a list of
+        (value, timestamp) pairs ordered from oldest to newest
+        """
+        with self._lock:
+            return dict((key, history.items())
+                        for key, history in self._history.items())
+
+    def restore(self, snapshot):
+        """
+        Replaces history with the one returned by snapshot
+
+        Keys that are no longer present on host, keys whose counters are
+        smaller than restored ones (host was rebooted or counters overflowed)
+        and keys whose samples have different number of fields (state was
+        written by another version) are skipped. Restored keys are collected
+        as if they were just requested.
+        """
+        now = monotonic()
+        restored = dict()
+        for key, items in snapshot.items():
+            try:
+                current = self._sample(key)
+            except (KeyError, IndexError):
+                continue
+
+            if any(len(value) != len(current) for value, _ in items):
+                continue
+            values = [current.__class__(*value) for value, _ in items]
+            if not values or any(previous > present
+                                 for previous, present
+                                 in zip(values[-1], current)):
+                continue
+
+            history = History(self._resolutions)
+            for value, (_, timestamp) in zip(values, items):
+                history.append(value, timestamp)
+            restored[key] = history
+
+        with self._lock:
+            self._history.update(restored)
+            for key in restored:
+                self._last_requested[key] = now
+
+    def _get_shifted(self, key, shift, now):
+        """
+        Registers demand for key and returns (value, timestamp) shifted for
+        shift seconds from now or (None, None) if nothing was collected yet
+        """
+        with self._lock:
+            self._last_requested[key] = now
+            if key not in self._history:
+                return None, None
+            return self._history[key].find_shifted(now, shift)
+
+
+class DiskDeviceStatsCollector(HistoryCollector):
+    """
+    Collects disk device stats for requested devices
+
+    :depends on: [host_os.disk_device_stats, host_os.last_read_time]
+    """
+
+    name = 'disk_device_stats'
 
-        for device in devices:
-            stats = self._host_os.disk_device_stats(device)
-            timestamp = int(time())
-            self._history[device].appendleft((stats, timestamp))
+    def __init__(self, resolutions, host_os,
+                 idle_timeout=HistoryCollector.DEFAULT_IDLE_TIMEOUT):
+        super(DiskDeviceStatsCollector, self).__init__(resolutions,
+                                                       idle_timeout)
+        self._host_os = host_os
+
+    def _sample(self, device):
+        return self._host_os.disk_device_stats(device)
+
+    def _sample_time(self):
+        return self._host_os.last_read_time()
 
     def get_stats(self, device, shift, now):
         """
         Returns DiskDeviceStats for device shifted for shift seconds from now
         and timestamp for when this stats were taken
+
+        Device will be collected from now on if it was not already
+
+        :param now: should be obtained from zabby.core.utils.monotonic, as
+            are timestamps of collected stats
+        """
+        return self._get_shifted(device, shift, now)
+
+
+class CpuTimesCollector(HistoryCollector):
+    """
+    Collects cpu times for requested cpus
+
+    :depends on: [host_os.cpu_times, host_os.last_read_time]
+    """
+    name = 'cpu_times'
+
+    def __init__(self, resolutions, host_os,
+                 idle_timeout=HistoryCollector.DEFAULT_IDLE_TIMEOUT):
+        super(CpuTimesCollector, self).__init__(resolutions, idle_timeout)
+        self._host_os = host_os
+
+    def _sample(self, cpu_id):
+        return self._host_os.cpu_times(cpu_id)
+
+    def _sample_time(self):
+        return self._host_os.last_read_time()
+
+    def get_times(self, cpu_id, shift):
         """
-        stats, timestamp = self._find_shifted_stats(self._history[device], now,
-                                                    shift)
+        Returns CpuTimes for cpu shifted for shift seconds from now or None if
+        nothing was collected yet
 
-        return stats, timestamp
+        Cpu will be collected from now on if it was not already
+        """
+        cpu_times, _ = self._get_shifted(cpu_id, shift, monotonic())
 
-    def _find_shifted_stats(self, device_history, now, shift):
-        best_candidate = (None, None)
-        for diskstat, timestamp in device_history:
-            best_candidate = (diskstat, timestamp)
-            if (now - timestamp) >= shift:
-                break
-        return best_candidate
+        return cpu_times
 
 
-class CpuTimesCollector(Collector):
+class NetCountersCollector(HistoryCollector):
     """
-    Collects cpu times
+    Collects requested network statistics counters, keys are group and
+    counter names joined with a dot, such as Tcp.RetransSegs
 
-    :depends on: [host_os.cpu_count, host_os.cpu_times]
+    Counters are sampled inside host_os.batch, so all of them are read from
+    the same snapshot of statistics every tick
+
+    :depends on: [host_os.net_counters, host_os.batch,
+                  host_os.last_read_time]
     """
-    def __init__(self, max_shift, host_os):
-        super(CpuTimesCollector, self).__init__(1)
+    name = 'net_counters'
+
+    def __init__(self, resolutions, host_os,
+                 idle_timeout=HistoryCollector.DEFAULT_IDLE_TIMEOUT):
+        super(NetCountersCollector, self).__init__(resolutions, idle_timeout)
         self._host_os = host_os
-        self._history = defaultdict(lambda: deque(maxlen=max_shift + 1))
 
     def _collect(self):
-        cpu_count = self._host_os.cpu_count()
-        for cpu_id in range(cpu_count):
-            cpu_times = self._host_os.cpu_times(cpu_id)
-            self._history[cpu_id].appendleft(cpu_times)
+        with self._host_os.batch():
+            super(NetCountersCollector, self)._collect()
 
-    def get_times(self, cpu_id, shift):
-        cpu_history = self._history[cpu_id]
-        if len(cpu_history) == 0:
-            return None
+    def _sample(self, key):
+        group, counter = key.split('.', 1)
+        return NetCounter(self._host_os.net_counters()[group][counter])
+
+    def _sample_time(self):
+        return self._host_os.last_read_time()
+
+    def get_counter(self, group, counter, shift, now):
+        """
+        Returns NetCounter for counter of group shifted for shift seconds
+        from now and timestamp for when it was taken
+
+        Counter will be collected from now on if it was not already
+
+        :param now: should be obtained from zabby.core.utils.monotonic, as
+            are timestamps of collected counters
+        """
+        return self._get_shifted('{0}.{1}'.format(group, counter), shift, now)
+
+
+class ProcessCpuTimesCollector(HistoryCollector):
+    """
+    Collects cpu times accumulated by groups of processes, keys are
+    (name, uid, cmdline) filters where None matches any process
+
+    Times of a group are counted from the moment it was first requested and
+    only grow: a process contributes time it spent between two samples, so
+    processes that exit do not decrease them. Accumulated times start from
+    zero after restart, so history is neither saved nor restored.
+
+    Groups without cmdline are sampled with cheaper process_cpu_summaries,
+    so their uid is compared with owners of processes
+
+    :depends on: [host_os.process_cpu_summaries, host_os.process_infos,
+                  host_os.process_cpu_times, host_os.batch]
+    """
+    name = 'process_cpu_times'
+
+    def __init__(self, resolutions, host_os,
+                 idle_timeout=HistoryCollector.DEFAULT_IDLE_TIMEOUT):
+        super(ProcessCpuTimesCollector, self).__init__(resolutions,
+                                                       idle_timeout)
+        self._host_os = host_os
+        # accessed only by collecting thread
+        self._groups = dict()
+
+    def _collect(self):
+        with self._host_os.batch():
+            super(ProcessCpuTimesCollector, self)._collect()
+
+        requested_keys = self.requested_keys()
+        for key in list(self._groups.keys()):
+            if key not in requested_keys:
+                del self._groups[key]
+
+    def _sample(self, key):
+        name, uid, cmdline = key
+        if cmdline is None:
+            process_times = dict(
+                (pid, times) for pid, process_name, times
+                in self._host_os.process_cpu_summaries(uid)
+                if name is None or process_name == name)
+        else:
+            process_times = self._matching_process_times(name, uid, cmdline)
+
+        previous_times, (user, system) = self._groups.get(
+            key, (dict(), (0, 0)))
+        for pid, times in process_times.items():
+            previous = previous_times.get(pid)
+            if previous is not None:
+                user += max(times.user - previous.user, 0)
+                system += max(times.system - previous.system, 0)
+
+        accumulated = ProcessCpuTimes(user, system)
+        self._groups[key] = (process_times, accumulated)
+        return accumulated
+
+    def _matching_process_times(self, name, uid, cmdline):
+        pattern = re.compile(cmdline)
+        process_times = dict()
+        for process_info in self._host_os.process_infos():
+            if ((name is None or process_info.name == name) and
+                    (uid is None or process_info.uid == uid) and
+                    pattern.search(process_info.command_line)):
+                try:
+                    process_times[process_info.pid] = (
+                        self._host_os.process_cpu_times(process_info.pid))
+                except (IOError, OSError):
+                    continue  # process has exited
+        return process_times
+
+    def snapshot(self):
+        return dict()
+
+    def restore(self, snapshot):
+        pass
+
+    def get_times(self, name, uid, cmdline, shift, now):
+        """
+        Returns ProcessCpuTimes accumulated by processes matching filter
+        shifted for shift seconds from now and timestamp for when they were
+        taken
+
+        Group will be collected from now on if it was not already
+
+        :param now: should be obtained from zabby.core.utils.monotonic, as
+            are timestamps of collected times
+        """
+        return self._get_shifted((name, uid, cmdline), shift, now)
+
+
+class CollectorStateSaver(Collector):
+    """
+    Periodically saves history of collectors to a file so that it can be
+    restored with load_collector_state after restart
+    """
+    name = 'state_saver'
+
+    def __init__(self, interval, collectors, state_file, boot_id=None):
+        super(CollectorStateSaver, self).__init__(interval)
+        self._collectors = collectors
+        self._state_file = state_file
+        self._boot_id = boot_id
+
+    def _collect(self):
+        save_collector_state(self._collectors, self._state_file,
+                             self._boot_id)
+
+    def stop(self):
+        try:
+            self._collect()
+        except (IOError, OSError) as e:
+            LOG.warning("Unable to save collector state: {0}".format(e))
+
+
+STATE_MAGIC = b'ZBYC'
+STATE_VERSION = 2
+_STATE_HEADER = struct.Struct('!4sHdH')
+_COUNT = struct.Struct('!I')
+_LENGTH = struct.Struct('!H')
+_TIMESTAMP = struct.Struct('!d')
+_KEY_TYPES = {'i': int, 's': str}
+
+
+def save_collector_state(collectors, state_file, boot_id=None):
+    """
+    Saves history of every HistoryCollector from collectors to state_file
+
+    File is written in a compact binary format and is replaced atomically
+
+    :param boot_id: identifier of the current boot of the host, state is not
+        restored after boot_id changes
+    """
+    snapshots = [(collector.name, collector.snapshot())
+                 for collector in collectors
+                 if isinstance(collector, HistoryCollector)]
+
+    chunks = [_STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, monotonic(),
+                                 len(snapshots)),
+              _pack_string(boot_id or '')]
+    for name, snapshot in snapshots:
+        chunks.append(_pack_string(name))
+        chunks.append(_COUNT.pack(len(snapshot)))
+        for key, items in snapshot.items():
+            key_type = 'i' if isinstance(key, int) else 's'
+            chunks.append(_pack_string(key_type + str(key)))
+            field_count = len(items[0][0]) if items else 0
+            value_format = struct.Struct('!d{0}q'.format(field_count))
+            chunks.append(_COUNT.pack(len(items)))
+            chunks.append(_LENGTH.pack(field_count))
+            for value, timestamp in items:
+                chunks.append(value_format.pack(timestamp, *value))
+
+    temporary_file = state_file + '.tmp'
+    with open(temporary_file, 'wb') as f:
+        f.write(b''.join(chunks))
+    os.rename(temporary_file, state_file)
 
-        best_candidate = min(shift, len(cpu_history) - 1)
 
-        return cpu_history[best_candidate]
+def load_collector_state(collectors, state_file, max_age, boot_id=None):
+    """
+    Restores history of collectors from state_file written by
+    save_collector_state
+
+    State is ignored if it is missing, malformed, was written more than
+    max_age seconds ago or before the host was rebooted
+
+    :param boot_id: identifier of the current boot of the host, it is
+        compared with boot_id the state was saved with
+    :returns: True if state was restored
+    """
+    try:
+        with open(state_file, 'rb') as f:
+            data = f.read()
+        saved_at, saved_boot_id, snapshots = _unpack_state(data)
+    except (IOError, OSError, KeyError, ValueError, struct.error) as e:
+        LOG.info("Not restoring collector state from {0}: {1}".format(
+            state_file, e))
+        return False
+
+    if saved_boot_id != (boot_id or ''):
+        LOG.info("Not restoring collector state from {0}: it was saved "
+                 "before reboot".format(state_file))
+        return False
+
+    age = monotonic() - saved_at
+    if not 0 <= age <= max_age:
+        LOG.info("Not restoring collector state from {0}: it is {1:.0f} "
+                 "seconds old".format(state_file, age))
+        return False
+
+    for collector in collectors:
+        if (isinstance(collector, HistoryCollector) and
+                collector.name in snapshots):
+            collector.restore(snapshots[collector.name])
+    return True
+
+
+def _pack_string(string):
+    encoded = string.encode('utf-8')
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_state(data):
+    """
+    :raises: KeyError, ValueError or struct.error if data is malformed
+    """
+    offset = 0
+
+    def unpack(struct_format):
+        values = struct_format.unpack_from(data, offset)
+        return values, offset + struct_format.size
+
+    def unpack_string():
+        (length, ), string_offset = unpack(_LENGTH)
+        string = data[string_offset:string_offset + length]
+        if len(string) != length:
+            raise ValueError('Unexpected end of state')
+        return string.decode('utf-8'), string_offset + length
+
+    (magic, version, saved_at, collector_count), offset = unpack(_STATE_HEADER)
+    if magic != STATE_MAGIC or version != STATE_VERSION:
+        raise ValueError('Unknown state format')
+    boot_id, offset = unpack_string()
+
+    snapshots = dict()
+    for _ in range(collector_count):
+        name, offset = unpack_string()
+        (key_count, ), offset = unpack(_COUNT)
+        snapshot = dict()
+        for _ in range(key_count):
+            key, offset = unpack_string()
+            key = _KEY_TYPES[key[0]](key[1:])
+            (item_count, ), offset = unpack(_COUNT)
+            (field_count, ), offset = unpack(_LENGTH)
+            value_format = struct.Struct('!d{0}q'.format(field_count))
+            items = list()
+            for _ in range(item_count):
+                values, offset = unpack(value_format)
+                items.append((values[1:], values[0]))
+            snapshot[key] = items
+        snapshots[name] = snapshot
+
+    return saved_at, boot_id, snapshots
+
+
+def _find_shifted(history, now, shift):
+    """
+    Returns the newest (value, timestamp) pair from history that is at least
+    shift seconds older than now or the oldest pair if there is no such pair
+
+    History should be ordered from newest to oldest
+    """
+    best_candidate = (None, None)
+    for value, timestamp in history:
+        best_candidate = (value, timestamp)
+        if (now - timestamp) >= shift:
+            break
+    return best_candidate
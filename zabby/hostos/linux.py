@@ -1,15 +1,35 @@
+from collections import namedtuple
+import errno
+import logging
+from multiprocessing.pool import ThreadPool
 import os
+import re
+import select
+import threading
 from ctypes import (cdll, Structure, POINTER, c_int, c_char_p, c_long, c_ulong,
-                    c_ushort, c_uint, c_char, byref)
+                    c_ushort, c_uint, c_char, c_size_t, byref,
+                    create_string_buffer)
 import socket
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from zabby.core.exceptions import OperatingSystemError
-from zabby.core.six import b
+from zabby.core.six import b, PY3
 from zabby.core.utils import (lists_from_file, lines_from_file, dict_from_file,
-                              to_bytes)
-from zabby.hostos import (HostOS, NetworkInterfaceInfo, ProcessInfo,
-                          DiskDeviceStats, CpuTimes, SystemLoad, SwapInfo)
-from zabby.hostos.collectors import DiskDeviceStatsCollector, CpuTimesCollector
+                              to_bytes, TimedCache, monotonic)
+from zabby.hostos import (HostOS, batched, NetworkInterfaceInfo, ProcessInfo,
+                          DiskDeviceStats, CpuTimes, SystemLoad, SwapInfo,
+                          MountInfo, TCP_STATES, ProcessCpuTimes)
+from zabby.hostos.collectors import (DiskDeviceStatsCollector,
+                                     CpuTimesCollector, NetCountersCollector,
+                                     ProcessCpuTimesCollector,
+                                     DEFAULT_HISTORY_RESOLUTIONS,
+                                     PROCESS_HISTORY_RESOLUTIONS)
+
+LOG = logging.getLogger(__name__)
 
 _libc = cdll.LoadLibrary("libc.so.6")
 
@@ -26,8 +46,42 @@ class StructPasswd(Structure):
     ]
 
 
-_libc.getpwnam.argtypes = [c_char_p]
-_libc.getpwnam.restype = POINTER(StructPasswd)
+_libc.getpwnam_r.argtypes = [c_char_p, POINTER(StructPasswd), c_char_p,
+                             c_size_t, POINTER(POINTER(StructPasswd))]
+_libc.getpwnam_r.restype = c_int
+_libc.getpwuid_r.argtypes = [c_uint, POINTER(StructPasswd), c_char_p,
+                             c_size_t, POINTER(POINTER(StructPasswd))]
+_libc.getpwuid_r.restype = c_int
+
+PASSWD_BUFFER_SIZE = 1024
+PASSWD_MAX_BUFFER_SIZE = 1024 * 1024
+
+PasswdEntry = namedtuple('PasswdEntry', ['name', 'uid', ])
+
+
+def _getpw(function, key, description):
+    """
+    Calls getpwnam_r or getpwuid_r with a buffer of its own, so that
+    concurrent lookups do not share the static buffer of getpwnam
+
+    :raises: OperatingSystemError if there is no such user or lookup fails
+    """
+    size = PASSWD_BUFFER_SIZE
+    while True:
+        passwd = StructPasswd()
+        result = POINTER(StructPasswd)()
+        buffer_ = create_string_buffer(size)
+        error = function(key, byref(passwd), buffer_, size, byref(result))
+        if error == errno.ERANGE and size < PASSWD_MAX_BUFFER_SIZE:
+            size *= 2
+            continue
+        if error != 0:
+            raise OperatingSystemError('Unable to look up {0}: {1}'.format(
+                description, os.strerror(error)))
+        if not result:
+            raise OperatingSystemError('Invalid {0}'.format(description))
+        # fields point into buffer_, so they are copied while it is alive
+        return PasswdEntry(passwd.name, passwd.uid)
 
 
 class StructSysinfo(Structure):
@@ -55,6 +109,22 @@ PROCESS_STATE_MAP = {
     "S (sleeping)": "sleep",
     "Z (zombie)": "zomb",
 }
+PROCESS_STAT_STATE_MAP = {
+    "R": "run",
+    "S": "sleep",
+    "Z": "zomb",
+}
+PF_KTHREAD = 0x00200000
+
+
+SOCKET_LISTEN_STATES = {
+    'tcp': '0A',  # TCP_LISTEN
+    'udp': '07',  # TCP_CLOSE, unconnected udp socket
+}
+
+# states in /proc/net/tcp are numbered in the same order as TCP_STATES
+SOCKET_STATES = dict(('{0:02X}'.format(number), state)
+                     for number, state in enumerate(TCP_STATES, 1))
 
 
 class Linux(HostOS):
@@ -69,23 +139,81 @@ class Linux(HostOS):
         'pused',
     ])
     AVAILABLE_DISK_DEVICE_STATS_TYPES = set(['sectors', 'operations'])
+    AVAILABLE_PROCESS_MEMORY_TYPES = set(['vsize', 'rss', 'pss'])
 
-    def __init__(self):
-        super(Linux, self).__init__()
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
 
-        self._disk_device_stats_collector = DiskDeviceStatsCollector(900, self)
+    NETWORK_FILESYSTEM_TYPES = set([
+        'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'ncpfs', 'afs', 'coda',
+        'ceph', '9p', 'lustre', 'glusterfs', 'fuse.glusterfs', 'fuse.sshfs',
+        'fuse.s3fs',
+    ])
+    STATVFS_CACHE_TTL = 5.0
+    SOCKET_TABLES_CACHE_TTL = 1.0
+    NETWORK_STATVFS_TIMEOUT = 3.0
+    PROCESS_SHARD_SIZE = 256
+    PASSWD_FILE = '/etc/passwd'
+    PASSWD_CACHE_TTL = 600.0
+    PASSWD_NEGATIVE_CACHE_TTL = 60.0
+    PASSWD_CACHE_SIZE = 4096
+
+    def __init__(self, proc_root='/proc'):
+        """
+        :param proc_root: where procfs with processes is mounted, such as
+            /host/proc inside a container
+        """
+        super(Linux, self).__init__()
+        self._proc_root = proc_root
+        # protects cached entries only, lookups are made without it
+        self._passwd_lock = threading.Lock()
+        self._passwd_version = None
+        self._passwd_entries = dict()
+        self._passwd_refreshing = set()
+        self._passwd_refreshes = queue.Queue()
+        self._passwd_refresher = None
+
+        self._process_walker_lock = threading.Lock()
+        self._process_walker_owner = None
+        self._process_walker = None
+
+        self._statvfs_cache = TimedCache(self.STATVFS_CACHE_TTL)
+        self._socket_tables_cache = TimedCache(self.SOCKET_TABLES_CACHE_TTL)
+        self._pending_statvfs_lock = threading.Lock()
+        self._pending_statvfs = set()
+
+        self._mounts_lock = threading.Lock()
+        self._mountinfo_file = None
+        self._mountinfo_poll = None
+        self._mounts = tuple()
+        self._mount_types = dict()
+
+        self._disk_device_stats_collector = DiskDeviceStatsCollector(
+            DEFAULT_HISTORY_RESOLUTIONS, self)
         self._collectors.append(self._disk_device_stats_collector)
 
-        self._cpu_times_collector = CpuTimesCollector(900, self)
+        self._cpu_times_collector = CpuTimesCollector(
+            DEFAULT_HISTORY_RESOLUTIONS, self)
         self._collectors.append(self._cpu_times_collector)
 
+        self._net_counters_collector = NetCountersCollector(
+            DEFAULT_HISTORY_RESOLUTIONS, self)
+        self._collectors.append(self._net_counters_collector)
+
+        self._process_cpu_times_collector = ProcessCpuTimesCollector(
+            PROCESS_HISTORY_RESOLUTIONS, self)
+        self._collectors.append(self._process_cpu_times_collector)
+
     def fs_size(self, filesystem):
         """
         Uses statvfs system call to obtain information about filesystem
 
         See `man 3 statvfs` for more information
+
+        :raises: OperatingSystemError if statvfs on network filesystem does
+            not complete in NETWORK_STATVFS_TIMEOUT seconds
         """
-        statvfs_struct = os.statvfs(filesystem)
+        statvfs_struct = self._statvfs(filesystem)
         total = statvfs_struct.f_blocks * statvfs_struct.f_bsize
         free = statvfs_struct.f_bavail * statvfs_struct.f_bsize
         return free, total
@@ -95,12 +223,104 @@ class Linux(HostOS):
         Uses statvfs system call to obtain information about filesystem
 
         See `man 3 statvfs` for more information
+
+        :raises: OperatingSystemError if statvfs on network filesystem does
+            not complete in NETWORK_STATVFS_TIMEOUT seconds
         """
-        statvfs_struct = os.statvfs(filesystem)
+        statvfs_struct = self._statvfs(filesystem)
         total = statvfs_struct.f_files
         free = statvfs_struct.f_ffree
         return free, total
 
+    def _statvfs(self, filesystem):
+        """
+        Returns statvfs of filesystem that is shared by all callers for
+        STATVFS_CACHE_TTL seconds
+
+        statvfs on network filesystems is called in a separate thread, so
+        that hung mounts do not block callers for longer than
+        NETWORK_STATVFS_TIMEOUT
+        """
+        statvfs_struct = self._statvfs_cache.get(filesystem)
+        if statvfs_struct is None:
+            if self._filesystem_type(filesystem) in \
+                    self.NETWORK_FILESYSTEM_TYPES:
+                statvfs_struct = self._statvfs_with_timeout(filesystem)
+            else:
+                statvfs_struct = os.statvfs(filesystem)
+            self._statvfs_cache.set(filesystem, statvfs_struct)
+
+        return statvfs_struct
+
+    def _statvfs_with_timeout(self, filesystem):
+        with self._pending_statvfs_lock:
+            if filesystem in self._pending_statvfs:
+                raise OperatingSystemError(
+                    "Previous statvfs of {0} has not completed yet".format(
+                        filesystem))
+            self._pending_statvfs.add(filesystem)
+
+        result = dict()
+        completed = threading.Event()
+
+        def statvfs():
+            try:
+                result['statvfs'] = os.statvfs(filesystem)
+            except OSError as e:
+                result['error'] = e
+            finally:
+                with self._pending_statvfs_lock:
+                    self._pending_statvfs.discard(filesystem)
+                completed.set()
+
+        thread = threading.Thread(target=statvfs)
+        thread.daemon = True
+        thread.start()
+
+        completed.wait(self.NETWORK_STATVFS_TIMEOUT)
+        if not completed.is_set():
+            raise OperatingSystemError(
+                "statvfs of {0} has not completed in {1} seconds".format(
+                    filesystem, self.NETWORK_STATVFS_TIMEOUT))
+        if 'error' in result:
+            raise result['error']
+        return result['statvfs']
+
+    def _filesystem_type(self, mount_point):
+        """
+        Returns type of filesystem mounted at mount_point or None if nothing
+        is mounted there
+        """
+        with self._mounts_lock:
+            self._update_mounts()
+            return self._mount_types.get(mount_point)
+
+    def mounts(self):
+        """
+        Parses /proc/self/mountinfo
+
+        File descriptor is kept open and polled, kernel signals POLLPRI when
+        mount table changes, so the file is parsed again only after mount or
+        umount
+        """
+        with self._mounts_lock:
+            self._update_mounts()
+            return self._mounts
+
+    def _update_mounts(self):
+        if self._mountinfo_file is None:
+            self._mountinfo_file = open('/proc/self/mountinfo')
+            self._mountinfo_poll = select.poll()
+            self._mountinfo_poll.register(self._mountinfo_file.fileno(),
+                                          select.POLLPRI | select.POLLERR)
+        elif not self._mountinfo_poll.poll(0):
+            return
+
+        self._mountinfo_file.seek(0)
+        self._mounts = tuple(_parse_mountinfo(self._mountinfo_file))
+        self._mount_types = dict((mount.mount_point, mount.fstype)
+                                 for mount in self._mounts)
+
     def net_interface_names(self):
         """
         Uses /proc/net/dev to obtain device names
@@ -121,6 +341,7 @@ class Linux(HostOS):
 
         return interface_infos[net_interface_name]
 
+    @batched
     def _net_interface_infos(self):
         lines = lines_from_file("/proc/net/dev")
         interface_info_lines = lines[2:]
@@ -138,6 +359,102 @@ class Linux(HostOS):
                 *(incoming + outgoing + collisions))
         return interface_stats
 
+    def listening_ports(self, protocol):
+        """
+        Uses /proc/net/{protocol} and /proc/net/{protocol}6 to obtain ports of
+        sockets in LISTEN state for tcp and unconnected sockets for udp
+
+        See `man 5 proc` for more information
+        """
+        return self._socket_tables(protocol)[0]
+
+    def socket_states(self, protocol):
+        """
+        Uses /proc/net/{protocol} and /proc/net/{protocol}6 to count sockets
+        in every state
+
+        See `man 5 proc` for more information
+        """
+        return self._socket_tables(protocol)[1]
+
+    def _socket_tables(self, protocol):
+        """
+        Returns (listening ports, socket states) of protocol, tables are
+        parsed once in SOCKET_TABLES_CACHE_TTL seconds
+        """
+        cached = self._socket_tables_cache.get(protocol)
+        if cached is None:
+            listen_state = SOCKET_LISTEN_STATES[protocol]
+            ports = set()
+            states = dict()
+            for table in [protocol, protocol + '6']:
+                try:
+                    f = open('/proc/net/' + table)
+                except IOError:
+                    continue  # ipv6 is disabled
+                with f:
+                    next(f, None)
+                    for line in f:
+                        fields = line.split(None, 4)
+                        state = fields[3]
+                        states[state] = states.get(state, 0) + 1
+                        if state == listen_state:
+                            ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+            states = dict((SOCKET_STATES[state], count)
+                          for state, count in states.items()
+                          if state in SOCKET_STATES)
+            cached = (frozenset(ports), states)
+            self._socket_tables_cache.set(protocol, cached)
+
+        return cached
+
+    @batched
+    def net_counters(self):
+        """
+        Obtains information from /proc/net/snmp and /proc/net/netstat, both
+        consist of pairs of lines with counter names and their values
+
+        See `man 5 proc` for more information
+        """
+        counters = dict()
+        for path in ['/proc/net/snmp', '/proc/net/netstat']:
+            try:
+                lines = lists_from_file(path)
+            except IOError:
+                continue  # netstat is missing in some containers
+            for names, values in zip(lines[0::2], lines[1::2]):
+                group = names[0].rstrip(':')
+                counters.setdefault(group, dict()).update(
+                    zip(names[1:], [int(value) for value in values[1:]]))
+        return counters
+
+    def net_counter_shifted(self, group, counter, shift, now):
+        """
+        Obtains information from NetCountersCollector
+        """
+        return self._net_counters_collector.get_counter(group, counter, shift,
+                                                        now)
+
+    @batched
+    def socket_stats(self):
+        """
+        Obtains information from /proc/net/sockstat and /proc/net/sockstat6,
+        every line is a group followed by field name and value pairs
+
+        See `man 5 proc` for more information
+        """
+        stats = dict()
+        for path in ['/proc/net/sockstat', '/proc/net/sockstat6']:
+            try:
+                lines = lists_from_file(path)
+            except IOError:
+                continue  # ipv6 is disabled
+            for line in lines:
+                stats[line[0].rstrip(':')] = dict(
+                    zip(line[1::2], [int(value) for value in line[2::2]]))
+        return stats
+
+    @batched
     def process_infos(self):
         """
         Uses /proc/{pid}/status to obtain information about process name,
@@ -145,11 +462,140 @@ class Linux(HostOS):
         Uses /proc/{pid}/cmdline to obtain information about command line
 
         {pid} directories are obtained once by listing all files containing only
-        digits in /proc
+        digits in /proc. If process walker workers are set, pids are split
+        into shards of PROCESS_SHARD_SIZE that are read concurrently, file
+        reads release GIL. Processes are returned in the same order either way
+
+        See `man 5 proc` for more information
+        """
+        process_ids = self._process_ids()
+        walker = self._process_walker_pool()
+        if walker is None or len(process_ids) <= self.PROCESS_SHARD_SIZE:
+            return self._read_process_infos(process_ids)
+
+        shards = [process_ids[start:start + self.PROCESS_SHARD_SIZE]
+                  for start in range(0, len(process_ids),
+                                     self.PROCESS_SHARD_SIZE)]
+        return (process_info
+                for process_infos in walker.imap(self._read_process_shard,
+                                                 shards)
+                for process_info in process_infos)
+
+    @batched
+    def process_summaries(self, uid=None):
+        """
+        Uses /proc/{pid}/stat to obtain process name and state, kernel
+        threads are recognized by PF_KTHREAD flag
+        Uses owner of /proc/{pid} as process UID, it is effective UID of
+        process (root for processes that are not dumpable), while
+        process_infos reports real UID
+
+        Owners are obtained while listing /proc, so stat files are read only
+        for processes owned by uid
+
+        See `man 5 proc` for more information
+        """
+        for _, name, fields in self._read_process_stats(uid, 7):
+            yield name, PROCESS_STAT_STATE_MAP.get(fields[0], 'sleep')
+
+    @batched
+    def process_cpu_summaries(self, uid=None):
+        """
+        Uses /proc/{pid}/stat to obtain process name and time spent by
+        process in user and kernel mode, processes are filtered by owner as
+        in process_summaries
 
         See `man 5 proc` for more information
         """
-        for process_id in self._process_ids():
+        for process_id, name, fields in self._read_process_stats(uid, 13):
+            yield int(process_id), name, self._stat_cpu_times(fields)
+
+    def _read_process_stats(self, uid, max_fields):
+        """
+        Yields (pid, name, fields following name) of userspace processes
+        owned by uid, fields are split at most max_fields times
+        """
+        for process_id in self._process_ids_owned_by(uid):
+            process_stat_path = os.path.join(self._proc_root, process_id,
+                                             'stat')
+            try:
+                with open(process_stat_path) as f:
+                    stat = f.read()
+            except IOError:
+                # process with process_id no longer exists
+                continue
+
+            # process name is in parentheses and may contain spaces
+            name_end = stat.rfind(')')
+            fields = stat[name_end + 2:].split(None, max_fields)
+            if int(fields[6]) & PF_KTHREAD:
+                continue
+            yield process_id, stat[stat.find('(') + 1:name_end], fields
+
+    def _process_ids_owned_by(self, uid):
+        if uid is None:
+            return self._process_ids()
+        return [process_id
+                for process_id, owner in self._process_ids_with_owners()
+                if owner == uid]
+
+    @batched
+    def process_owners(self):
+        """
+        Uses owners of /proc/{pid} directories, see process_summaries
+        """
+        return set(owner for _, owner in self._process_ids_with_owners())
+
+    def _process_ids_with_owners(self):
+        """
+        Returns (pid, owner uid) of /proc/{pid} directories, processes that
+        exit while /proc is listed are skipped
+        """
+        if not hasattr(os, 'scandir'):  # python < 3.5
+            process_ids = list()
+            for process_id in self._process_ids():
+                try:
+                    process_ids.append((process_id, os.stat(os.path.join(
+                        self._proc_root, process_id)).st_uid))
+                except OSError:
+                    continue
+            return process_ids
+
+        process_ids = list()
+        for entry in os.scandir(self._proc_root):
+            if entry.name.isdigit():
+                try:
+                    process_ids.append((entry.name, entry.stat().st_uid))
+                except OSError:
+                    continue
+        return process_ids
+
+    def _process_walker_pool(self):
+        """
+        Returns a thread pool of process walker workers or None if processes
+        should be read by calling thread
+
+        Pool is created on first use and again after fork or change of
+        workers, since threads are not inherited by forked children
+        """
+        workers = self._process_walker_workers
+        if workers < 2:
+            return None
+        with self._process_walker_lock:
+            owner = (os.getpid(), workers)
+            if self._process_walker_owner != owner:
+                if (self._process_walker_owner is not None and
+                        self._process_walker_owner[0] == os.getpid()):
+                    self._process_walker.close()
+                self._process_walker = ThreadPool(workers)
+                self._process_walker_owner = owner
+            return self._process_walker
+
+    def _read_process_shard(self, process_ids):
+        return list(self._read_process_infos(process_ids))
+
+    def _read_process_infos(self, process_ids):
+        for process_id in process_ids:
             try:
                 try:
                     command_line = self._process_command_line(process_id)
@@ -158,13 +604,15 @@ class Linux(HostOS):
                     # we are not interested in them
                     continue
 
-                status = self._process_status(process_id)
+                name, uid, state, used_memory = self._process_status(
+                    process_id)
                 yield ProcessInfo(
-                    name=status['Name'],
-                    uid=status['Uid'],
-                    state=status['State'],
+                    name=name,
+                    uid=uid,
+                    state=state,
                     command_line=command_line,
-                    used_memory=status['VmSize']
+                    used_memory=used_memory,
+                    pid=int(process_id)
                 )
             except IOError:
                 # process with process_id no longer exists
@@ -172,51 +620,199 @@ class Linux(HostOS):
 
     def _process_ids(self):
         return [dir_name
-                for dir_name in os.listdir('/proc')
+                for dir_name in os.listdir(self._proc_root)
                 if dir_name.isdigit()]
 
     def _process_command_line(self, process_id):
-        proc_cmd_line = os.path.join('/proc', process_id, 'cmdline')
+        proc_cmd_line = os.path.join(self._proc_root, process_id, 'cmdline')
         proc_cmd_line = lines_from_file(proc_cmd_line)[0]
 
         return proc_cmd_line.replace('\0', ' ').rstrip()
 
     def _process_status(self, process_id):
-        process_status_file_path = os.path.join('/proc', process_id, 'status')
-        process_status = dict_from_file(process_status_file_path, ':\t')
-
-        process_status['Uid'] = int(
-            process_status['Uid'].split('\t')[0]
-        )  # only effective UID is needed
-        process_status['State'] = PROCESS_STATE_MAP.get(
-            process_status['State'], 'sleep'
-        )
+        """
+        Returns (name, uid, state, used memory) from /proc/{pid}/status
 
-        # VmSize field can be missing
-        # See ${linux}/fs/proc/array.c:proc_pid_status for more information
-        if 'VmSize' in process_status:
-            process_status['VmSize'] = to_bytes(
-                *process_status['VmSize'].split())
-        else:
-            process_status['VmSize'] = 0
+        The whole file is read in one go by buffered io, but is parsed only
+        until VmSize line
+        """
+        process_status_file_path = os.path.join(self._proc_root, process_id,
+                                                'status')
+        with open(process_status_file_path) as f:
+            return _parse_process_status(f)
+
+    def process_memory(self, pid, memory_type):
+        """
+        Uses /proc/{pid}/statm to obtain virtual memory size and resident set
+        size, /proc/{pid}/smaps_rollup to obtain proportional set size
+
+        See `man 5 proc` for more information
+        """
+        if memory_type == 'pss':
+            return self._process_pss(pid)
+
+        statm = lists_from_file(
+            os.path.join(self._proc_root, str(pid), 'statm'))[0]
+        pages = statm[0] if memory_type == 'vsize' else statm[1]
+        return int(pages) * self.PAGE_SIZE
+
+    def _process_pss(self, pid):
+        process_directory = os.path.join(self._proc_root, str(pid))
+        try:
+            f = open(os.path.join(process_directory, 'smaps_rollup'))
+        except IOError:
+            # smaps_rollup appeared in linux 4.14, smaps is much larger
+            f = open(os.path.join(process_directory, 'smaps'))
+        with f:
+            return sum(to_bytes(*line.split()[1:3])
+                       for line in f
+                       if line.startswith('Pss:'))
+
+    def process_cpu_times(self, pid):
+        """
+        Uses /proc/{pid}/stat to obtain time spent by process in user and
+        kernel mode
+
+        See `man 5 proc` for more information
+        """
+        stat = lines_from_file(
+            os.path.join(self._proc_root, str(pid), 'stat'))[0]
+        # process name is in parentheses and may contain spaces
+        return self._stat_cpu_times(stat.rsplit(')', 1)[1].split())
+
+    def _stat_cpu_times(self, fields):
+        return ProcessCpuTimes(
+            user=int(fields[11]) * 1000 // self.CLOCK_TICKS,
+            system=int(fields[12]) * 1000 // self.CLOCK_TICKS,
+        )
 
-        return process_status
+    def process_cpu_times_shifted(self, name, uid, cmdline, shift, now):
+        """
+        Obtains information from ProcessCpuTimesCollector
+        """
+        return self._process_cpu_times_collector.get_times(name, uid, cmdline,
+                                                           shift, now)
 
     def uid(self, username):
         """
-        Uses getpwnam system call to obtain UID
+        Uses getpwnam_r system call to obtain UID
 
-        See `man 3 getpwnam` for more information
+        See `man 3 getpwnam_r` for more information
         """
-        return self._passwd(username).uid
+        return self._cached_passwd_lookup('name', username,
+                                          lambda passwd: passwd.uid)
 
-    def _passwd(self, username):
-        pointer_to_passwd = _libc.getpwnam(b(username))
-        if pointer_to_passwd:
-            return pointer_to_passwd[0]
+    def username(self, uid):
+        """
+        Uses getpwuid_r system call to obtain user name
+
+        See `man 3 getpwuid_r` for more information
+        """
+        def name(passwd):
+            if PY3:
+                return passwd.name.decode('utf-8', 'replace')
+            return passwd.name
+
+        return self._cached_passwd_lookup('uid', uid, name)
+
+    def _cached_passwd_lookup(self, key_type, key, field):
+        """
+        Looks user up through NSS, which may query a directory service,
+        results are cached for PASSWD_CACHE_TTL seconds and missing users
+        for PASSWD_NEGATIVE_CACHE_TTL seconds
+
+        Expired results are returned while they are looked up again in
+        background, cache is forgotten when PASSWD_FILE is changed
+
+        :raises: OperatingSystemError if there is no such user
+        """
+        self._forget_changed_passwd()
+        cache_key = (key_type, key)
+        with self._passwd_lock:
+            entry = self._passwd_entries.get(cache_key)
+            refresh = (entry is not None and entry[1] <= monotonic() and
+                       cache_key not in self._passwd_refreshing)
+            if refresh:
+                self._passwd_refreshing.add(cache_key)
+                if (self._passwd_refresher is None or
+                        not self._passwd_refresher.is_alive()):
+                    self._passwd_refresher = threading.Thread(
+                        target=self._refresh_passwd_entries,
+                        name='passwd-refresher')
+                    self._passwd_refresher.daemon = True
+                    self._passwd_refresher.start()
+        if refresh:
+            self._passwd_refreshes.put((cache_key, field))
+
+        if entry is None:
+            value = self._lookup_passwd(cache_key, field)
         else:
-            raise OperatingSystemError('Invalid name: {0}'.format(username))
+            value = entry[0]
+        if value is None:
+            raise OperatingSystemError(
+                'Invalid {0}: {1}'.format(key_type, key))
+        return value
+
+    def _lookup_passwd(self, cache_key, field):
+        """
+        Looks user up and caches result, None is cached for missing users
+        """
+        key_type, key = cache_key
+        version = self._passwd_version
+        try:
+            value = field(self._passwd(key) if key_type == 'name'
+                          else self._passwd_by_uid(key))
+            ttl = self.PASSWD_CACHE_TTL
+        except OperatingSystemError:
+            value, ttl = None, self.PASSWD_NEGATIVE_CACHE_TTL
+
+        now = monotonic()
+        with self._passwd_lock:
+            if version == self._passwd_version:
+                if (cache_key not in self._passwd_entries and
+                        len(self._passwd_entries) >= self.PASSWD_CACHE_SIZE):
+                    self._evict_passwd_entries(now)
+                self._passwd_entries[cache_key] = (value, now + ttl)
+        return value
+
+    def _evict_passwd_entries(self, now):
+        for cache_key, (_, expires_at) in list(self._passwd_entries.items()):
+            if expires_at <= now and cache_key not in self._passwd_refreshing:
+                del self._passwd_entries[cache_key]
+        if len(self._passwd_entries) >= self.PASSWD_CACHE_SIZE:
+            self._passwd_entries.popitem()
+
+    def _refresh_passwd_entries(self):
+        while True:
+            cache_key, field = self._passwd_refreshes.get()
+            try:
+                self._lookup_passwd(cache_key, field)
+            except Exception as e:
+                LOG.exception("Unable to refresh user {0}: {1}".format(
+                    cache_key, e))
+            finally:
+                with self._passwd_lock:
+                    self._passwd_refreshing.discard(cache_key)
+
+    def _forget_changed_passwd(self):
+        try:
+            stat = os.stat(self.PASSWD_FILE)
+            version = (stat.st_ino, stat.st_mtime, stat.st_size)
+        except OSError:
+            version = None
+        with self._passwd_lock:
+            if version != self._passwd_version:
+                self._passwd_entries.clear()
+                self._passwd_version = version
+
+    def _passwd(self, username):
+        return _getpw(_libc.getpwnam_r, b(username),
+                      'name: {0}'.format(username))
+
+    def _passwd_by_uid(self, uid):
+        return _getpw(_libc.getpwuid_r, uid, 'uid: {0}'.format(uid))
 
+    @batched
     def memory(self):
         """
         Uses /proc/meminfo to obtain information on memory usage
@@ -262,6 +858,7 @@ class Linux(HostOS):
         """
         return self._disk_devices_stats()[device]
 
+    @batched
     def _disk_devices_stats(self):
         diskstats = dict()
         disks = lists_from_file('/proc/diskstats')
@@ -300,6 +897,7 @@ class Linux(HostOS):
         """
         return self._cpus_times()[cpu_id]
 
+    @batched
     def _cpus_times(self):
         stats = lists_from_file('/proc/stat')
         cpus_times = []
@@ -339,6 +937,14 @@ class Linux(HostOS):
         """
         return int(float(lists_from_file('/proc/uptime')[0][0]))
 
+    def boot_id(self):
+        """
+        Obtains information from /proc/sys/kernel/random/boot_id
+
+        See `man 4 random` for more information
+        """
+        return lines_from_file('/proc/sys/kernel/random/boot_id')[0]
+
     def max_number_of_running_processes(self):
         """
         Obtains information from /proc/sys/kernel/pid_max
@@ -347,6 +953,7 @@ class Linux(HostOS):
         """
         return int(lines_from_file("/proc/sys/kernel/pid_max")[0])
 
+    @batched
     def system_load(self):
         """
         Obtains information from python os.getloadavg()
@@ -367,6 +974,7 @@ class Linux(HostOS):
         return (sysinfo_struct.freeswap * sysinfo_struct.mem_unit,
                 sysinfo_struct.totalswap * sysinfo_struct.mem_unit)
 
+    @batched
     def swap_info(self):
         """
         Obtains information from /proc/vmstat
@@ -397,3 +1005,52 @@ class Linux(HostOS):
             devices.add(device)
 
         return devices
+
+
+_MOUNTINFO_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _parse_process_status(lines):
+    """
+    Returns (name, uid, state, used memory) from lines of /proc/{pid}/status,
+    lines after VmSize are not looked at
+
+    Uid is the first of real, effective, saved and filesystem UIDs. VmSize
+    is missing for kernel threads and zombies, used memory is 0 then.
+    See ${linux}/fs/proc/array.c:proc_pid_status for more information
+    """
+    name = uid = state = None
+    used_memory = 0
+    for line in lines:
+        key, _, value = line.partition(':\t')
+        if key == 'Name':
+            name = value.rstrip()
+        elif key == 'State':
+            state = PROCESS_STATE_MAP.get(value.rstrip(), 'sleep')
+        elif key == 'Uid':
+            uid = int(value.split('\t', 1)[0])
+        elif key == 'VmSize':
+            used_memory = to_bytes(*value.split())
+            break
+    return name, uid, state, used_memory
+
+
+def _unescape_mountinfo(value):
+    return _MOUNTINFO_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)),
+                                 value)
+
+
+def _parse_mountinfo(lines):
+    """
+    Yields MountInfo for lines of /proc/self/mountinfo
+
+    See `man 5 proc` for description of format
+    """
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        separator = fields.index('-', 6)
+        yield MountInfo(_unescape_mountinfo(fields[4]),
+                        fields[separator + 1],
+                        _unescape_mountinfo(fields[separator + 2]))
@@ -1,4 +1,6 @@
 from . import interface
+from . import snmp
 from . import tcp
+from . import udp
 
-__all__ = ['interface', 'tcp', ]
+__all__ = ['interface', 'snmp', 'tcp', 'udp', ]
@@ -1,7 +1,8 @@
-from zabby.core.utils import validate_mode
+from zabby.core.utils import (validate_mode, discovery_json, filter_names,
+                              DiscoveryCache)
 from zabby.hostos import detect_host_os
 
-__all__ = ['incoming', 'outgoing', ]
+__all__ = ['incoming', 'outgoing', 'discovery', ]
 
 NET_MODES = ['bytes', 'packets', 'errors', 'dropped', ]
 
@@ -48,3 +49,32 @@ def outgoing(interface_name, mode="bytes", host_os=detect_host_os()):
     return info._asdict()[
         "{direction}_{mode}".format(direction='out', mode=mode)
     ]
+
+
+_discoveries = DiscoveryCache()
+
+
+def discovery(include='', exclude='', host_os=detect_host_os()):
+    """
+    Returns low-level discovery JSON with {#IFNAME} of network interfaces
+
+    JSON is built again only when set of interfaces changes
+
+    :param include: regular expression that interface names must match
+        completely, all interfaces are included if empty
+    :param exclude: regular expression for interface names that should be
+        excluded, such as veth.*
+
+    :raises: WrongArgumentError if include or exclude is not a valid regular
+        expression
+
+    :depends on: [host_os.net_interface_names]
+    """
+    interface_names = host_os.net_interface_names()
+
+    def build():
+        return discovery_json(
+            {'IFNAME': interface_name} for interface_name
+            in filter_names(interface_names, include, exclude))
+
+    return _discoveries.get((include, exclude), interface_names, build)
@@ -0,0 +1,69 @@
+from __future__ import division
+
+from zabby.core.utils import validate_mode, AVERAGE_MODE
+from zabby.hostos import detect_host_os
+
+__all__ = ['counter', 'rate', 'sockstat', ]
+
+
+def counter(group, name, host_os=detect_host_os()):
+    """
+    Returns current value of network statistics counter, such as
+    Tcp,RetransSegs or TcpExt,ListenOverflows
+
+    :raises: WrongArgumentError if unknown group or name is supplied
+
+    :depends on: [host_os.net_counters]
+    """
+    return _current(group, name, host_os)
+
+
+def rate(group, name, mode='avg1', host_os=detect_host_os()):
+    """
+    Returns average number of times per second network statistics counter
+    was increased over a period of time
+
+    Counters that were reset during the period are reported as 0
+
+    :raises: WrongArgumentError if unknown group or name is supplied
+    :raises: WrongArgumentError if unknown mode is supplied
+
+    :depends on: [host_os.net_counters, host_os.net_counter_shifted,
+                  host_os.last_read_time]
+    """
+    validate_mode(mode, AVERAGE_MODE.keys())
+
+    current = _current(group, name, host_os)
+    now = host_os.last_read_time()
+    shifted, shifted_timestamp = host_os.net_counter_shifted(
+        group, name, AVERAGE_MODE[mode], now)
+    if shifted is None:
+        return 0.0
+
+    time_delta = now - shifted_timestamp
+    if time_delta <= 0 or current < shifted.value:
+        return 0.0
+    return (current - shifted.value) / time_delta
+
+
+def sockstat(group, name, host_os=detect_host_os()):
+    """
+    Returns socket usage statistics, such as TCP,inuse or TCP,mem
+
+    :raises: WrongArgumentError if unknown group or name is supplied
+
+    :depends on: [host_os.socket_stats]
+    """
+    stats = host_os.socket_stats()
+    validate_mode(group, sorted(stats.keys()))
+    validate_mode(name, sorted(stats[group].keys()))
+
+    return stats[group][name]
+
+
+def _current(group, name, host_os):
+    counters = host_os.net_counters()
+    validate_mode(group, sorted(counters.keys()))
+    validate_mode(name, sorted(counters[group].keys()))
+
+    return counters[group][name]
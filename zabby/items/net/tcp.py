@@ -2,10 +2,12 @@ import logging
 import re
 from zabby.core.exceptions import WrongArgumentError
 
-from zabby.core.utils import validate_mode, tcp_communication
+from zabby.core.probe import ProbeEngine, Service
+from zabby.core.utils import validate_mode, parse_port
+from zabby.hostos import detect_host_os, TCP_STATES
 
 
-__all__ = ['service', ]
+__all__ = ['service', 'service_perf', 'listen', 'count', ]
 
 LOG = logging.getLogger(__name__)
 
@@ -15,28 +17,103 @@ def service(service_name, ip='127.0.0.1', port=None, timeout=1.0):
     Returns 1 if service running on port accepts connections and behaves as
     expected, 0 otherwise
 
-    :param service_name: specifies expected behaviour and port
-        ssh:
+    :param service_name: specifies expected behaviour and port, one of
+        SERVICES
+        ssh, smtp, ftp, pop, imap, nntp:
             behavior: should respond with a greeting message upon connection
-            port: 22
+        http, redis, memcached, ldap:
+            behavior: should respond to a request
+        tcp:
+            behavior: should accept connection, port is required
     :param port: overrides port specified by service_name
 
     :raises: WrongArgumentError if unsupported service_name is supplied,
         port is not an integer in range [0,65535] or
         timeout is not a positive float
     """
+    return int(_check(service_name, ip, port, timeout) is not None)
+
+
+def service_perf(service_name, ip='127.0.0.1', port=None, timeout=1.0):
+    """
+    Returns number of seconds service running on port took to accept
+    connection and respond as expected, 0 if it did not
+
+    See service for description of arguments
+    """
+    elapsed = _check(service_name, ip, port, timeout)
+    return 0 if elapsed is None else elapsed
+
+
+def listen(port, host_os=detect_host_os()):
+    """
+    Returns 1 if there is a tcp socket listening on port, 0 otherwise
+
+    :raises: WrongArgumentError if port is not an integer in range [0,65535]
+
+    :depends on: [host_os.listening_ports]
+    """
+    return int(parse_port(port) in host_os.listening_ports('tcp'))
+
+
+def count(state='all', host_os=detect_host_os()):
+    """
+    Returns number of tcp sockets in state
+
+    :param state: all or one of TCP_STATES
+
+    :raises: WrongArgumentError if unknown state is supplied
+
+    :depends on: [host_os.socket_states]
+    """
+    validate_mode(state, ['all'] + TCP_STATES)
+
+    states = host_os.socket_states('tcp')
+    if state == 'all':
+        return sum(states.values())
+    return states.get(state, 0)
+
+
+SERVICES = {
+    'ssh': Service(22, True, None, re.compile(b'^SSH-[0-9-. ]+-'), None,
+                   False),
+    'smtp': Service(25, True, None, re.compile(b'^220[ -]'), b'QUIT\r\n',
+                    False),
+    'ftp': Service(21, True, None, re.compile(b'^220[ -]'), b'QUIT\r\n',
+                   False),
+    'pop': Service(110, True, None, re.compile(b'^\\+OK'), b'QUIT\r\n',
+                   False),
+    'imap': Service(143, True, None, re.compile(b'^\\* OK'),
+                    b'a1 LOGOUT\r\n', False),
+    'nntp': Service(119, True, None, re.compile(b'^20[01] '), b'QUIT\r\n',
+                    False),
+    'http': Service(80, False, b'HEAD / HTTP/1.0\r\n\r\n',
+                    re.compile(b'^HTTP/1\\.[01] [0-9]{3}'), None, False),
+    'redis': Service(6379, False, b'PING\r\n',
+                     re.compile(b'^(\\+PONG|-NOAUTH)[^\r]*\r\n'), None, True),
+    'memcached': Service(11211, False, b'version\r\n',
+                         re.compile(b'^VERSION [^\r]*\r\n'), None, True),
+    # anonymous simple bind, any bind response means ldap is running
+    'ldap': Service(389, False,
+                    b'\x30\x0c\x02\x01\x01\x60\x07\x02\x01\x03\x04\x00\x80\x00',
+                    re.compile(b'^\x30.{1,5}\x02\x01\x01\x61', re.DOTALL),
+                    b'\x30\x05\x02\x01\x02\x42\x00', False),
+    'tcp': Service(None, False, None, None, None, False),
+}
+
+engine = ProbeEngine()
+
+
+def _check(service_name, ip, port, timeout):
     validate_mode(service_name, SERVICES.keys())
+    checked_service = SERVICES[service_name]
     if port:
-        try:
-            port = int(port)
-            if port < 0 or 65535 < port:
-                raise ValueError()
-        except ValueError:
-            raise WrongArgumentError(
-                "Port must be an integer in range [0,65535], got '{0}'".format(
-                    port))
+        port = parse_port(port)
+    elif checked_service.port is None:
+        raise WrongArgumentError(
+            "Port must be supplied for '{0}'".format(service_name))
     else:
-        port = SERVICES[service_name]
+        port = checked_service.port
     try:
         timeout = float(timeout)
         if timeout < 0.0:
@@ -45,30 +122,8 @@ def service(service_name, ip='127.0.0.1', port=None, timeout=1.0):
         raise WrongArgumentError(
             "Timeout must be float greater than 0, got '{0}'".format(timeout))
 
-    if service_name == 'ssh':
-        running = _check_ssh(ip, port, timeout)
-    else:
-        running = False
-
-    return int(running)
-
-
-SERVICES = {
-    'ssh': 22,
-}
-
-
-def _check_ssh(ip, port, timeout):
-    running = False
-    try:
-        responses = tcp_communication(port, ip, receive_first=True,
-                                      timeout=timeout)
-        server_message = responses[0].decode('utf-8')
-        if re.match('SSH-(?P<version>[0-9-. ]+)-', server_message):
-            running = True
-        else:
-            LOG.debug("Server message does not match expectations {0}".format(
-                server_message))
-    except IOError as e:
-        LOG.debug("SSH service is not running: {0}".format(e))
-    return running
+    elapsed = engine.check(checked_service, ip, port, timeout)
+    if elapsed is None:
+        LOG.debug("{0} service is not running on {1}:{2}".format(
+            service_name, ip, port))
+    return elapsed
@@ -0,0 +1,15 @@
+from zabby.core.utils import parse_port
+from zabby.hostos import detect_host_os
+
+__all__ = ['listen', ]
+
+
+def listen(port, host_os=detect_host_os()):
+    """
+    Returns 1 if there is an udp socket bound to port, 0 otherwise
+
+    :raises: WrongArgumentError if port is not an integer in range [0,65535]
+
+    :depends on: [host_os.listening_ports]
+    """
+    return int(parse_port(port) in host_os.listening_ports('udp'))
@@ -1,11 +1,16 @@
+from __future__ import division
 import re
 
 from zabby.hostos import detect_host_os
-from zabby.core.utils import validate_mode
+from zabby.core.exceptions import WrongArgumentError, OperatingSystemError
+from zabby.core.utils import (validate_mode, AVERAGE_MODE, monotonic,
+                              discovery_json, DiscoveryCache)
 
-__all__ = ['num', ]
+__all__ = ['num', 'mem', 'cpu_util', 'user_discovery', ]
 
 PROC_NUM_MODES = ['all', 'run', 'sleep', 'zomb']
+PROC_MEM_MODES = ['sum', 'avg', 'max', 'min']
+PROC_CPU_UTIL_TYPES = ['total', 'user', 'system']
 ALL_PROCESSES = 'all processes'
 ALL_USERS = 'all users'
 
@@ -15,16 +20,29 @@ def num(name=ALL_PROCESSES, user=ALL_USERS, state='all', cmdline=None,
     """
     Returns number of userspace processes matching filter
 
-    :depends on: [host_os.process_infos, host_os.uid]
+    Empty arguments match any process. Command lines are read only if
+    cmdline is given, otherwise cheaper host_os.process_summaries are used
+
+    :depends on: [host_os.process_infos, host_os.process_summaries,
+                  host_os.uid]
     :raises: WrongArgument if unsupported state is supplied
     :raises: OperatingSystemError if user is invalid
     """
+    state = state or 'all'
     validate_mode(state, PROC_NUM_MODES)
 
+    if name in ('', ALL_PROCESSES):
+        name = None
     uid = None
-    if user != ALL_USERS:
+    if user not in ('', ALL_USERS):
         uid = host_os.uid(user)
 
+    if not cmdline:
+        return sum(1 for process_name, process_state
+                   in host_os.process_summaries(uid)
+                   if (name is None or process_name == name) and
+                   (state == 'all' or process_state == state))
+
     number_of_processes = 0
     for process_info in host_os.process_infos():
         if _matches_filter(process_info, name, uid, state, cmdline):
@@ -33,8 +51,138 @@ def num(name=ALL_PROCESSES, user=ALL_USERS, state='all', cmdline=None,
     return number_of_processes
 
 
+def mem(name='', user='', mode='sum', cmdline='', memtype='vsize',
+        host_os=detect_host_os()):
+    """
+    Returns memory used by userspace processes matching filter in bytes
+
+    :param name: process name, any if empty
+    :param user: user running process, any if empty
+    :param mode: one of PROC_MEM_MODES, aggregates memory of every process
+    :param cmdline: regular expression command line should contain, any if
+        empty
+    :param memtype: one of host_os.AVAILABLE_PROCESS_MEMORY_TYPES, vsize -
+        virtual memory size, rss - resident set size, pss - proportional set
+        size that divides shared pages between processes sharing them
+
+    :raises: WrongArgumentError if unsupported mode or memtype is supplied
+    :raises: WrongArgumentError if cmdline is not a valid regular expression
+    :raises: OperatingSystemError if user is invalid
+
+    :depends on: [host_os.AVAILABLE_PROCESS_MEMORY_TYPES,
+                  host_os.process_infos, host_os.process_memory, host_os.uid]
+    """
+    validate_mode(mode, PROC_MEM_MODES)
+    validate_mode(memtype, host_os.AVAILABLE_PROCESS_MEMORY_TYPES)
+    name, uid, cmdline = _process_filter(name, user, cmdline, host_os)
+
+    used_memory = list()
+    for process_info in host_os.process_infos():
+        if _matches_filter(process_info, name, uid, 'all', cmdline):
+            try:
+                used_memory.append(host_os.process_memory(process_info.pid,
+                                                          memtype))
+            except (IOError, OSError):
+                continue  # process has exited or is not accessible
+
+    if not used_memory:
+        return 0
+    if mode == 'sum':
+        return sum(used_memory)
+    if mode == 'avg':
+        return sum(used_memory) / len(used_memory)
+    return max(used_memory) if mode == 'max' else min(used_memory)
+
+
+def cpu_util(name='', user='', util_type='total', cmdline='', mode='avg1',
+             host_os=detect_host_os()):
+    """
+    Returns percentage of a single cpu used by userspace processes matching
+    filter averaged over a period of time
+
+    Processes are collected in the background from the first request, so
+    the first requests return 0.0
+
+    :param util_type: one of PROC_CPU_UTIL_TYPES, total - time spent in user
+        and kernel mode, user - in user mode, system - in kernel mode
+    :param mode: one of AVERAGE_MODE
+
+    See mem for description of other arguments
+
+    :raises: WrongArgumentError if unsupported util_type or mode is supplied
+    :raises: WrongArgumentError if cmdline is not a valid regular expression
+    :raises: OperatingSystemError if user is invalid
+
+    :depends on: [host_os.process_cpu_times_shifted, host_os.uid]
+    """
+    validate_mode(util_type, PROC_CPU_UTIL_TYPES)
+    validate_mode(mode, AVERAGE_MODE.keys())
+    name, uid, cmdline = _process_filter(name, user, cmdline, host_os)
+
+    now = monotonic()
+    current, current_timestamp = host_os.process_cpu_times_shifted(
+        name, uid, cmdline, 0, now)
+    shifted, shifted_timestamp = host_os.process_cpu_times_shifted(
+        name, uid, cmdline, AVERAGE_MODE[mode], now)
+    if current is None or current_timestamp <= shifted_timestamp:
+        return 0.0
+
+    if util_type == 'total':
+        used = sum(current) - sum(shifted)
+    else:
+        used = (current._asdict()[util_type] -
+                shifted._asdict()[util_type])
+    # times are in milliseconds
+    return used / (current_timestamp - shifted_timestamp) / 10
+
+
+_discoveries = DiscoveryCache()
+
+
+def user_discovery(host_os=detect_host_os()):
+    """
+    Returns low-level discovery JSON with {#USER} of users that run
+    processes, that can be used as user argument of num to count processes
+    of every user
+
+    Processes of UIDs without a user name are not reported
+
+    :depends on: [host_os.process_owners, host_os.username]
+    """
+    owners = frozenset(host_os.process_owners())
+
+    def build():
+        users = list()
+        for uid in sorted(owners):
+            try:
+                users.append(host_os.username(uid))
+            except OperatingSystemError:
+                continue
+        return discovery_json({'USER': user} for user in users)
+
+    return _discoveries.get(None, owners, build)
+
+
+def _process_filter(name, user, cmdline, host_os):
+    """
+    Returns (name, uid, cmdline) where empty arguments are replaced with
+    values that match any process
+
+    :raises: WrongArgumentError if cmdline is not a valid regular expression
+    """
+    if cmdline:
+        try:
+            re.compile(cmdline)
+        except re.error as e:
+            raise WrongArgumentError(
+                "Invalid regular expression '{0}': {1}".format(cmdline, e))
+
+    return (name or None, host_os.uid(user) if user else None,
+            cmdline or None)
+
+
 def _matches_filter(process_info, name, uid, state, cmdline):
-    matches_name = True if name == ALL_PROCESSES else process_info.name == name
+    matches_name = True if name is None else process_info.name == name
     matches_user = True if uid is None else process_info.uid == uid
     matches_state = True if state == 'all' else process_info.state == state
     matches_cmdline = (True
@@ -1,9 +1,10 @@
 from __future__ import division
 
-from zabby.core.utils import validate_mode, AVERAGE_MODE
+from zabby.core.utils import (validate_mode, AVERAGE_MODE, discovery_json,
+                              DiscoveryCache)
 from zabby.hostos import detect_host_os, CPU_TIMES
 
-__all__ = ['util', ]
+__all__ = ['util', 'discovery', ]
 
 
 def util(cpu='all', state='user', mode='avg1', host_os=detect_host_os()):
@@ -69,3 +70,22 @@ def load(cpu='all', mode='avg1', host_os=detect_host_os()):
         value /= host_os.cpu_count()
 
     return value
+
+
+_discoveries = DiscoveryCache()
+
+
+def discovery(host_os=detect_host_os()):
+    """
+    Returns low-level discovery JSON with {#CPU.NUMBER} and {#CPU.STATUS} of
+    cpus, that can be used as cpu argument of util
+
+    :depends on: [host_os.cpu_count]
+    """
+    cpu_count = host_os.cpu_count()
+
+    def build():
+        return discovery_json({'CPU.NUMBER': cpu, 'CPU.STATUS': 'online'}
+                              for cpu in range(cpu_count))
+
+    return _discoveries.get(None, cpu_count, build)
@@ -1,5 +1,6 @@
 from . import fs
 from . import dev
 from . import file
+from . import log
 
-__all__ = ['fs', 'dev', 'file', ]
+__all__ = ['fs', 'dev', 'file', 'log', ]
@@ -1,8 +1,10 @@
-from time import time
-from zabby.core.utils import validate_mode, AVERAGE_MODE
+from __future__ import division
+
+from zabby.core.utils import (validate_mode, AVERAGE_MODE, discovery_json,
+                              filter_names, DiscoveryCache)
 from zabby.hostos import detect_host_os
 
-__all__ = ['read', 'write', ]
+__all__ = ['read', 'write', 'discovery', ]
 
 
 def read(device='all', stat_type='operations', mode='avg1',
@@ -22,7 +24,8 @@ def read(device='all', stat_type='operations', mode='avg1',
         host_os.AVAILABLE_DISK_DEVICE_STATS_TYPES,
         host_os.disk_device_names,
         host_os.disk_device_stats,
-        host_os.disk_device_stats_shifted
+        host_os.disk_device_stats_shifted,
+        host_os.last_read_time
     ]
     """
     return read_write('read', device, stat_type, mode, host_os)
@@ -45,7 +48,8 @@ def write(device='all', stat_type='operations', mode='avg1',
         host_os.AVAILABLE_DISK_DEVICE_STATS_TYPES,
         host_os.disk_device_names,
         host_os.disk_device_stats,
-        host_os.disk_device_stats_shifted
+        host_os.disk_device_stats_shifted,
+        host_os.last_read_time
     ]
     """
     return read_write('write', device, stat_type, mode, host_os)
@@ -68,21 +72,23 @@ def read_write(direction, device, stat_type, mode, host_os):
     else:
         devices = device_names
     stat_name = '{0}_{1}'.format(direction, type_without_per_second)
-    now = int(time())
     result = 0.0
     for device_name in devices:
         current_stats = host_os.disk_device_stats(device_name)
         if not stat_type in stat_type_per_second.keys():
             result += current_stats._asdict()[stat_name]
         else:
+            now = host_os.last_read_time()
             shifted_stats, shifted_timestamp = (
                 host_os.disk_device_stats_shifted(device_name, shift, now))
 
-            if shifted_stats is not None:
+            if shifted_stats is None:
+                continue
+
+            time_delta = now - shifted_timestamp
+            if time_delta > 0:
                 stat_delta = (current_stats._asdict()[stat_name] -
                               shifted_stats._asdict()[stat_name])
-                time_delta = now - shifted_timestamp
-
                 result += stat_delta / time_delta
     return result
 
@@ -92,3 +98,32 @@ stat_type_per_second = {
     'ops': 'operations',
     'bps': 'bytes'
 }
+
+
+_discoveries = DiscoveryCache()
+
+
+def discovery(include='', exclude='', host_os=detect_host_os()):
+    """
+    Returns low-level discovery JSON with {#DEVNAME} of disk devices
+
+    JSON is built again only when set of devices changes
+
+    :param include: regular expression that device names must match
+        completely, all devices are included if empty
+    :param exclude: regular expression for device names that should be
+        excluded, such as loop[0-9]+|ram[0-9]+
+
+    :raises: WrongArgumentError if include or exclude is not a valid regular
+        expression
+
+    :depends on: [host_os.disk_device_names]
+    """
+    device_names = host_os.disk_device_names()
+
+    def build():
+        return discovery_json(
+            {'DEVNAME': device_name} for device_name
+            in filter_names(device_names, include, exclude))
+
+    return _discoveries.get((include, exclude), device_names, build)
@@ -1,19 +1,283 @@
+import errno
 import hashlib
+import os
+import re
+import threading
+import zlib
 
-__all__ = ['md5sum', ]
+from zabby.core.exceptions import WrongArgumentError
+from zabby.core.six import PY3
+from zabby.core.utils import validate_mode, TimedCache
 
+__all__ = ['md5sum', 'digest', 'size', 'exists', 'time', 'regmatch',
+           'regexp', ]
 
-def md5sum(file_path, block_size=8192):
+DIGEST_MODES = ['md5', 'sha1', 'sha256', 'crc32', ]
+TIME_MODES = {
+    'modify': 'st_mtime',
+    'access': 'st_atime',
+    'change': 'st_ctime',
+}
+
+READ_BUFFER_SIZE = 1024 * 1024
+STAT_CACHE_TTL = 1.0
+
+
+def size(file_path):
+    """
+    Returns size of file at file_path in bytes
+
+    :raises: OSError if file does not exist or is not accessible
+    """
+    return _stat(file_path).st_size
+
+
+def exists(file_path):
+    """
+    Returns 1 if file_path exists, 0 otherwise
+
+    :raises: OSError if file_path is not accessible
+    """
+    try:
+        _stat(file_path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return 0
+        raise
+    return 1
+
+
+def time(file_path, mode='modify'):
+    """
+    Returns modification, access or change time of file at file_path as
+    seconds since epoch
+
+    :param mode: one of modify, access, change
+
+    :raises: WrongArgumentError if unsupported mode is supplied
+    :raises: OSError if file does not exist or is not accessible
+    """
+    validate_mode(mode, TIME_MODES.keys())
+
+    return int(getattr(_stat(file_path), TIME_MODES[mode]))
+
+
+def regmatch(file_path, regexp, encoding='', start_line='', end_line=''):
+    """
+    Returns 1 if any line of file at file_path matches regexp, 0 otherwise
+
+    :param encoding: file encoding, utf-8 if empty
+    :param start_line: number of the first line to search, 1 if empty
+    :param end_line: number of the last line to search, last if empty
+
+    :raises: WrongArgumentError if start_line or end_line are not positive
+        integers or regexp is not a valid regular expression
+    :raises: IOError if file is not accessible
+    """
+    for _ in _matches(file_path, regexp, encoding, start_line, end_line):
+        return 1
+    return 0
+
+
+def regexp(file_path, regexp, encoding='', start_line='', end_line='',
+           output=''):
+    """
+    Returns the first line of file at file_path that matches regexp or an
+    empty string if there is no such line
+
+    :param output: template of returned value, \\0 is replaced with the
+        whole match, \\1 - \\9 with corresponding groups, matching line is
+        returned if empty
+
+    :raises: WrongArgumentError if start_line or end_line are not positive
+        integers or regexp is not a valid regular expression
+    :raises: IOError if file is not accessible
+    """
+    for line, match in _matches(file_path, regexp, encoding, start_line,
+                                end_line):
+        if output:
+            return match.expand(_OUTPUT_GROUP.sub(r'\\g<\1>', output))
+        return line
+    return ''
+
+
+_OUTPUT_GROUP = re.compile(r'\\(\d)')
+
+_stat_cache = TimedCache(STAT_CACHE_TTL, max_size=4096)
+
+
+def _stat(file_path):
+    """
+    Returns os.stat of file_path that is cached for STAT_CACHE_TTL seconds,
+    missing files are cached as well
+
+    :raises: OSError if file does not exist or is not accessible
+    """
+    cached = _stat_cache.get(file_path)
+    if cached is None:
+        try:
+            cached = os.stat(file_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            cached = e
+        _stat_cache.set(file_path, cached)
+
+    if isinstance(cached, OSError):
+        raise cached
+    return cached
+
+
+def _line_number(value, default):
+    if value == '':
+        return default
+    try:
+        line_number = int(value)
+        if line_number < 1:
+            raise ValueError()
+    except ValueError:
+        raise WrongArgumentError(
+            "Line number must be a positive integer, got '{0}'".format(value))
+    return line_number
+
+
+def _matches(file_path, pattern, encoding, start_line, end_line):
+    """
+    Yields (line, match) for lines of file that match pattern
+
+    File is read in chunks of READ_BUFFER_SIZE, so it is never loaded into
+    memory completely
+    """
+    start_line = _line_number(start_line, 1)
+    end_line = _line_number(end_line, None)
+    try:
+        compiled_pattern = re.compile(pattern)
+    except re.error as e:
+        raise WrongArgumentError(
+            "Invalid regular expression '{0}': {1}".format(pattern, e))
+    encoding = encoding or 'utf-8'
+
+    with open(file_path, 'rb', 0) as f:
+        for line_number, line in enumerate(_lines(f), 1):
+            if end_line is not None and line_number > end_line:
+                break
+            if line_number < start_line:
+                continue
+
+            line = line.decode(encoding, 'replace').rstrip('\r')
+            match = compiled_pattern.search(line)
+            if match:
+                yield line, match
+
+
+def _lines(f, chunk_size=READ_BUFFER_SIZE):
+    """
+    Yields lines of binary file f without line separators
+    """
+    remainder = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    if remainder:
+        yield remainder
+
+
+def md5sum(file_path, block_size=READ_BUFFER_SIZE):
     """
     Returns md5sum of file at file_path
 
     :param block_size: file will be read in chunks of this size
     """
-    hash_aggregator = hashlib.md5()
-    with open(file_path, 'rb') as f:
+    return digest(file_path, 'md5', block_size)
+
+
+def digest(file_path, mode='md5', block_size=READ_BUFFER_SIZE):
+    """
+    Returns hex digest of file at file_path
+
+    Digests are cached by file path, inode, size and modification time, so
+    unchanged files are not read again
+
+    :param mode: one of md5, sha1, sha256, crc32
+    :param block_size: file will be read in chunks of this size
+
+    :raises: WrongArgumentError if unsupported mode is supplied
+    :raises: IOError, OSError if file is not accessible
+    """
+    validate_mode(mode, DIGEST_MODES)
+    block_size = int(block_size)
+
+    stat = os.stat(file_path)
+    version = (stat.st_ino, stat.st_size, _modification_time(stat))
+
+    cache_key = (file_path, mode)
+    cached_version, cached_digest = _digest_cache.get(cache_key, (None, None))
+    if cached_version == version:
+        return cached_digest
+
+    file_digest = _read_digest(file_path, mode, block_size)
+    _digest_cache.set(cache_key, (version, file_digest))
+    return file_digest
+
+
+def _modification_time(stat):
+    # st_mtime_ns appeared in python 3.3
+    return getattr(stat, 'st_mtime_ns', stat.st_mtime)
+
+
+class _Crc32(object):
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self):
+        return '{0:08x}'.format(self._crc & 0xffffffff)
+
+
+_HASH_FACTORIES = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'crc32': _Crc32,
+}
+
+_buffers = threading.local()
+
+if PY3:
+    def _chunk(data, size):
+        return memoryview(data)[:size]
+else:
+    def _chunk(data, size):
+        # zlib.crc32 does not accept memoryview on python 2, python 2.6 has
+        # no memoryview at all
+        return buffer(data, 0, size)
+
+
+def _read_digest(file_path, mode, block_size):
+    """
+    Reads file into a buffer that is reused by the calling thread, hashlib
+    releases GIL while hashing large buffers
+    """
+    data = getattr(_buffers, 'buffer', None)
+    if data is None or len(data) != block_size:
+        data = bytearray(block_size)
+        _buffers.buffer = data
+
+    hash_aggregator = _HASH_FACTORIES[mode]()
+    with open(file_path, 'rb', 0) as f:
         while True:
-            data = f.read(block_size)
-            hash_aggregator.update(data)
-            if len(data) < block_size:
+            read = f.readinto(data)
+            if not read:
                 break
+            hash_aggregator.update(_chunk(data, read))
     return hash_aggregator.hexdigest()
+
+
+_digest_cache = TimedCache(3600, max_size=1024)
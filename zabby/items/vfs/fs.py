@@ -1,7 +1,9 @@
-from zabby.core.utils import validate_mode, SIZE_CONVERSION_MODES, convert_size
+from zabby.core.utils import (validate_mode, SIZE_CONVERSION_MODES,
+                              convert_size, discovery_json, compile_filter,
+                              DiscoveryCache)
 from zabby.hostos import detect_host_os
 
-__all__ = ['size', ]
+__all__ = ['size', 'discovery', ]
 
 
 def size(filesystem, mode="total", host_os=detect_host_os()):
@@ -42,3 +44,32 @@ def inode(filesystem, mode="total", host_os=detect_host_os()):
     free, total = host_os.fs_inodes(filesystem)
 
     return convert_size(free, total, mode)
+
+
+_discoveries = DiscoveryCache()
+
+
+def discovery(fstype='', host_os=detect_host_os()):
+    """
+    Returns low-level discovery JSON with {#FSNAME} and {#FSTYPE} of mounted
+    filesystems
+
+    JSON is built again only when mount table changes
+
+    :param fstype: regular expression that filesystem type must match
+        completely, such as ext4|xfs, all filesystems are returned if empty
+
+    :raises: WrongArgumentError if fstype is not a valid regular expression
+
+    :depends on: [host_os.mounts]
+    """
+    mounts = host_os.mounts()
+
+    def build():
+        fstype_filter = compile_filter(fstype) if fstype else None
+        return discovery_json(
+            {'FSNAME': mount.mount_point, 'FSTYPE': mount.fstype}
+            for mount in mounts
+            if fstype_filter is None or fstype_filter.match(mount.fstype))
+
+    return _discoveries.get(fstype, mounts, build)
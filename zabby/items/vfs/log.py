@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from zabby.core.exceptions import WrongArgumentError
+from zabby.core.utils import validate_mode, monotonic
+from zabby.hostos import detect_host_os
+from zabby.hostos.collectors import Collector
+
+__all__ = ['lines', 'count', 'persist_offsets', ]
+
+LOG = logging.getLogger(__name__)
+
+LOG_MODES = ['all', 'skip', ]
+
+READ_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_LINES = 100
+
+OFFSETS_SAVE_INTERVAL = 10
+OFFSET_MAX_AGE = 24 * 3600
+
+
+def lines(file_path, regexp='', encoding='', max_lines='', mode='all',
+          output=''):
+    """
+    Returns lines appended to file at file_path since the previous call
+    that match regexp, separated by newlines
+
+    Position in file is remembered for every (file_path, regexp) pair, file
+    rotation and truncation are detected by inode and size change
+
+    :param regexp: lines are not filtered if empty
+    :param encoding: file encoding, utf-8 if empty
+    :param max_lines: maximum number of lines returned per call, lines that
+        did not fit will be returned by the next call
+    :param mode: all - the first call for a file returns matching lines from
+        the beginning of file, skip - the first call skips existing content
+    :param output: template of returned lines, \\0 is replaced with the whole
+        match, \\1 - \\9 with corresponding groups
+
+    :raises: WrongArgumentError if mode is unknown, max_lines is not a
+        positive integer or regexp is not a valid regular expression
+    :raises: IOError, OSError if file is not accessible
+    """
+    max_lines = _max_lines(max_lines)
+    template = _OUTPUT_GROUP.sub(r'\\g<\1>', output) if output else None
+
+    found = list()
+    for line, match in _new_matches(file_path, regexp, encoding, mode,
+                                    max_lines):
+        found.append(match.expand(template) if template else line)
+    return '\n'.join(found)
+
+
+def count(file_path, regexp='', encoding='', mode='all'):
+    """
+    Returns number of lines appended to file at file_path since the previous
+    call that match regexp
+
+    See lines for description of arguments
+    """
+    return sum(1 for _ in _new_matches(file_path, regexp, encoding, mode,
+                                       None))
+
+
+def persist_offsets(state_file, host_os=detect_host_os()):
+    """
+    Restores remembered file positions from state_file and saves them there
+    every OFFSETS_SAVE_INTERVAL seconds if they have changed, positions that
+    have not been used for OFFSET_MAX_AGE seconds are forgotten
+
+    Positions are saved by a collector of host_os, so this should be called
+    before host_os collectors are started, they are saved again when the
+    collectors are stopped
+
+    :depends on: [host_os.add_collector]
+    """
+    _offsets.persist(state_file)
+    host_os.add_collector(_OffsetsSaver(OFFSETS_SAVE_INTERVAL))
+
+
+_OUTPUT_GROUP = re.compile(r'\\(\d)')
+
+
+class LogOffsets(object):
+    """
+    Remembers (inode, offset) for every (file_path, regexp) pair
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._key_locks = dict()
+        self._offsets = dict()
+        self._last_used = dict()
+        self._state_file = None
+        self._dirty = False
+
+    def persist(self, state_file):
+        with self._lock:
+            self._state_file = state_file
+            try:
+                with open(state_file) as f:
+                    entries = json.load(f)
+                self._offsets = dict(
+                    ((file_path, regexp), (inode, offset))
+                    for file_path, regexp, inode, offset in entries)
+            except (IOError, OSError, ValueError, TypeError) as e:
+                LOG.info("Not restoring log offsets from {0}: {1}".format(
+                    state_file, e))
+            now = monotonic()
+            self._last_used = dict((key, now) for key in self._offsets)
+
+    def lock(self, key):
+        """
+        Returns a lock that should be held while offset for key is being
+        read and updated
+        """
+        with self._lock:
+            self._last_used[key] = monotonic()
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        with self._lock:
+            return self._offsets.get(key)
+
+    def set(self, key, inode, offset):
+        with self._lock:
+            if self._offsets.get(key) == (inode, offset):
+                return
+            self._offsets[key] = (inode, offset)
+            self._dirty = True
+
+    def evict(self, max_age):
+        """
+        Forgets offsets and locks of keys that have not been used for max_age
+        seconds
+        """
+        oldest = monotonic() - max_age
+        with self._lock:
+            for key, last_used in list(self._last_used.items()):
+                if last_used >= oldest:
+                    continue
+                key_lock = self._key_locks.get(key)
+                if key_lock is not None and key_lock.locked():
+                    continue
+                del self._last_used[key]
+                self._key_locks.pop(key, None)
+                if self._offsets.pop(key, None) is not None:
+                    self._dirty = True
+
+    def save(self):
+        """
+        Saves offsets to state file if they have changed since the previous
+        save, file is written without blocking readers of offsets
+        """
+        with self._save_lock:
+            with self._lock:
+                if self._state_file is None or not self._dirty:
+                    return
+                state_file = self._state_file
+                entries = [[file_path, regexp, inode, offset]
+                           for (file_path, regexp), (inode, offset)
+                           in self._offsets.items()]
+                self._dirty = False
+
+            temporary_file = state_file + '.tmp'
+            try:
+                with open(temporary_file, 'w') as f:
+                    json.dump(entries, f)
+                os.rename(temporary_file, state_file)
+            except (IOError, OSError) as e:
+                LOG.warning("Unable to save log offsets: {0}".format(e))
+                with self._lock:
+                    self._dirty = True
+
+
+class _OffsetsSaver(Collector):
+    """
+    Periodically forgets unused offsets and saves changed ones
+    """
+    name = 'log_offsets_saver'
+
+    def _collect(self):
+        _offsets.evict(OFFSET_MAX_AGE)
+        _offsets.save()
+
+    def stop(self):
+        _offsets.save()
+
+
+_offsets = LogOffsets()
+
+
+def _max_lines(value):
+    if value == '':
+        return DEFAULT_MAX_LINES
+    try:
+        max_lines = int(value)
+        if max_lines < 1:
+            raise ValueError()
+    except ValueError:
+        raise WrongArgumentError(
+            "Maximum number of lines must be a positive integer, "
+            "got '{0}'".format(value))
+    return max_lines
+
+
+def _new_matches(file_path, regexp, encoding, mode, max_lines):
+    """
+    Yields (line, match) for complete lines appended since the previous call
+    and remembers position after the last line read
+    """
+    validate_mode(mode, LOG_MODES)
+    try:
+        compiled_regexp = re.compile(regexp)
+    except re.error as e:
+        raise WrongArgumentError(
+            "Invalid regular expression '{0}': {1}".format(regexp, e))
+    encoding = encoding or 'utf-8'
+    key = (file_path, regexp)
+
+    with _offsets.lock(key):
+        with open(file_path, 'rb', 0) as f:
+            stat = os.fstat(f.fileno())
+            offset = _start_offset(_offsets.get(key), stat, mode)
+
+            matched = 0
+            for line, offset in _complete_lines(f, offset):
+                if max_lines is not None and matched >= max_lines:
+                    offset -= len(line) + 1
+                    break
+                line = line.decode(encoding, 'replace').rstrip('\r')
+                match = compiled_regexp.search(line)
+                if match:
+                    matched += 1
+                    yield line, match
+
+            _offsets.set(key, stat.st_ino, offset)
+
+
+def _start_offset(remembered, stat, mode):
+    if remembered is None:
+        return stat.st_size if mode == 'skip' else 0
+
+    inode, offset = remembered
+    if inode != stat.st_ino or stat.st_size < offset:
+        return 0  # file was rotated or truncated
+    return offset
+
+
+def _complete_lines(f, offset, chunk_size=READ_BUFFER_SIZE):
+    """
+    Yields (line, offset after line) for lines of binary file f starting at
+    offset, incomplete last line is left for the next call
+    """
+    f.seek(offset)
+    remainder = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        chunk_lines = (remainder + chunk).split(b'\n')
+        remainder = chunk_lines.pop()
+        for line in chunk_lines:
+            offset += len(line) + 1
+            yield line, offset
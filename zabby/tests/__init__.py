@@ -1,4 +1,6 @@
 import os
+import socket
+import threading
 
 from nose.tools import assert_true, assert_raises, nottest
 from zabby.core.exceptions import WrongArgumentError
@@ -44,6 +46,57 @@ def ensure_contains_only_formatted_lines(file_path, line_format, n=1):
         write_to_file(file_path, line_format.format(i))
 
 
+class StandInServer(object):
+    """
+    Accepts connections on localhost and handles each of them in a thread
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._handle, args=(conn, ))
+            thread.daemon = True
+            thread.start()
+
+    def _handle(self, conn):
+        try:
+            self.handle(conn)
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listener.close()
+
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
 class FakeThread:
     def __init__(self, target=None):
         self._target = target
@@ -1,9 +1,23 @@
-from mock import Mock, patch
-from nose.tools import assert_equal
-from zabby.tests import assert_less_equal, assert_is_instance, FakeThread
+from __future__ import division
+from collections import namedtuple
+import os
 
-from zabby.hostos import HostOS, DiskDeviceStats, CpuTimes, CPU_TIMES
-from zabby.hostos.collectors import DiskDeviceStatsCollector, CpuTimesCollector
+from mock import Mock, MagicMock, patch
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises
+from zabby.core.utils import write_to_file, monotonic
+from zabby.tests import (assert_less_equal, assert_is_instance,
+                         assert_not_in, assert_less, ensure_removed)
+
+from zabby.hostos import (HostOS, DiskDeviceStats, CpuTimes, CPU_TIMES,
+                          NetCounter, ProcessInfo, ProcessCpuTimes)
+from zabby.core.exceptions import ConfigurationError
+from zabby.hostos.collectors import (DiskDeviceStatsCollector,
+                                     CpuTimesCollector, NetCountersCollector,
+                                     ProcessCpuTimesCollector,
+                                     CollectorScheduler,
+                                     History, validate_history_resolutions,
+                                     save_collector_state,
+                                     load_collector_state)
 
 
 class TestHostOSCollectors():
@@ -15,16 +29,184 @@ class TestHostOSCollectors():
             self.collectors.append(collector)
             self.host_os._collectors.append(collector)
 
-    @patch('zabby.hostos.threading.Thread', FakeThread)
-    def test_start_collectors_runs_every_collector(self):
+        self._patcher = patch('zabby.hostos.CollectorScheduler')
+        self.mock_scheduler_class = self._patcher.start()
+        self.scheduler = self.mock_scheduler_class.return_value
+
+    def teardown(self):
+        self._patcher.stop()
+
+    def test_start_collectors_schedules_every_collector(self):
         self.host_os.start_collectors()
-        for collector in self.collectors:
-            collector.run.assert_called_once_with()
+        self.mock_scheduler_class.assert_called_once_with(self.collectors)
+        self.scheduler.start.assert_called_once_with()
 
-    def test_stop_collectors_stops_every_collector(self):
+    def test_stop_collectors_stops_scheduler(self):
+        self.host_os.start_collectors()
         self.host_os.stop_collectors()
+        self.scheduler.stop.assert_called_once_with()
+
+    def test_configure_collectors_sets_history_of_named_collectors(self):
+        resolutions = [(1, 60)]
+        self.host_os.configure_collectors(
+            {self.collectors[0].name: resolutions})
+
+        self.collectors[0].set_history_resolutions.assert_called_once_with(
+            resolutions)
+        assert_equal(0, self.collectors[1].set_history_resolutions.call_count)
+
+    def test_added_collectors_are_scheduled_and_stopped(self):
+        added = Mock()
+        self.host_os.add_collector(added)
+        self.host_os.start_collectors()
+        self.host_os.stop_collectors()
+
+        self.mock_scheduler_class.assert_called_once_with(
+            self.collectors + [added])
+        added.stop.assert_called_once_with()
+
+    def test_stop_collectors_without_start_does_nothing(self):
+        self.host_os.stop_collectors()
+        assert_equal(0, self.scheduler.stop.call_count)
+
+
+class TestCollectorScheduler():
+    def setup(self):
+        self.collectors = list()
+        for interval in [1, 5]:
+            collector = Mock()
+            collector.interval = interval
+            collector.skipped_ticks = 0
+            self.collectors.append(collector)
+
+        self._patcher = patch('zabby.hostos.collectors.monotonic')
+        self.mock_monotonic = self._patcher.start()
+        self.mock_monotonic.return_value = 100.0
+
+        self._thread_patcher = patch(
+            'zabby.hostos.collectors.threading.Thread')
+        self._thread_patcher.start()
+
+        self.scheduler = CollectorScheduler(self.collectors)
+        self.scheduler.start()
+
+    def teardown(self):
+        self._patcher.stop()
+        self._thread_patcher.stop()
+
+    def test_every_collector_is_run_on_start(self):
+        self.scheduler.run_pending(100.0)
         for collector in self.collectors:
-            collector.stop.assert_called_once_with()
+            assert_equal(1, collector.tick.call_count)
+
+    def test_collectors_are_run_with_their_own_interval(self):
+        now = 100.0
+        while now < 110.0:
+            self.scheduler.run_pending(now)
+            now += 0.5
+
+        assert_equal(10, self.collectors[0].tick.call_count)
+        assert_equal(2, self.collectors[1].tick.call_count)
+
+    def test_returns_time_until_next_deadline(self):
+        delay = self.scheduler.run_pending(100.25)
+        assert_equal(0.75, delay)
+
+    def test_late_collection_does_not_drift(self):
+        self.scheduler.run_pending(100.0)
+        self.scheduler.run_pending(101.5)
+
+        delay = self.scheduler.run_pending(101.5)
+        assert_equal(0.5, delay)
+
+    def test_missed_ticks_are_skipped_and_counted(self):
+        self.scheduler.run_pending(100.0)
+        self.scheduler.run_pending(103.5)
+
+        fast_collector = self.collectors[0]
+        assert_equal(2, fast_collector.tick.call_count)
+        assert_equal(2, fast_collector.skipped_ticks)
+
+    def test_stop_joins_scheduler_thread(self):
+        thread = self.scheduler._thread
+        self.scheduler.stop()
+        thread.join.assert_called_once_with()
+        assert_true(self.scheduler._stopped.is_set())
+
+
+class TestCollector():
+    def test_tick_swallows_collection_errors(self):
+        collector = CpuTimesCollector([(1, 1)], Mock())
+        collector.get_times(0, 1)
+        collector._host_os.cpu_times.side_effect = IOError
+        collector.tick()
+
+
+class TestHistory():
+    RESOLUTIONS = [(1, 60), (5, 900)]
+
+    def setup(self):
+        self.history = History(self.RESOLUTIONS)
+        self.now = 0.0
+        self.counter = 0
+
+    def _fill(self, seconds, interval=1, rate=lambda t: 10):
+        self.counters = dict()
+        end = self.now + seconds
+        while self.now < end:
+            self.history.append(self.counter, self.now)
+            self.counters[self.now] = self.counter
+            self.counter += rate(self.now) * interval
+            self.now += interval
+
+    def _average(self, shift):
+        value, timestamp = self.history.find_shifted(self.now, shift)
+        return (self.counter - value) / (self.now - timestamp)
+
+    def test_keeps_less_values_than_single_resolution_history(self):
+        self._fill(3600)
+        assert_less_equal(len(self.history), 61 + 181)
+
+    def test_returns_none_if_empty(self):
+        assert_equal((None, None), self.history.find_shifted(self.now, 60))
+
+    def test_returns_oldest_value_if_history_is_not_deep_enough(self):
+        self._fill(30)
+        assert_equal((0, 0.0), self.history.find_shifted(self.now, 60))
+
+    def test_uses_finest_resolution_that_is_deep_enough(self):
+        self._fill(3600)
+        for shift, resolution in self.RESOLUTIONS:
+            _, timestamp = self.history.find_shifted(self.now, shift)
+            assert_less_equal(shift, self.now - timestamp)
+            assert_less(self.now - timestamp, shift + resolution)
+
+    def test_averages_are_accurate_for_constant_rate(self):
+        self._fill(3600)
+        for shift in [60, 300, 900]:
+            assert_equal(10, self._average(shift))
+
+    def test_averages_are_accurate_for_changing_rate(self):
+        def rate(t):
+            return 100 if int(t) % 120 < 60 else 0
+
+        self._fill(3600, rate=rate)
+        for shift in [60, 300, 900]:
+            expected = (self.counter - self.counters[self.now - shift]) / shift
+            assert_less(abs(self._average(shift) - expected), 2)
+
+    def test_downsampling_tolerates_jitter(self):
+        for timestamp in [0.0, 0.999, 2.0, 2.998, 4.0, 5.001]:
+            self.history.append(1, timestamp)
+        assert_equal(6 + 2, len(self.history))
+
+
+def test_validate_history_resolutions():
+    validate_history_resolutions([(1, 60), (5, 900)])
+    for invalid in [[], [(5, 900), (1, 60)], [(60, 1)], [(0, 60)], None,
+                    [('a', 'b')]]:
+        assert_raises(ConfigurationError, validate_history_resolutions,
+                      invalid)
 
 
 DEVICE_NAME = 'dev0'
@@ -32,18 +214,15 @@ DEVICE_NAME = 'dev0'
 
 class TestDiskDeviceStatsCollector():
     def setup(self):
-        self._patcher = patch('zabby.hostos.collectors.time')
-        self.mock_time = self._patcher.start()
-
         self.now = 0
+        self.step = 1
 
-        def increment_and_return_now():
-            self.now += 1
-            return self.now
-
-        self.mock_time.side_effect = increment_and_return_now
+        self._patcher = patch('zabby.hostos.collectors.monotonic',
+                              lambda: self.now)
+        self._patcher.start()
 
         self.host_os = Mock()
+        self.host_os.last_read_time.side_effect = lambda: self.now
 
         self.stat = 0
 
@@ -55,22 +234,30 @@ class TestDiskDeviceStatsCollector():
             )
 
         self.host_os.disk_device_stats.side_effect = increment_and_return_stats
-        self.host_os.disk_device_names.return_value = set([DEVICE_NAME])
 
         self.shift = 5
         self.current_time = self.shift + 1
-        self.collector = DiskDeviceStatsCollector(self.shift, self.host_os)
+        self.idle_timeout = 60
+        self.collector = DiskDeviceStatsCollector([(1, self.shift)],
+                                                  self.host_os,
+                                                  self.idle_timeout)
+        self.collector.get_stats(DEVICE_NAME, self.shift, self.now)
 
     def teardown(self):
         self._patcher.stop()
 
+    def _collect(self, times=1):
+        for i in range(times):
+            self.collector._collect()
+            self.now += self.step
+
     def test_returns_none_if_history_is_empty(self):
         stats, timestamp = self.collector.get_stats(DEVICE_NAME, self.shift,
                                                     self.current_time)
         assert_equal((None, None), (stats, timestamp))
 
     def test_returns_not_completely_shifted_stats_for_unfilled_history(self):
-        self.collector._collect()
+        self._collect()
 
         stats, timestamp = self.collector.get_stats(DEVICE_NAME, self.shift,
                                                     self.current_time)
@@ -78,43 +265,368 @@ class TestDiskDeviceStatsCollector():
         assert_is_instance(stats, DiskDeviceStats)
 
     def test_returns_completely_shifted_stats_for_filled_history(self):
-        for i in range(self.shift + 1):
-            self.collector._collect()
+        self._collect(self.shift + 1)
 
         stats, timestamp = self.collector.get_stats(DEVICE_NAME, self.shift,
                                                     self.current_time)
         assert_equal(self.shift, self.current_time - timestamp)
         assert_is_instance(stats, DiskDeviceStats)
 
+    def test_keeps_sub_second_timestamps(self):
+        self.step = 0.25
+        self._collect(self.shift + 1)
+
+        stats, timestamp = self.collector.get_stats(DEVICE_NAME, 0.5, 1.5)
+        assert_equal(1.0, timestamp)
+        assert_equal(5, stats.read_operations)
+
+    def test_history_is_not_affected_by_wall_clock_steps(self):
+        with patch('time.time', Mock(return_value=1000.0)):
+            self._collect(self.shift)
+        with patch('time.time', Mock(return_value=-3600.0)):
+            self._collect()
+
+        stats, timestamp = self.collector.get_stats(DEVICE_NAME, self.shift,
+                                                    self.current_time)
+        assert_equal(self.shift, self.current_time - timestamp)
+        assert_equal(2, stats.read_operations)
+
+    def test_does_not_record_shared_read_twice(self):
+        self.step = 0.25
+        self.host_os.last_read_time.side_effect = lambda: 0.0
+        self._collect(2)
+
+        assert_equal(1, len(self.collector.snapshot()[DEVICE_NAME]))
+
+    def test_collects_only_requested_devices(self):
+        self._collect()
+
+        self.host_os.disk_device_stats.assert_called_once_with(DEVICE_NAME)
+        assert_equal(set([DEVICE_NAME]), self.collector.requested_keys())
+
+    def test_does_not_collect_anything_until_requested(self):
+        collector = DiskDeviceStatsCollector([(1, self.shift)],
+                                             self.host_os)
+        collector._collect()
+
+        assert_equal(0, self.host_os.disk_device_stats.call_count)
+
+    def test_stops_collecting_idle_devices(self):
+        self.step = self.idle_timeout + 1
+        self._collect(2)
+
+        assert_equal(1, self.host_os.disk_device_stats.call_count)
+        assert_equal(set(), self.collector.requested_keys())
+        assert_not_in(DEVICE_NAME, self.collector._history)
+
+    def test_skips_devices_that_disappeared(self):
+        self.host_os.disk_device_stats.side_effect = KeyError
+        self._collect()
+
+        stats, timestamp = self.collector.get_stats(DEVICE_NAME, self.shift,
+                                                    self.current_time)
+        assert_equal((None, None), (stats, timestamp))
+
 
 class TestCpuTimesCollector:
     def setup(self):
         self.host_os = Mock()
+        self.host_os.last_read_time.side_effect = monotonic
         self.host_os.cpu_count.return_value = 2
         self.host_os.cpu_times.return_value = CpuTimes(*[0 for _ in CPU_TIMES])
 
         self.shift = 5
-        self.collector = CpuTimesCollector(self.shift, self.host_os)
+        self.collector = CpuTimesCollector([(1, self.shift)], self.host_os)
+
+    def _get_times_of_every_cpu(self):
+        return [self.collector.get_times(cpu_id, self.shift)
+                for cpu_id in range(self.host_os.cpu_count())]
 
     def test_returns_none_if_history_is_empty(self):
-        cpu_count = self.host_os.cpu_count()
-        for cpu_id in range(cpu_count):
-            times = self.collector.get_times(cpu_id, self.shift)
-            assert_equal(None, times)
+        assert_equal([None, None], self._get_times_of_every_cpu())
 
     def test_returns_cpu_times_for_unfilled_history(self):
+        self._get_times_of_every_cpu()
         self.collector._collect()
 
-        cpu_count = self.host_os.cpu_count()
-        for cpu_id in range(cpu_count):
-            times = self.collector.get_times(cpu_id, self.shift)
+        for times in self._get_times_of_every_cpu():
             assert_is_instance(times, CpuTimes)
 
     def test_returns_cpu_times_for_filled_history(self):
+        self._get_times_of_every_cpu()
         for i in range(self.shift + 1):
             self.collector._collect()
 
-        cpu_count = self.host_os.cpu_count()
-        for cpu_id in range(cpu_count):
-            times = self.collector.get_times(cpu_id, self.shift)
+        for times in self._get_times_of_every_cpu():
             assert_is_instance(times, CpuTimes)
+
+    def test_collects_only_requested_cpus(self):
+        self.collector.get_times(1, self.shift)
+        self.collector._collect()
+
+        self.host_os.cpu_times.assert_called_once_with(1)
+
+
+class TestNetCountersCollector:
+    def setup(self):
+        self.host_os = MagicMock()
+        self.host_os.last_read_time.side_effect = monotonic
+        self.host_os.net_counters.return_value = {
+            'Tcp': {'RetransSegs': 10, 'InSegs': 100},
+        }
+
+        self.shift = 5
+        self.collector = NetCountersCollector([(1, self.shift)], self.host_os)
+
+    def test_returns_none_if_history_is_empty(self):
+        counter, timestamp = self.collector.get_counter('Tcp', 'RetransSegs',
+                                                        self.shift,
+                                                        monotonic())
+        assert_equal((None, None), (counter, timestamp))
+
+    def test_returns_counter_for_collected_history(self):
+        self.collector.get_counter('Tcp', 'RetransSegs', self.shift,
+                                   monotonic())
+        self.collector._collect()
+
+        counter, _ = self.collector.get_counter('Tcp', 'RetransSegs',
+                                                self.shift, monotonic())
+        assert_equal(NetCounter(10), counter)
+
+    def test_collects_counters_inside_batch(self):
+        self.collector.get_counter('Tcp', 'RetransSegs', self.shift,
+                                   monotonic())
+        self.collector.get_counter('Tcp', 'InSegs', self.shift, monotonic())
+        self.collector._collect()
+
+        self.host_os.batch.assert_called_once_with()
+
+    def test_skips_counters_that_disappeared(self):
+        self.collector.get_counter('Tcp', 'Missing', self.shift, monotonic())
+        self.collector._collect()
+
+        assert_equal(dict(), self.collector.snapshot())
+
+
+class TestProcessCpuTimesCollector:
+    def setup(self):
+        self.host_os = MagicMock()
+        self.processes = {
+            1: ProcessInfo('nginx', 0, 'sleep', 'nginx: master', 0, 1),
+            2: ProcessInfo('nginx', 33, 'sleep', 'nginx: worker', 0, 2),
+            3: ProcessInfo('bash', 33, 'run', '/bin/bash', 0, 3),
+        }
+        self.times = {
+            1: ProcessCpuTimes(100, 10),
+            2: ProcessCpuTimes(200, 20),
+            3: ProcessCpuTimes(300, 30),
+        }
+        self.host_os.process_infos.side_effect = (
+            lambda: list(self.processes.values()))
+        self.host_os.process_cpu_times.side_effect = (
+            lambda pid: self.times[pid])
+        self.host_os.process_cpu_summaries.side_effect = (
+            lambda uid: [(pid, info.name, self.times[pid])
+                         for pid, info in self.processes.items()
+                         if uid is None or info.uid == uid])
+
+        self.shift = 5
+        self.collector = ProcessCpuTimesCollector([(1, self.shift)],
+                                                  self.host_os)
+
+        self._patcher = patch('zabby.hostos.collectors.monotonic')
+        self.mock_monotonic = self._patcher.start()
+        self.mock_monotonic.return_value = 100.0
+
+    def teardown(self):
+        self._patcher.stop()
+
+    def collect(self):
+        self.mock_monotonic.return_value += 1
+        self.collector._collect()
+
+    def collected_times(self, name=None, uid=None, cmdline=None):
+        times, _ = self.collector.get_times(
+            name, uid, cmdline, 0, self.mock_monotonic.return_value)
+        return times
+
+    def test_returns_none_if_history_is_empty(self):
+        assert_equal(None, self.collected_times('nginx'))
+
+    def test_times_are_counted_from_the_first_sample(self):
+        self.collected_times('nginx')
+        self.collect()
+
+        assert_equal(ProcessCpuTimes(0, 0), self.collected_times('nginx'))
+
+    def test_accumulates_times_of_matching_processes(self):
+        self.collected_times('nginx')
+        self.collect()
+        self.times[1] = ProcessCpuTimes(150, 15)
+        self.times[2] = ProcessCpuTimes(210, 21)
+        self.times[3] = ProcessCpuTimes(1000, 100)
+        self.collect()
+
+        assert_equal(ProcessCpuTimes(60, 6), self.collected_times('nginx'))
+
+    def test_filters_by_uid_and_cmdline(self):
+        self.collected_times(None, 33, 'worker')
+        self.collect()
+        self.times[1] = ProcessCpuTimes(150, 15)
+        self.times[2] = ProcessCpuTimes(210, 21)
+        self.collect()
+
+        assert_equal(ProcessCpuTimes(10, 1),
+                     self.collected_times(None, 33, 'worker'))
+
+    def test_reads_only_stat_of_processes_without_cmdline(self):
+        self.collected_times('nginx', 33)
+        self.collect()
+        self.times[2] = ProcessCpuTimes(210, 21)
+        self.collect()
+
+        assert_equal(ProcessCpuTimes(10, 1),
+                     self.collected_times('nginx', 33))
+        assert_false(self.host_os.process_infos.called)
+
+    def test_exited_processes_do_not_decrease_times(self):
+        self.collected_times()
+        self.collect()
+        self.times[1] = ProcessCpuTimes(150, 15)
+        self.collect()
+        del self.processes[1]
+        self.collect()
+
+        assert_equal(ProcessCpuTimes(50, 5), self.collected_times())
+
+    def test_collects_processes_inside_batch(self):
+        self.collected_times('nginx')
+        self.collected_times('bash')
+        self.collect()
+
+        self.host_os.batch.assert_called_once_with()
+
+    def test_forgets_idle_groups(self):
+        self.collected_times('nginx')
+        self.collect()
+        self.collector._idle_timeout = 0
+        self.collect()
+
+        assert_equal(dict(), self.collector._groups)
+
+    def test_history_is_not_saved(self):
+        self.collected_times('nginx')
+        self.collect()
+
+        assert_equal(dict(), self.collector.snapshot())
+
+
+STATE_FILE = '/tmp/zabby_test_collectors.state'
+
+
+class TestCollectorState():
+    def setup(self):
+        ensure_removed(STATE_FILE)
+
+        self.now = 1000.0
+        self._patcher = patch('zabby.hostos.collectors.monotonic',
+                              lambda: self.now)
+        self._patcher.start()
+
+        self.cpu_times = CpuTimes(*[1000 for _ in CPU_TIMES])
+        self.host_os = Mock()
+        self.host_os.last_read_time.side_effect = lambda: self.now
+        self.host_os.cpu_times.side_effect = lambda cpu_id: self.cpu_times
+        self.host_os.disk_device_stats.side_effect = KeyError
+
+        self.collectors = self._create_collectors()
+        self.collector = self.collectors[0]
+        self.collector.get_times(0, 60)
+        for i in range(120):
+            self.collector._collect()
+            self.now += 1
+
+    def teardown(self):
+        self._patcher.stop()
+        ensure_removed(STATE_FILE)
+
+    def _create_collectors(self):
+        return [CpuTimesCollector([(1, 60), (5, 900)], self.host_os),
+                DiskDeviceStatsCollector([(1, 60)], self.host_os)]
+
+    def _restore(self, max_age=900):
+        save_collector_state(self.collectors, STATE_FILE)
+        restored_collectors = self._create_collectors()
+        restored = load_collector_state(restored_collectors, STATE_FILE,
+                                        max_age)
+        return restored, restored_collectors[0]
+
+    def test_restores_history(self):
+        restored, collector = self._restore()
+
+        assert_true(restored)
+        assert_equal(self.collector.snapshot(), collector.snapshot())
+        assert_equal(set([0]), collector.requested_keys())
+        assert_is_instance(collector.get_times(0, 60), CpuTimes)
+
+    def test_state_is_compact(self):
+        save_collector_state(self.collectors, STATE_FILE)
+        assert_less(os.path.getsize(STATE_FILE), 120 * (8 + 8 * 7) * 1.1)
+
+    def test_does_not_restore_stale_state(self):
+        save_collector_state(self.collectors, STATE_FILE)
+        self.now += 901
+        collectors = self._create_collectors()
+
+        assert_false(load_collector_state(collectors, STATE_FILE, 900))
+        assert_equal(dict(), collectors[0].snapshot())
+
+    def test_does_not_restore_state_saved_before_reboot(self):
+        save_collector_state(self.collectors, STATE_FILE)
+        self.now = 10
+        collectors = self._create_collectors()
+
+        assert_false(load_collector_state(collectors, STATE_FILE, 900))
+
+    def test_does_not_restore_state_saved_with_another_boot_id(self):
+        save_collector_state(self.collectors, STATE_FILE, 'first boot')
+        self.now += 1
+        collectors = self._create_collectors()
+
+        assert_false(load_collector_state(collectors, STATE_FILE, 900,
+                                          'second boot'))
+        assert_true(load_collector_state(collectors, STATE_FILE, 900,
+                                         'first boot'))
+
+    def test_skips_keys_whose_counters_were_reset(self):
+        self.cpu_times = CpuTimes(*[0 for _ in CPU_TIMES])
+        restored, collector = self._restore()
+
+        assert_true(restored)
+        assert_equal(dict(), collector.snapshot())
+
+    def test_skips_keys_whose_fields_have_changed(self):
+        save_collector_state(self.collectors, STATE_FILE)
+        ExtendedCpuTimes = namedtuple('CpuTimes', CPU_TIMES + ['steal'])
+        self.cpu_times = ExtendedCpuTimes(*[1000 for _ in CPU_TIMES + [0]])
+        collectors = self._create_collectors()
+
+        assert_true(load_collector_state(collectors, STATE_FILE, 900))
+        assert_equal(dict(), collectors[0].snapshot())
+
+    def test_ignores_missing_and_malformed_state(self):
+        assert_false(load_collector_state(self.collectors, STATE_FILE, 900))
+
+        write_to_file(STATE_FILE, 'garbage')
+        assert_false(load_collector_state(self.collectors, STATE_FILE, 900))
+
+    def test_host_os_saves_state_when_collectors_are_stopped(self):
+        host_os = HostOS()
+        host_os._collectors.extend(self.collectors)
+        host_os.persist_collectors(STATE_FILE)
+
+        with patch('zabby.hostos.CollectorScheduler'):
+            host_os.start_collectors()
+            host_os.stop_collectors()
+
+        assert_true(os.path.exists(STATE_FILE))
@@ -0,0 +1,217 @@
+import threading
+
+from mock import patch
+from nose.tools import assert_equal, assert_raises
+
+from zabby.hostos import HostOS, batched
+
+
+class CountingHostOS(HostOS):
+    def __init__(self):
+        super(CountingHostOS, self).__init__()
+        self.reads = 0
+        self.reading = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    @batched
+    def stats(self, argument=None):
+        self.reading.set()
+        self.release.wait()
+        self.reads += 1
+        if self.error is not None:
+            raise self.error
+        return self.reads
+
+    @batched
+    def infos(self):
+        for i in range(3):
+            yield i
+
+
+class TestBatch():
+    def setup(self):
+        self.host_os = CountingHostOS()
+
+    def call_in_batch(self):
+        with self.host_os.batch():
+            self.host_os.stats()
+            self.host_os.stats()
+
+    def test_reads_every_time_outside_of_batch(self):
+        self.host_os.stats()
+        self.host_os.stats()
+
+        assert_equal(2, self.host_os.reads)
+
+    def test_reads_once_inside_batch(self):
+        with self.host_os.batch():
+            self.host_os.stats()
+            self.host_os.stats()
+
+        assert_equal(1, self.host_os.reads)
+
+    def test_reads_once_for_every_argument(self):
+        with self.host_os.batch():
+            self.host_os.stats('a')
+            self.host_os.stats('a')
+            self.host_os.stats('b')
+
+        assert_equal(2, self.host_os.reads)
+
+    def test_results_are_forgotten_after_batch(self):
+        with self.host_os.batch():
+            self.host_os.stats()
+        with self.host_os.batch():
+            self.host_os.stats()
+
+        assert_equal(2, self.host_os.reads)
+
+    def test_results_are_kept_until_outermost_batch_exits(self):
+        with self.host_os.batch():
+            with self.host_os.batch():
+                self.host_os.stats()
+            self.host_os.stats()
+
+        assert_equal(1, self.host_os.reads)
+
+    def test_generators_can_be_iterated_several_times(self):
+        with self.host_os.batch():
+            assert_equal([0, 1, 2], list(self.host_os.infos()))
+            assert_equal([0, 1, 2], list(self.host_os.infos()))
+
+    def test_results_are_not_shared_with_other_threads(self):
+        with self.host_os.batch():
+            self.host_os.stats()
+            other = threading.Thread(target=self.host_os.stats)
+            other.start()
+            other.join()
+            other_batch = threading.Thread(target=self.call_in_batch)
+            other_batch.start()
+            other_batch.join()
+            self.host_os.stats()
+
+        assert_equal(3, self.host_os.reads)
+
+    def test_batch_of_other_thread_does_not_keep_results(self):
+        entered = threading.Event()
+        leave = threading.Event()
+
+        def hold_batch():
+            with self.host_os.batch():
+                entered.set()
+                leave.wait()
+
+        holder = threading.Thread(target=hold_batch)
+        holder.start()
+        entered.wait()
+        try:
+            with self.host_os.batch():
+                self.host_os.stats()
+            with self.host_os.batch():
+                self.host_os.stats()
+        finally:
+            leave.set()
+            holder.join()
+
+        assert_equal(2, self.host_os.reads)
+
+
+class TestCoalescing():
+    def setup(self):
+        self.host_os = CountingHostOS()
+        self.results = list()
+        self.errors = list()
+
+    def call_stats(self):
+        try:
+            self.results.append(self.host_os.stats())
+        except ValueError as e:
+            self.errors.append(e)
+
+    def call_concurrently(self, number_of_callers):
+        self.host_os.release.clear()
+        leader = threading.Thread(target=self.call_stats)
+        leader.start()
+        self.host_os.reading.wait()
+
+        followers = [threading.Thread(target=self.call_stats)
+                     for _ in range(number_of_callers - 1)]
+        for follower in followers:
+            follower.start()
+        while (self.host_os.read_stats().get('stats', (0, 0))[1] <
+               len(followers)):
+            threading.Event().wait(0.001)
+
+        self.host_os.release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+    def test_concurrent_callers_share_one_read(self):
+        self.call_concurrently(4)
+
+        assert_equal(1, self.host_os.reads)
+        assert_equal([1] * 4, self.results)
+
+    def test_concurrent_callers_receive_exception_of_shared_read(self):
+        self.host_os.error = ValueError()
+
+        self.call_concurrently(3)
+
+        assert_equal(3, len(self.errors))
+
+    def test_reads_every_time_if_ttl_is_not_set(self):
+        self.host_os.stats()
+        self.host_os.stats()
+
+        assert_equal(2, self.host_os.reads)
+
+    def test_shares_result_for_ttl(self):
+        self.host_os.set_coalescing_ttl(1)
+
+        with patch('zabby.hostos.monotonic', return_value=0):
+            self.host_os.stats()
+        with patch('zabby.hostos.monotonic', return_value=0.5):
+            self.host_os.stats()
+        with patch('zabby.hostos.monotonic', return_value=1.5):
+            self.host_os.stats()
+
+        assert_equal(2, self.host_os.reads)
+
+    def test_last_read_time_is_time_of_shared_read(self):
+        self.host_os.set_coalescing_ttl(1)
+
+        with patch('zabby.hostos.monotonic', return_value=10):
+            self.host_os.stats()
+        with patch('zabby.hostos.monotonic', return_value=10.5):
+            self.host_os.stats()
+            assert_equal(10, self.host_os.last_read_time())
+
+    def test_expired_results_are_forgotten(self):
+        self.host_os.set_coalescing_ttl(1)
+
+        with patch('zabby.hostos.monotonic', return_value=10):
+            self.host_os.stats('a')
+        with patch('zabby.hostos.monotonic', return_value=11):
+            self.host_os.stats('b')
+
+        assert_equal([('stats', ('b', ))],
+                     list(self.host_os._recent_results.keys()))
+
+    def test_failed_reads_are_not_shared_after_they_complete(self):
+        self.host_os.set_coalescing_ttl(1)
+        self.host_os.error = ValueError()
+        assert_raises(ValueError, self.host_os.stats)
+
+        self.host_os.error = None
+
+        assert_equal(2, self.host_os.stats())
+
+    def test_read_stats_count_reads_and_saved_reads(self):
+        self.host_os.set_coalescing_ttl(1)
+
+        for _ in range(3):
+            self.host_os.stats()
+
+        assert_equal({'stats': (1, 2)}, self.host_os.read_stats())
@@ -1,4 +1,9 @@
 import collections
+import os
+import shutil
+import socket
+import tempfile
+import threading
 import time
 
 from mock import patch
@@ -7,8 +12,10 @@ from nose.tools import assert_raises, assert_equal
 
 from zabby.core.exceptions import OperatingSystemError
 from zabby.core.six import integer_types, string_types
+from zabby.core.utils import monotonic
 from zabby.hostos import (detect_host_os, NetworkInterfaceInfo, ProcessInfo,
-                          DiskDeviceStats, CpuTimes, SystemLoad, SwapInfo)
+                          DiskDeviceStats, CpuTimes, SystemLoad, SwapInfo,
+                          MountInfo, NetCounter, TCP_STATES, ProcessCpuTimes)
 from zabby.tests import (assert_is_instance, assert_less, assert_in,
                          assert_less_equal, assert_not_in)
 
@@ -85,6 +92,30 @@ class TestLinux():
         mock_listdir.return_value = ['0', '1']
         assert_equal(1, len(list(self.linux.process_infos())))
 
+    def test_process_memory_of_current_process(self):
+        for memory_type in self.linux.AVAILABLE_PROCESS_MEMORY_TYPES:
+            used_memory = self.linux.process_memory(os.getpid(), memory_type)
+            assert_less(0, used_memory)
+
+    def test_process_cpu_times_of_current_process(self):
+        times = self.linux.process_cpu_times(os.getpid())
+
+        assert_is_instance(times, ProcessCpuTimes)
+
+    def test_process_summaries_contain_current_process(self):
+        name = [process_info.name
+                for process_info in self.linux.process_infos()
+                if process_info.pid == os.getpid()][0]
+
+        assert_in((name, 'run'), self.linux.process_summaries(os.getuid()))
+
+    def test_process_cpu_summaries_contain_current_process(self):
+        pids = [pid for pid, _, times
+                in self.linux.process_cpu_summaries(os.getuid())
+                if isinstance(times, ProcessCpuTimes)]
+
+        assert_in(os.getpid(), pids)
+
     def test_uid_returns_integer(self):
         uid = self.linux.uid('root')
 
@@ -147,6 +178,11 @@ class TestLinux():
         uptime = self.linux.uptime()
         assert_is_instance(uptime, integer_types)
 
+    def test_boot_id_does_not_change(self):
+        boot_id = self.linux.boot_id()
+        assert_is_instance(boot_id, string_types)
+        assert_equal(boot_id, self.linux.boot_id())
+
     def test_max_number_of_running_processes(self):
         maxproc = self.linux.max_number_of_running_processes()
         assert_is_instance(maxproc, integer_types)
@@ -181,6 +217,400 @@ class TestLinux():
         swap_devices = self.linux.swap_device_names()
         assert_not_in(swap_file_path.split('/')[-1], swap_devices)
 
+
+@attr(os='linux')
+class TestLinuxStatvfs():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        self.linux = Linux()
+        self.linux.NETWORK_STATVFS_TIMEOUT = 0.05
+        self.release = threading.Event()
+
+    def teardown(self):
+        self.release.set()
+
+    @patch('zabby.hostos.linux.os.statvfs', wraps=os.statvfs)
+    def test_fs_size_and_fs_inodes_share_statvfs(self, mock_statvfs):
+        self.linux.fs_size(PRESENT_FILESYSTEM)
+        self.linux.fs_inodes(PRESENT_FILESYSTEM)
+
+        assert_equal(1, mock_statvfs.call_count)
+
+    def test_filesystem_type_of_root_is_known(self):
+        assert_is_instance(self.linux._filesystem_type('/'), string_types)
+
+    def test_filesystem_type_of_not_mount_point_is_none(self):
+        assert_equal(None, self.linux._filesystem_type('/not/mounted'))
+
+    def test_statvfs_of_network_filesystem_is_called_in_thread(self):
+        threads = list()
+        statvfs = os.statvfs
+
+        def recording_statvfs(filesystem):
+            threads.append(threading.current_thread())
+            return statvfs(filesystem)
+
+        with patch.object(self.linux, '_filesystem_type',
+                          return_value='nfs'):
+            with patch('zabby.hostos.linux.os.statvfs', recording_statvfs):
+                free, total = self.linux.fs_size(PRESENT_FILESYSTEM)
+
+        assert_less_equal(free, total)
+        assert_equal(1, len(threads))
+        assert threads[0] is not threading.current_thread()
+
+    def test_hung_network_filesystem_raises_exception(self):
+        def hung_statvfs(filesystem):
+            self.release.wait()
+
+        with patch.object(self.linux, '_filesystem_type',
+                          return_value='nfs'):
+            with patch('zabby.hostos.linux.os.statvfs', hung_statvfs):
+                assert_raises(OperatingSystemError, self.linux.fs_size,
+                              PRESENT_FILESYSTEM)
+
+    def test_hung_network_filesystem_is_not_called_again(self):
+        calls = []
+
+        def hung_statvfs(filesystem):
+            calls.append(filesystem)
+            self.release.wait()
+
+        with patch.object(self.linux, '_filesystem_type',
+                          return_value='nfs'):
+            with patch('zabby.hostos.linux.os.statvfs', hung_statvfs):
+                for _ in range(2):
+                    assert_raises(OperatingSystemError, self.linux.fs_size,
+                                  PRESENT_FILESYSTEM)
+
+        assert_equal(1, len(calls))
+
+    def test_network_filesystem_errors_are_propagated(self):
+        with patch.object(self.linux, '_filesystem_type',
+                          return_value='nfs'):
+            assert_raises(OSError, self.linux.fs_size, '/not/existing')
+
+
+@attr(os='linux')
+class TestLinuxListeningPorts():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        self.linux = Linux()
+        self.sockets = list()
+
+    def teardown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def bound_socket(self, socket_type):
+        sock = socket.socket(socket.AF_INET, socket_type)
+        self.sockets.append(sock)
+        sock.bind(('127.0.0.1', 0))
+        return sock
+
+    def test_listening_tcp_port_is_found(self):
+        sock = self.bound_socket(socket.SOCK_STREAM)
+        sock.listen(1)
+
+        assert_in(sock.getsockname()[1], self.linux.listening_ports('tcp'))
+
+    def test_not_listening_tcp_port_is_not_found(self):
+        sock = self.bound_socket(socket.SOCK_STREAM)
+
+        assert_not_in(sock.getsockname()[1],
+                      self.linux.listening_ports('tcp'))
+
+    def test_bound_udp_port_is_found(self):
+        sock = self.bound_socket(socket.SOCK_DGRAM)
+
+        assert_in(sock.getsockname()[1], self.linux.listening_ports('udp'))
+
+    def test_ports_are_cached(self):
+        ports = self.linux.listening_ports('tcp')
+
+        assert self.linux.listening_ports('tcp') is ports
+
+    def test_listening_socket_is_counted(self):
+        sock = self.bound_socket(socket.SOCK_STREAM)
+        sock.listen(1)
+
+        states = self.linux.socket_states('tcp')
+        assert_less_equal(1, states['listen'])
+        for state in states:
+            assert_in(state, TCP_STATES)
+
+
+@attr(os='linux')
+class TestLinuxNetStatistics():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        self.linux = Linux()
+
+    def test_net_counters_contain_tcp_counters(self):
+        counters = self.linux.net_counters()
+
+        assert_is_instance(counters['Tcp']['RetransSegs'], integer_types)
+        assert_is_instance(counters['Ip']['InReceives'], integer_types)
+
+    def test_socket_stats_contain_tcp_fields(self):
+        stats = self.linux.socket_stats()
+
+        assert_is_instance(stats['TCP']['inuse'], integer_types)
+        assert_is_instance(stats['sockets']['used'], integer_types)
+
+
+PROCESS_STATUS = [
+    'Name:\tnginx: worker\n',
+    'Umask:\t0022\n',
+    'State:\tR (running)\n',
+    'Uid:\t33\t34\t34\t34\n',
+    'VmSize:\t    2640 kB\n',
+]
+
+
+@attr(os='linux')
+class TestLinuxProcessStatus():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        self.proc_root = tempfile.mkdtemp()
+        self.linux = Linux(proc_root=self.proc_root)
+
+    def teardown(self):
+        shutil.rmtree(self.proc_root)
+
+    def add_process(self, pid, status, command_line, flags=0):
+        process_directory = os.path.join(self.proc_root, str(pid))
+        os.mkdir(process_directory)
+        with open(os.path.join(process_directory, 'status'), 'w') as f:
+            f.writelines(status)
+        with open(os.path.join(process_directory, 'cmdline'), 'w') as f:
+            f.write(command_line)
+        with open(os.path.join(process_directory, 'stat'), 'w') as f:
+            f.write('{0} (a (b) c) Z 1 {0} {0} 0 -1 {1} 0 0 0 0 {2} {3}\n'
+                    .format(pid, flags, self.linux.CLOCK_TICKS,
+                            2 * self.linux.CLOCK_TICKS))
+
+    def test_parses_status(self):
+        from zabby.hostos.linux import _parse_process_status
+
+        assert_equal(('nginx: worker', 33, 'run', 2640 * 1024),
+                     _parse_process_status(PROCESS_STATUS))
+
+    def test_stops_parsing_after_vm_size(self):
+        from zabby.hostos.linux import _parse_process_status
+
+        lines = iter(PROCESS_STATUS + ['VmLck:\t0 kB\n'])
+        _parse_process_status(lines)
+
+        assert_equal(['VmLck:\t0 kB\n'], list(lines))
+
+    def test_used_memory_is_0_without_vm_size(self):
+        from zabby.hostos.linux import _parse_process_status
+
+        assert_equal(0, _parse_process_status(PROCESS_STATUS[:-1])[3])
+
+    def test_process_infos_are_read_from_proc_root(self):
+        self.add_process(42, PROCESS_STATUS, 'nginx: worker\0')
+        self.add_process(43, PROCESS_STATUS, '')
+
+        assert_equal(
+            [ProcessInfo('nginx: worker', 33, 'run', 'nginx: worker',
+                         2640 * 1024, 42)],
+            list(self.linux.process_infos()))
+
+    def test_process_summaries_skip_kernel_threads(self):
+        from zabby.hostos.linux import PF_KTHREAD
+
+        self.add_process(42, PROCESS_STATUS, '')
+        self.add_process(43, PROCESS_STATUS, '', PF_KTHREAD)
+
+        assert_equal([('a (b) c', 'zomb')],
+                     list(self.linux.process_summaries()))
+
+    def test_process_summaries_are_filtered_by_owner(self):
+        self.add_process(42, PROCESS_STATUS, '')
+
+        assert_equal(1, len(list(self.linux.process_summaries(os.getuid()))))
+        assert_equal(0, len(list(self.linux.process_summaries(
+            os.getuid() + 1))))
+
+    def test_process_cpu_summaries_contain_cpu_times_in_milliseconds(self):
+        self.add_process(42, PROCESS_STATUS, '')
+
+        assert_equal([(42, 'a (b) c', ProcessCpuTimes(1000, 2000))],
+                     list(self.linux.process_cpu_summaries(os.getuid())))
+
+    def test_parallel_walker_returns_the_same_processes(self):
+        for pid in range(1, 21):
+            self.add_process(pid, PROCESS_STATUS, 'worker {0}'.format(pid))
+        sequential = list(self.linux.process_infos())
+
+        self.linux.PROCESS_SHARD_SIZE = 3
+        self.linux.set_process_walker_workers(4)
+        parallel = list(self.linux.process_infos())
+
+        assert_equal(20, len(parallel))
+        assert_equal(sequential, parallel)
+        assert self.linux._process_walker is not None
+
+    def test_walker_pool_is_recreated_when_workers_change(self):
+        self.linux.set_process_walker_workers(2)
+        pool = self.linux._process_walker_pool()
+        assert self.linux._process_walker_pool() is pool
+
+        self.linux.set_process_walker_workers(3)
+        assert self.linux._process_walker_pool() is not pool
+
+        self.linux.set_process_walker_workers(0)
+        assert self.linux._process_walker_pool() is None
+
+
+def test_process_info_has_no_dict():
+    process_info = ProcessInfo('bash', 0, 'run', '/bin/bash', 0, 1)
+
+    assert not hasattr(process_info, '__dict__')
+    assert_equal(ProcessInfo('bash', 0, 'run', '/bin/bash', 0, 1),
+                 process_info)
+
+
+@attr(os='linux')
+class TestLinuxPasswdCache():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        fd, self.passwd_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('root:x:0:0::/root:/bin/sh\n')
+        self.linux = Linux()
+        self.linux.PASSWD_FILE = self.passwd_file
+
+    def teardown(self):
+        os.remove(self.passwd_file)
+
+    def test_username_of_root(self):
+        assert_equal('root', self.linux.username(0))
+
+    def test_uid_is_cached(self):
+        with patch.object(self.linux, '_passwd',
+                          wraps=self.linux._passwd) as mock_passwd:
+            self.linux.uid('root')
+            self.linux.uid('root')
+
+        assert_equal(1, mock_passwd.call_count)
+
+    def test_missing_users_are_cached(self):
+        with patch.object(self.linux, '_passwd',
+                          wraps=self.linux._passwd) as mock_passwd:
+            for _ in range(2):
+                assert_raises(OperatingSystemError, self.linux.uid,
+                              'missing user')
+
+        assert_equal(1, mock_passwd.call_count)
+
+    def test_caches_are_forgotten_when_passwd_changes(self):
+        self.linux.uid('root')
+        self.linux.username(0)
+        with open(self.passwd_file, 'a') as f:
+            f.write('user:x:1000:1000::/home/user:/bin/sh\n')
+
+        with patch.object(self.linux, '_passwd',
+                          wraps=self.linux._passwd) as mock_passwd:
+            with patch.object(self.linux, '_passwd_by_uid',
+                              wraps=self.linux._passwd_by_uid) as mock_by_uid:
+                self.linux.uid('root')
+                self.linux.username(0)
+
+        assert_equal(1, mock_passwd.call_count)
+        assert_equal(1, mock_by_uid.call_count)
+
+    def test_expired_user_is_returned_while_it_is_looked_up_again(self):
+        from zabby.hostos.linux import PasswdEntry
+
+        self.linux.uid('root')
+        looked_up = threading.Event()
+        release = threading.Event()
+
+        def slow_passwd(username):
+            looked_up.set()
+            release.wait()
+            return PasswdEntry(b'root', 1)
+
+        expired = monotonic() + self.linux.PASSWD_CACHE_TTL + 1
+        with patch('zabby.hostos.linux.monotonic', return_value=expired):
+            with patch.object(self.linux, '_passwd', slow_passwd):
+                assert_equal(0, self.linux.uid('root'))
+                looked_up.wait(5.0)
+                release.set()
+                for _ in range(500):
+                    if not self.linux._passwd_refreshing:
+                        break
+                    time.sleep(0.01)
+
+                assert_equal(1, self.linux.uid('root'))
+
+    def test_looks_users_up_without_static_buffer(self):
+        names = list()
+
+        def look_up():
+            for _ in range(100):
+                names.append(self.linux._passwd_by_uid(0).name)
+
+        threads = [threading.Thread(target=look_up) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_equal([b'root'] * 400, names)
+
+    def test_process_owners_contain_current_user(self):
+        assert_in(os.getuid(), self.linux.process_owners())
+
+
+MOUNTINFO = [
+    '22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n',
+    '23 22 0:5 / /proc rw,nosuid - proc proc rw\n',
+    '24 22 0:40 / /mnt/with\\040space rw - nfs4 host:/export rw\n',
+]
+
+
+@attr(os='linux')
+class TestLinuxMounts():
+    def setup(self):
+        from zabby.hostos.linux import Linux
+
+        self.linux = Linux()
+
+    def test_parses_mountinfo(self):
+        from zabby.hostos.linux import _parse_mountinfo
+
+        mounts = list(_parse_mountinfo(MOUNTINFO))
+
+        assert_equal([MountInfo('/', 'ext4', '/dev/sda1'),
+                      MountInfo('/proc', 'proc', 'proc'),
+                      MountInfo('/mnt/with space', 'nfs4', 'host:/export')],
+                     mounts)
+
+    def test_mounts_contain_root(self):
+        assert_in('/', [mount.mount_point for mount in self.linux.mounts()])
+
+    def test_mounts_are_not_parsed_again_while_not_changed(self):
+        mounts = self.linux.mounts()
+
+        assert self.linux.mounts() is mounts
+
+    def test_mounts_are_parsed_again_when_poll_signals_change(self):
+        mounts = self.linux.mounts()
+
+        with patch.object(self.linux, '_mountinfo_poll') as mock_poll:
+            mock_poll.poll.return_value = [(0, 0)]
+            assert self.linux.mounts() is not mounts
+
+
 @attr(os='linux')
 class TestLinuxCollectors():
     def setup(self):
@@ -189,19 +619,40 @@ class TestLinuxCollectors():
         self.linux = Linux()
 
     def test_disk_device_collector_collection(self):
+        device = self.linux.disk_device_names().pop()
+        self.linux.disk_device_stats_shifted(device, 60, monotonic())
+
         self.linux._disk_device_stats_collector._collect()
 
-        devices = self.linux.disk_device_names()
-        now = int(time.time())
-        (stats, timestamp) = self.linux.disk_device_stats_shifted(devices.pop(),
-                                                                  60, now)
+        (stats, timestamp) = self.linux.disk_device_stats_shifted(device, 60,
+                                                                  monotonic())
         assert_is_instance(stats, DiskDeviceStats)
 
     def test_cpu_times_collector_collection(self):
-        self.linux._cpu_times_collector._collect()
-
         cpu_id = list(range(self.linux.cpu_count())).pop()
+        self.linux.cpu_times_shifted(cpu_id, 60)
+
+        self.linux._cpu_times_collector._collect()
 
         times = self.linux._cpu_times_collector.get_times(cpu_id, 60)
 
         assert_is_instance(times, CpuTimes)
+
+    def test_net_counters_collector_collection(self):
+        self.linux.net_counter_shifted('Tcp', 'InSegs', 60, monotonic())
+
+        self.linux._net_counters_collector._collect()
+
+        (counter, timestamp) = self.linux.net_counter_shifted('Tcp', 'InSegs',
+                                                              60, monotonic())
+        assert_is_instance(counter, NetCounter)
+
+    def test_process_cpu_times_collector_collection(self):
+        self.linux.process_cpu_times_shifted(None, os.getuid(), None, 60,
+                                             monotonic())
+
+        self.linux._process_cpu_times_collector._collect()
+
+        (times, timestamp) = self.linux.process_cpu_times_shifted(
+            None, os.getuid(), None, 60, monotonic())
+        assert_is_instance(times, ProcessCpuTimes)
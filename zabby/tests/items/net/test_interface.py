@@ -1,5 +1,7 @@
+import json
+
 from mock import Mock
-from nose.tools import assert_raises, nottest, istest
+from nose.tools import assert_raises, assert_equal, nottest, istest
 from zabby.core.six import integer_types
 from zabby.hostos import NetworkInterfaceInfo
 from zabby.tests import assert_is_instance
@@ -49,3 +51,28 @@ class TestOutgoing(TestNetDirection):
     def setup(self):
         self.setup_host_os()
         self.function_under_test = interface.outgoing
+
+
+class TestDiscovery():
+    def setup(self):
+        interface._discoveries.clear()
+        self.host_os = Mock()
+        self.host_os.net_interface_names.return_value = set(
+            ['lo', 'eth0', 'veth1a2b'])
+
+    def discovered(self, include='', exclude=''):
+        discovery = json.loads(interface.discovery(include, exclude,
+                                                   host_os=self.host_os))
+        return [entry['{#IFNAME}'] for entry in discovery['data']]
+
+    def test_returns_all_interfaces(self):
+        assert_equal(['eth0', 'lo', 'veth1a2b'], self.discovered())
+
+    def test_filters_interfaces(self):
+        assert_equal(['eth0'], self.discovered(exclude='lo|veth.*'))
+
+    def test_json_is_reused_while_interfaces_do_not_change(self):
+        first = interface.discovery(host_os=self.host_os)
+        second = interface.discovery(host_os=self.host_os)
+
+        assert first is second
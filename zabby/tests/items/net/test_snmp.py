@@ -0,0 +1,74 @@
+from mock import Mock
+from nose.tools import assert_equal, assert_raises
+from zabby.core.exceptions import WrongArgumentError
+
+from zabby.hostos import NetCounter
+from zabby.items.net import snmp
+
+
+class TestCounter():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.net_counters.return_value = {
+            'Tcp': {'RetransSegs': 100},
+        }
+
+    def test_returns_counter_value(self):
+        assert_equal(100, snmp.counter('Tcp', 'RetransSegs', self.host_os))
+
+    def test_raises_exception_for_unknown_group(self):
+        assert_raises(WrongArgumentError, snmp.counter, 'Udp', 'RetransSegs',
+                      self.host_os)
+
+    def test_raises_exception_for_unknown_counter(self):
+        assert_raises(WrongArgumentError, snmp.counter, 'Tcp', 'wrong',
+                      self.host_os)
+
+
+class TestRate():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.last_read_time.return_value = 100.0
+        self.host_os.net_counters.return_value = {
+            'Tcp': {'RetransSegs': 100},
+        }
+
+    def test_returns_increase_per_second(self):
+        self.host_os.net_counter_shifted.return_value = (NetCounter(40), 40.0)
+
+        assert_equal(1.0, snmp.rate('Tcp', 'RetransSegs', 'avg1',
+                                    self.host_os))
+        self.host_os.net_counter_shifted.assert_called_once_with(
+            'Tcp', 'RetransSegs', 60, 100.0)
+
+    def test_returns_0_if_nothing_was_collected_yet(self):
+        self.host_os.net_counter_shifted.return_value = (None, None)
+
+        assert_equal(0.0, snmp.rate('Tcp', 'RetransSegs', 'avg1',
+                                    self.host_os))
+
+    def test_returns_0_if_counter_was_reset(self):
+        self.host_os.net_counter_shifted.return_value = (NetCounter(200),
+                                                         40.0)
+
+        assert_equal(0.0, snmp.rate('Tcp', 'RetransSegs', 'avg1',
+                                    self.host_os))
+
+    def test_raises_exception_for_unknown_mode(self):
+        assert_raises(WrongArgumentError, snmp.rate, 'Tcp', 'RetransSegs',
+                      'wrong', self.host_os)
+
+
+class TestSockstat():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.socket_stats.return_value = {
+            'TCP': {'inuse': 5, 'mem': 1},
+        }
+
+    def test_returns_field_value(self):
+        assert_equal(1, snmp.sockstat('TCP', 'mem', self.host_os))
+
+    def test_raises_exception_for_unknown_field(self):
+        assert_raises(WrongArgumentError, snmp.sockstat, 'TCP', 'wrong',
+                      self.host_os)
@@ -1,48 +1,136 @@
-from mock import patch
-from nose.tools import assert_true, assert_false, assert_raises
+from nose.tools import (assert_false, assert_raises,
+                        assert_equal)
+from mock import Mock
 from zabby.core.exceptions import WrongArgumentError
 
-from zabby.core.six import b
 from zabby.items.net import tcp
+from zabby.tests import StandInServer, closed_port, assert_less
 
 
-class TestServiceSSH():
-    def setup(self):
-        self._patcher_tcp_communication = patch(
-            'zabby.items.net.tcp.tcp_communication')
-        self.mock_tcp_communication = self._patcher_tcp_communication.start()
+def greeting(message):
+    def handle(conn):
+        conn.sendall(message)
+        conn.recv(4096)
+
+    return handle
+
+
+def response(message):
+    def handle(conn):
+        while conn.recv(4096):
+            conn.sendall(message)
+
+    return handle
+
+
+SERVERS = {
+    'ssh': greeting(b'SSH-2.0-OpenSSH_6.0p1 Debian-4\r\n'),
+    'smtp': greeting(b'220 mail.example.com ESMTP Postfix\r\n'),
+    'ftp': greeting(b'220 (vsFTPd 3.0.3)\r\n'),
+    'pop': greeting(b'+OK Dovecot ready.\r\n'),
+    'imap': greeting(b'* OK [CAPABILITY IMAP4rev1] Dovecot ready.\r\n'),
+    'nntp': greeting(b'200 news.example.com InterNetNews server ready\r\n'),
+    'http': response(b'HTTP/1.0 200 OK\r\nContent-Length: 0\r\n\r\n'),
+    'redis': response(b'+PONG\r\n'),
+    'memcached': response(b'VERSION 1.6.9\r\n'),
+    'ldap': response(b'\x30\x0c\x02\x01\x01\x61\x07\x0a\x01\x00\x04\x00'
+                     b'\x04\x00'),
+    'tcp': greeting(b''),
+}
+
 
-        self.service_name = 'ssh'
+class TestService():
+    def setup(self):
+        self.servers = list()
 
     def teardown(self):
-        self._patcher_tcp_communication.stop()
+        for server in self.servers:
+            server.close()
+
+    def serve(self, handle):
+        server = StandInServer(handle)
+        self.servers.append(server)
+        return server
 
-    def test_running_if_server_message_matches_expectations(self):
-        self.mock_tcp_communication.return_value = [
-            b('SSH-2.0-OpenSSH_6.0p1 Debian-4\n')]
-        running = bool(tcp.service(self.service_name))
-        assert_true(running)
+    def test_every_service_is_recognized(self):
+        for service_name, handle in SERVERS.items():
+            server = self.serve(handle)
+            running = tcp.service(service_name, port=server.port)
+            assert_equal(1, running, service_name)
 
     def test_not_running_if_server_message_does_not_match_expectations(self):
-        self.mock_tcp_communication.return_value = [b('SSH\n')]
-        running = bool(tcp.service(self.service_name))
-        assert_false(running)
+        server = self.serve(greeting(b'SSH\n'))
+
+        assert_false(tcp.service('ssh', port=server.port, timeout=0.2))
+
+    def test_not_running_if_service_expects_different_protocol(self):
+        server = self.serve(SERVERS['smtp'])
+
+        assert_false(tcp.service('redis', port=server.port, timeout=0.2))
+
+    def test_not_running_if_port_is_closed(self):
+        assert_false(tcp.service('ssh', port=closed_port()))
+
+    def test_perf_returns_response_time(self):
+        server = self.serve(SERVERS['redis'])
+
+        elapsed = tcp.service_perf('redis', port=server.port)
 
-    def test_not_running_if_exception_occurs(self):
-        self.mock_tcp_communication.side_effect = IOError
-        running = bool(tcp.service(self.service_name))
-        assert_false(running)
+        assert_less(0, elapsed)
+        assert_less(elapsed, 1.0)
+
+    def test_perf_returns_zero_if_service_is_not_running(self):
+        assert_equal(0, tcp.service_perf('ssh', port=closed_port()))
+
+    def test_raises_exception_for_unknown_service(self):
+        assert_raises(WrongArgumentError, tcp.service, 'unknown')
+
+    def test_raises_exception_if_port_of_tcp_service_is_missing(self):
+        assert_raises(WrongArgumentError, tcp.service, 'tcp')
 
     def test_raises_exception_for_unknown_port(self):
-        assert_raises(WrongArgumentError, tcp.service, self.service_name,
-                      port='wrong')
-        assert_raises(WrongArgumentError, tcp.service, self.service_name,
-                      port='-1')
-        assert_raises(WrongArgumentError, tcp.service, self.service_name,
-                      port='65636')
+        assert_raises(WrongArgumentError, tcp.service, 'ssh', port='wrong')
+        assert_raises(WrongArgumentError, tcp.service, 'ssh', port='-1')
+        assert_raises(WrongArgumentError, tcp.service, 'ssh', port='65636')
 
     def test_raises_exception_for_unknown_timeout(self):
-        assert_raises(WrongArgumentError, tcp.service, self.service_name,
+        assert_raises(WrongArgumentError, tcp.service, 'ssh',
                       timeout='wrong')
-        assert_raises(WrongArgumentError, tcp.service, self.service_name,
+        assert_raises(WrongArgumentError, tcp.service, 'ssh',
                       timeout='-0.1')
+
+
+class TestListen():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.listening_ports.return_value = frozenset([22, 80])
+
+    def test_returns_1_if_port_is_listening(self):
+        assert_equal(1, tcp.listen('22', self.host_os))
+        self.host_os.listening_ports.assert_called_once_with('tcp')
+
+    def test_returns_0_if_port_is_not_listening(self):
+        assert_equal(0, tcp.listen('23', self.host_os))
+
+    def test_raises_exception_for_invalid_port(self):
+        assert_raises(WrongArgumentError, tcp.listen, 'wrong', self.host_os)
+
+
+class TestCount():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.socket_states.return_value = {'established': 3,
+                                                   'listen': 2}
+
+    def test_returns_number_of_sockets_in_state(self):
+        assert_equal(3, tcp.count('established', self.host_os))
+        self.host_os.socket_states.assert_called_once_with('tcp')
+
+    def test_returns_0_for_state_without_sockets(self):
+        assert_equal(0, tcp.count('time_wait', self.host_os))
+
+    def test_returns_number_of_all_sockets(self):
+        assert_equal(5, tcp.count('all', self.host_os))
+
+    def test_raises_exception_for_unknown_state(self):
+        assert_raises(WrongArgumentError, tcp.count, 'wrong', self.host_os)
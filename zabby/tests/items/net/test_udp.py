@@ -0,0 +1,21 @@
+from mock import Mock
+from nose.tools import assert_equal, assert_raises
+from zabby.core.exceptions import WrongArgumentError
+
+from zabby.items.net import udp
+
+
+class TestListen():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.listening_ports.return_value = frozenset([53])
+
+    def test_returns_1_if_port_is_bound(self):
+        assert_equal(1, udp.listen('53', self.host_os))
+        self.host_os.listening_ports.assert_called_once_with('udp')
+
+    def test_returns_0_if_port_is_not_bound(self):
+        assert_equal(0, udp.listen('54', self.host_os))
+
+    def test_raises_exception_for_invalid_port(self):
+        assert_raises(WrongArgumentError, udp.listen, '65536', self.host_os)
@@ -1,3 +1,5 @@
+import json
+
 from mock import Mock
 from nose.tools import assert_raises, assert_equal
 from zabby.core.exceptions import WrongArgumentError
@@ -65,3 +67,17 @@ class TestLoad():
         per_cpu_load = cpu.load('percpu', host_os=self.host_os)
 
         assert_less(per_cpu_load, total_load)
+
+
+class TestDiscovery():
+    def setup(self):
+        cpu._discoveries.clear()
+        self.host_os = Mock()
+        self.host_os.cpu_count.return_value = 2
+
+    def test_returns_all_cpus(self):
+        discovery = json.loads(cpu.discovery(host_os=self.host_os))
+
+        assert_equal([{'{#CPU.NUMBER}': 0, '{#CPU.STATUS}': 'online'},
+                      {'{#CPU.NUMBER}': 1, '{#CPU.STATUS}': 'online'}],
+                     discovery['data'])
@@ -1,8 +1,10 @@
-from mock import Mock
+import json
+
+from mock import Mock, patch
 from nose.tools import assert_raises, assert_equal
 from zabby.core.exceptions import WrongArgumentError, OperatingSystemError
 
-from zabby.hostos import ProcessInfo
+from zabby.hostos import ProcessInfo, ProcessCpuTimes
 from zabby.items import proc
 from zabby.tests import assert_greater
 
@@ -20,10 +22,14 @@ class TestNum():
 
         self.processes = [
             ProcessInfo(PROCESS_NAME, 0, PROCESS_STATE,
-                        PROCESS_COMMAND_LINE, 0),
-            ProcessInfo('bash', PROCESS_UID, 'run', '/bin/bash', 0),
+                        PROCESS_COMMAND_LINE, 0, 1),
+            ProcessInfo('bash', PROCESS_UID, 'run', '/bin/bash', 0, 2),
         ]
         self.host_os.process_infos.return_value = self.processes
+        self.host_os.process_summaries.side_effect = lambda uid: [
+            (process.name, process.state)
+            for process in self.processes
+            if uid is None or process.uid == uid]
 
         self.host_os.uid.side_effect = lambda x: {PROCESS_USER: PROCESS_UID}[x]
 
@@ -70,3 +76,129 @@ class TestNum():
                          host_os=self.host_os)
 
         assert_equal(0, value)
+
+    def test_empty_arguments_match_all(self):
+        value = proc.num('', '', '', '', host_os=self.host_os)
+
+        assert_equal(len(self.processes), value)
+
+    def test_command_lines_are_read_only_for_cmdline_filter(self):
+        assert_equal(1, proc.num(user=PROCESS_USER, state='run',
+                                 host_os=self.host_os))
+        self.host_os.process_summaries.assert_called_once_with(PROCESS_UID)
+        assert not self.host_os.process_infos.called
+
+        assert_equal(1, proc.num(cmdline='bash', host_os=self.host_os))
+        self.host_os.process_infos.assert_called_once_with()
+
+
+class TestMem():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.AVAILABLE_PROCESS_MEMORY_TYPES = set(['vsize', 'rss'])
+        self.host_os.process_infos.return_value = [
+            ProcessInfo('nginx', 0, 'sleep', 'nginx: master', 0, 1),
+            ProcessInfo('nginx', PROCESS_UID, 'sleep', 'nginx: worker', 0, 2),
+            ProcessInfo('nginx', PROCESS_UID, 'sleep', 'nginx: worker', 0, 3),
+            ProcessInfo('bash', PROCESS_UID, 'run', '/bin/bash', 0, 4),
+        ]
+        self.host_os.process_memory.side_effect = (
+            lambda pid, memtype: pid * 100)
+        self.host_os.uid.side_effect = lambda x: {PROCESS_USER: PROCESS_UID}[x]
+
+    def test_sums_memory_of_matching_processes(self):
+        assert_equal(600, proc.mem('nginx', host_os=self.host_os))
+
+    def test_aggregates_memory_with_mode(self):
+        assert_equal(200, proc.mem('nginx', '', 'avg', host_os=self.host_os))
+        assert_equal(300, proc.mem('nginx', '', 'max', host_os=self.host_os))
+        assert_equal(100, proc.mem('nginx', '', 'min', host_os=self.host_os))
+
+    def test_filters_by_user_and_cmdline(self):
+        assert_equal(500, proc.mem('', PROCESS_USER, 'sum', 'worker',
+                                   host_os=self.host_os))
+
+    def test_passes_memtype(self):
+        proc.mem('bash', memtype='rss', host_os=self.host_os)
+
+        self.host_os.process_memory.assert_called_once_with(4, 'rss')
+
+    def test_skips_processes_that_exited(self):
+        self.host_os.process_memory.side_effect = IOError
+
+        assert_equal(0, proc.mem(host_os=self.host_os))
+
+    def test_raises_exception_for_unknown_mode_or_memtype(self):
+        assert_raises(WrongArgumentError, proc.mem, mode='wrong',
+                      host_os=self.host_os)
+        assert_raises(WrongArgumentError, proc.mem, memtype='pss',
+                      host_os=self.host_os)
+
+    def test_raises_exception_for_invalid_cmdline(self):
+        assert_raises(WrongArgumentError, proc.mem, cmdline='(',
+                      host_os=self.host_os)
+
+
+@patch('zabby.items.proc.monotonic', Mock(return_value=100.0))
+class TestCpuUtil():
+    def setup(self):
+        self.host_os = Mock()
+        self.history = {
+            0: (ProcessCpuTimes(user=7500, system=2500), 99.0),
+            60: (ProcessCpuTimes(user=3000, system=1000), 39.0),
+        }
+        self.host_os.process_cpu_times_shifted.side_effect = (
+            lambda name, uid, cmdline, shift, now: self.history[shift])
+
+    def test_returns_percentage_of_single_cpu(self):
+        assert_equal(10.0, proc.cpu_util(host_os=self.host_os))
+
+    def test_returns_percentage_of_time_type(self):
+        assert_equal(7.5, proc.cpu_util('', '', 'user', host_os=self.host_os))
+        assert_equal(2.5, proc.cpu_util('', '', 'system',
+                                        host_os=self.host_os))
+
+    def test_passes_filter_to_host_os(self):
+        self.host_os.uid.return_value = PROCESS_UID
+        proc.cpu_util('nginx', PROCESS_USER, host_os=self.host_os)
+
+        self.host_os.process_cpu_times_shifted.assert_called_with(
+            'nginx', PROCESS_UID, None, 60, 100.0)
+
+    def test_returns_0_if_nothing_was_collected_yet(self):
+        self.history[0] = self.history[60] = (None, None)
+
+        assert_equal(0.0, proc.cpu_util(host_os=self.host_os))
+
+    def test_raises_exception_for_unknown_type_or_mode(self):
+        assert_raises(WrongArgumentError, proc.cpu_util, util_type='wrong',
+                      host_os=self.host_os)
+        assert_raises(WrongArgumentError, proc.cpu_util, mode='wrong',
+                      host_os=self.host_os)
+
+
+class TestUserDiscovery():
+    def setup(self):
+        proc._discoveries.clear()
+        self.host_os = Mock()
+        self.host_os.process_owners.return_value = set([0, PROCESS_UID,
+                                                        4242])
+        self.host_os.username.side_effect = self.username
+
+    @staticmethod
+    def username(uid):
+        if uid == 4242:
+            raise OperatingSystemError()
+        return {0: 'root', PROCESS_UID: PROCESS_USER}[uid]
+
+    def test_returns_users_running_processes(self):
+        discovery = json.loads(proc.user_discovery(host_os=self.host_os))
+
+        assert_equal([{'{#USER}': 'root'}, {'{#USER}': PROCESS_USER}],
+                     discovery['data'])
+
+    def test_users_are_looked_up_only_when_owners_change(self):
+        proc.user_discovery(host_os=self.host_os)
+        proc.user_discovery(host_os=self.host_os)
+
+        assert_equal(3, self.host_os.username.call_count)
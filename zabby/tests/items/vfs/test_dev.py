@@ -1,9 +1,12 @@
-from mock import Mock
+import json
+
+from mock import Mock, patch
 from nose.tools import assert_raises, assert_equal, nottest, istest
 from zabby.core.exceptions import WrongArgumentError
 from zabby.tests import assert_less_equal, assert_is_instance
 
 from zabby.hostos import DiskDeviceStats
+from zabby.hostos.collectors import DiskDeviceStatsCollector
 from zabby.items.vfs import dev
 
 
@@ -11,6 +14,7 @@ from zabby.items.vfs import dev
 class TestReadWrite():
     def _common_setup(self):
         self.host_os = Mock()
+        self.host_os.last_read_time.return_value = 100.0
         disk_devices_stats = dict()
         for i in range(2):
             disk_devices_stats['dev{0}'.format(i)] = DiskDeviceStats(
@@ -25,7 +29,7 @@ class TestReadWrite():
             smaller_stats = stats._replace(
                 read_operations=stats.read_operations - 100,
                 write_operations=stats.write_operations - 100)
-            return smaller_stats, 1
+            return smaller_stats, now - 1
 
         self.host_os.disk_device_stats_shifted.side_effect = smaller_diskstat
         self.host_os.disk_device_names.return_value = set(
@@ -84,3 +88,80 @@ class TestWrite(TestReadWrite):
     def setup(self):
         self.function_under_test = dev.write
         self._common_setup()
+
+
+class TestRatesFromCollector():
+    def setup(self):
+        self.host_os = Mock()
+        self.host_os.AVAILABLE_DISK_DEVICE_STATS_TYPES = set(['operations'])
+        self.host_os.disk_device_names.return_value = set(['dev0'])
+
+        self.operations = 0
+
+        def stats(device):
+            return DiskDeviceStats(
+                read_sectors=0, read_operations=self.operations, read_bytes=0,
+                write_sectors=0, write_operations=0, write_bytes=0)
+
+        self.host_os.disk_device_stats.side_effect = stats
+
+        self.collector = DiskDeviceStatsCollector([(0.25, 60), (5, 900)],
+                                                  self.host_os)
+        self.host_os.disk_device_stats_shifted.side_effect = (
+            self.collector.get_stats)
+
+        self.now = 0.0
+        self.host_os.last_read_time.side_effect = lambda: self.now
+        self._patchers = [patch('zabby.hostos.collectors.monotonic',
+                                lambda: self.now)]
+        for patcher in self._patchers:
+            patcher.start()
+
+        assert_equal(0, dev.read('dev0', 'ops', 'avg1', self.host_os))
+
+    def teardown(self):
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def _collect_for(self, seconds, interval, operations_per_second):
+        end = self.now + seconds
+        while self.now < end:
+            self.collector._collect()
+            self.now += interval
+            self.operations += int(operations_per_second * interval)
+
+    def test_rate_is_exact_for_sub_second_intervals(self):
+        self._collect_for(120, 0.25, 100)
+
+        result = dev.read('dev0', 'ops', 'avg1', self.host_os)
+        assert_equal(100.0, result)
+
+    def test_rate_is_stable_when_wall_clock_steps_back(self):
+        with patch('time.time', Mock(return_value=1000.0)):
+            self._collect_for(60, 1, 50)
+            before_step = dev.read('dev0', 'ops', 'avg1', self.host_os)
+
+        with patch('time.time', Mock(return_value=-2600.0)):
+            self._collect_for(60, 1, 50)
+            after_step = dev.read('dev0', 'ops', 'avg1', self.host_os)
+
+        assert_equal(50.0, before_step)
+        assert_equal(before_step, after_step)
+
+
+class TestDiscovery():
+    def setup(self):
+        dev._discoveries.clear()
+        self.host_os = Mock()
+        self.host_os.disk_device_names.return_value = set(
+            ['sda', 'sda1', 'loop0', 'loop1'])
+
+    def test_filters_devices(self):
+        discovery = json.loads(dev.discovery('sd.*', host_os=self.host_os))
+
+        assert_equal([{'{#DEVNAME}': 'sda'}, {'{#DEVNAME}': 'sda1'}],
+                     discovery['data'])
+
+    def test_raises_exception_for_invalid_filter(self):
+        assert_raises(WrongArgumentError, dev.discovery, exclude='(',
+                      host_os=self.host_os)
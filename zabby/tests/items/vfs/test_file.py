@@ -1,7 +1,13 @@
+import hashlib
 import os
+import zlib
+from mock import patch
 from nose.plugins.attrib import attr
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_raises
+from zabby.core.exceptions import WrongArgumentError
+from zabby.core.six import b
 from zabby.core.utils import sh
+from zabby.tests import ensure_removed
 
 from zabby.items.vfs import file
 
@@ -24,3 +30,126 @@ class TestMd5Sum():
         coreutils_md5sum = sh('md5sum {0}')(self.FILE_PATH).split()[0]
         zabby_md5sum = file.md5sum(self.FILE_PATH)
         assert_equal(coreutils_md5sum, zabby_md5sum)
+
+
+class TestDigest():
+    FILE_PATH = '/tmp/zabby_digest_test_file'
+    FILE_CONTENT = b('0123456789') * 1000
+
+    def setup(self):
+        self._write(self.FILE_CONTENT)
+
+    def teardown(self):
+        os.remove(self.FILE_PATH)
+
+    def _write(self, content):
+        with open(self.FILE_PATH, 'wb') as f:
+            f.write(content)
+
+    def test_raises_exception_if_mode_is_unknown(self):
+        assert_raises(WrongArgumentError, file.digest, self.FILE_PATH, 'wrong')
+
+    def test_result_is_equal_to_hashlib_digest(self):
+        for mode in ['md5', 'sha1', 'sha256']:
+            expected = hashlib.new(mode, self.FILE_CONTENT).hexdigest()
+            assert_equal(expected, file.digest(self.FILE_PATH, mode))
+
+    def test_crc32_is_equal_to_zlib_crc32(self):
+        expected = '{0:08x}'.format(zlib.crc32(self.FILE_CONTENT) & 0xffffffff)
+        assert_equal(expected, file.digest(self.FILE_PATH, 'crc32'))
+
+    def test_result_does_not_depend_on_block_size(self):
+        expected = hashlib.md5(self.FILE_CONTENT).hexdigest()
+        for block_size in [1, 7, 4096, len(self.FILE_CONTENT) + 1]:
+            assert_equal(expected, file._read_digest(self.FILE_PATH, 'md5',
+                                                     block_size))
+
+    def test_unchanged_file_is_not_read_again(self):
+        expected = file.digest(self.FILE_PATH, 'sha1')
+        with patch('zabby.items.vfs.file._read_digest') as mock_read_digest:
+            assert_equal(expected, file.digest(self.FILE_PATH, 'sha1'))
+            assert_equal(0, mock_read_digest.call_count)
+
+    def test_changed_file_is_read_again(self):
+        file.digest(self.FILE_PATH, 'md5')
+        content = self.FILE_CONTENT + b('0')
+        self._write(content)
+
+        assert_equal(hashlib.md5(content).hexdigest(),
+                     file.digest(self.FILE_PATH, 'md5'))
+
+
+class TestFileInfo():
+    FILE_PATH = '/tmp/zabby_file_info_test_file'
+    MISSING_FILE_PATH = '/tmp/zabby_missing_test_file'
+    FILE_CONTENT = 'first line\nsecond line 42\nthird line 43\n'
+
+    def setup(self):
+        file._stat_cache.clear()
+        ensure_removed(self.MISSING_FILE_PATH)
+        with open(self.FILE_PATH, 'w') as f:
+            f.write(self.FILE_CONTENT)
+
+    def teardown(self):
+        os.remove(self.FILE_PATH)
+
+    def test_size(self):
+        assert_equal(len(self.FILE_CONTENT), file.size(self.FILE_PATH))
+
+    def test_exists(self):
+        assert_equal(1, file.exists(self.FILE_PATH))
+        assert_equal(0, file.exists(self.MISSING_FILE_PATH))
+
+    def test_size_raises_exception_for_missing_file(self):
+        assert_raises(OSError, file.size, self.MISSING_FILE_PATH)
+
+    def test_time(self):
+        stat = os.stat(self.FILE_PATH)
+        assert_equal(int(stat.st_mtime), file.time(self.FILE_PATH))
+        assert_equal(int(stat.st_atime), file.time(self.FILE_PATH, 'access'))
+        assert_equal(int(stat.st_ctime), file.time(self.FILE_PATH, 'change'))
+
+    def test_time_raises_exception_if_mode_is_unknown(self):
+        assert_raises(WrongArgumentError, file.time, self.FILE_PATH, 'wrong')
+
+    def test_stat_is_cached(self):
+        file.size(self.FILE_PATH)
+        with patch('zabby.items.vfs.file.os.stat') as mock_stat:
+            file.size(self.FILE_PATH)
+            file.exists(self.FILE_PATH)
+            assert_equal(0, mock_stat.call_count)
+
+    def test_regmatch(self):
+        assert_equal(1, file.regmatch(self.FILE_PATH, 'line [0-9]+'))
+        assert_equal(0, file.regmatch(self.FILE_PATH, 'fourth'))
+
+    def test_regmatch_respects_line_range(self):
+        assert_equal(0, file.regmatch(self.FILE_PATH, 'second', '', '3'))
+        assert_equal(0, file.regmatch(self.FILE_PATH, 'third', '', '1', '2'))
+        assert_equal(1, file.regmatch(self.FILE_PATH, 'third', '', '3', '3'))
+
+    def test_regmatch_raises_exception_for_invalid_line_numbers(self):
+        assert_raises(WrongArgumentError, file.regmatch, self.FILE_PATH,
+                      'line', '', '0')
+        assert_raises(WrongArgumentError, file.regmatch, self.FILE_PATH,
+                      'line', '', '', 'wrong')
+
+    def test_regmatch_raises_exception_for_invalid_regexp(self):
+        assert_raises(WrongArgumentError, file.regmatch, self.FILE_PATH,
+                      'line (')
+
+    def test_regexp_returns_first_matching_line(self):
+        assert_equal('second line 42',
+                     file.regexp(self.FILE_PATH, 'line [0-9]+'))
+        assert_equal('', file.regexp(self.FILE_PATH, 'fourth'))
+
+    def test_regexp_formats_output(self):
+        assert_equal('42/line 42',
+                     file.regexp(self.FILE_PATH, 'line ([0-9]+)',
+                                 output='\\1/\\0'))
+
+    def test_lines_are_split_across_chunks(self):
+        with open(self.FILE_PATH, 'rb') as f:
+            lines = list(file._lines(f, chunk_size=3))
+        assert_equal([b(line) for line in self.FILE_CONTENT.split('\n')[:-1]],
+                     lines)
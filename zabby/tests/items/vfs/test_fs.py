@@ -1,5 +1,10 @@
+import json
+
 from mock import Mock
-from nose.tools import assert_raises, istest
+from nose.tools import assert_raises, assert_equal, istest
+
+from zabby.core.exceptions import WrongArgumentError
+from zabby.hostos import MountInfo
 
 from zabby.items.vfs import fs
 from zabby.tests import TestSizeFunction
@@ -29,3 +34,45 @@ class TestFsInodes(TestSizeFunction):
         self.host_os.fs_inodes = self.host_os_function
         self.function_under_test = fs.inode
         self.target = FS
+
+
+MOUNTS = (
+    MountInfo('/', 'ext4', '/dev/sda1'),
+    MountInfo('/proc', 'proc', 'proc'),
+    MountInfo('/home', 'xfs', '/dev/sda2'),
+)
+
+
+class TestFsDiscovery():
+    def setup(self):
+        fs._discoveries.clear()
+        self.host_os = Mock()
+        self.host_os.mounts.return_value = MOUNTS
+
+    def discovered(self, fstype=''):
+        discovery = json.loads(fs.discovery(fstype, host_os=self.host_os))
+        return [(entry['{#FSNAME}'], entry['{#FSTYPE}'])
+                for entry in discovery['data']]
+
+    def test_returns_all_mounts(self):
+        assert_equal([(mount.mount_point, mount.fstype) for mount in MOUNTS],
+                     self.discovered())
+
+    def test_filters_by_fstype(self):
+        assert_equal([('/', 'ext4'), ('/home', 'xfs')],
+                     self.discovered('ext4|xfs'))
+
+    def test_raises_exception_if_fstype_is_invalid(self):
+        assert_raises(WrongArgumentError, fs.discovery, '(', self.host_os)
+
+    def test_json_is_reused_while_mounts_do_not_change(self):
+        first = fs.discovery(host_os=self.host_os)
+        second = fs.discovery(host_os=self.host_os)
+
+        assert first is second
+
+    def test_json_is_rebuilt_when_mounts_change(self):
+        fs.discovery(host_os=self.host_os)
+        self.host_os.mounts.return_value = MOUNTS[:1]
+
+        assert_equal([('/', 'ext4')], self.discovered())
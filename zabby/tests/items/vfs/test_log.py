@@ -0,0 +1,137 @@
+import json
+import os
+
+from mock import patch, Mock
+from nose.tools import assert_equal, assert_raises, assert_true, assert_false
+from zabby.core.exceptions import WrongArgumentError
+from zabby.core.utils import monotonic
+from zabby.hostos import HostOS
+
+from zabby.items.vfs import log
+from zabby.tests import ensure_removed
+
+FILE_PATH = '/tmp/zabby_log_test_file'
+STATE_FILE = '/tmp/zabby_log_test_offsets.json'
+
+
+def append(content, file_path=FILE_PATH):
+    with open(file_path, 'a') as f:
+        f.write(content)
+
+
+class TestLog():
+    def setup(self):
+        ensure_removed(FILE_PATH)
+        ensure_removed(STATE_FILE)
+        log._offsets = log.LogOffsets()
+        append('error 1\ninfo 2\nerror 3\n')
+
+    def teardown(self):
+        ensure_removed(FILE_PATH)
+        ensure_removed(STATE_FILE)
+
+    def test_returns_matching_lines_from_beginning(self):
+        assert_equal('error 1\nerror 3', log.lines(FILE_PATH, 'error'))
+
+    def test_returns_only_new_lines(self):
+        log.lines(FILE_PATH, 'error')
+        append('error 4\n')
+        assert_equal('error 4', log.lines(FILE_PATH, 'error'))
+        assert_equal('', log.lines(FILE_PATH, 'error'))
+
+    def test_positions_are_remembered_per_regexp(self):
+        log.lines(FILE_PATH, 'error')
+        assert_equal('info 2', log.lines(FILE_PATH, 'info'))
+
+    def test_skip_mode_skips_existing_content(self):
+        assert_equal('', log.lines(FILE_PATH, 'error', mode='skip'))
+        append('error 4\n')
+        assert_equal('error 4', log.lines(FILE_PATH, 'error', mode='skip'))
+
+    def test_incomplete_line_is_left_for_the_next_call(self):
+        log.lines(FILE_PATH, 'error')
+        append('error 4')
+        assert_equal('', log.lines(FILE_PATH, 'error'))
+        append('2\n')
+        assert_equal('error 42', log.lines(FILE_PATH, 'error'))
+
+    def test_max_lines_leaves_remaining_lines_for_the_next_call(self):
+        assert_equal('error 1', log.lines(FILE_PATH, 'error', max_lines='1'))
+        assert_equal('error 3', log.lines(FILE_PATH, 'error', max_lines='1'))
+
+    def test_raises_exception_for_invalid_arguments(self):
+        assert_raises(WrongArgumentError, log.lines, FILE_PATH, max_lines='0')
+        assert_raises(WrongArgumentError, log.lines, FILE_PATH, mode='wrong')
+        assert_raises(WrongArgumentError, log.lines, FILE_PATH, 'error (')
+
+    def test_output_template(self):
+        assert_equal('1,3', log.lines(FILE_PATH, 'error ([0-9])',
+                                      output='\\1').replace('\n', ','))
+
+    def test_reads_rotated_file_from_beginning(self):
+        log.lines(FILE_PATH, 'error')
+        os.rename(FILE_PATH, FILE_PATH + '.1')
+        append('error 5\n')
+        try:
+            assert_equal('error 5', log.lines(FILE_PATH, 'error'))
+        finally:
+            os.remove(FILE_PATH + '.1')
+
+    def test_reads_truncated_file_from_beginning(self):
+        log.lines(FILE_PATH, 'error')
+        open(FILE_PATH, 'w').close()
+        append('error 6\n')
+        assert_equal('error 6', log.lines(FILE_PATH, 'error'))
+
+    def test_count(self):
+        assert_equal(2, log.count(FILE_PATH, 'error'))
+        append('error 4\ninfo 5\n')
+        assert_equal(1, log.count(FILE_PATH, 'error'))
+
+    def test_reads_lines_split_across_chunks(self):
+        offsets = list()
+        with open(FILE_PATH, 'rb') as f:
+            for line, offset in log._complete_lines(f, 0, chunk_size=3):
+                offsets.append(offset)
+        assert_equal([8, 15, 23], offsets)
+
+    def test_offsets_are_persisted(self):
+        host_os = HostOS()
+        log.persist_offsets(STATE_FILE, host_os)
+        host_os.start_collectors()
+        log.lines(FILE_PATH, 'error')
+        host_os.stop_collectors()
+        with open(STATE_FILE) as f:
+            assert_equal(1, len(json.load(f)))
+
+        log._offsets = log.LogOffsets()
+        log.persist_offsets(STATE_FILE, Mock())
+        append('error 4\n')
+        assert_equal('error 4', log.lines(FILE_PATH, 'error'))
+
+    def test_offsets_are_saved_periodically_not_on_every_change(self):
+        log.persist_offsets(STATE_FILE, Mock())
+        log.lines(FILE_PATH, 'error')
+        assert_false(os.path.exists(STATE_FILE))
+
+        log._offsets.save()
+        assert_true(os.path.exists(STATE_FILE))
+
+        ensure_removed(STATE_FILE)
+        log._offsets.save()
+        assert_false(os.path.exists(STATE_FILE))
+
+    def test_unused_offsets_and_locks_are_forgotten(self):
+        log.lines(FILE_PATH, 'error')
+        with patch('zabby.items.vfs.log.monotonic',
+                   return_value=monotonic() + log.OFFSET_MAX_AGE + 1):
+            log.lines(FILE_PATH, 'info')
+            log._offsets.evict(log.OFFSET_MAX_AGE)
+
+        assert_equal([(FILE_PATH, 'info')], list(log._offsets._offsets))
+        assert_equal([(FILE_PATH, 'info')], list(log._offsets._key_locks))
+
+    def test_ignores_malformed_state(self):
+        append('garbage', STATE_FILE)
+        log.persist_offsets(STATE_FILE, Mock())
+        assert_equal(2, log.count(FILE_PATH, 'error'))
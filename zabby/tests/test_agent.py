@@ -1,11 +1,13 @@
 # coding=utf-8
 import struct
-from mock import Mock, ANY
+from mock import Mock, MagicMock, ANY, patch
 from nose.tools import assert_equal, assert_raises
 from zabby.core.exceptions import WrongArgumentError
 
 from zabby.tests import assert_is_instance, assert_not_in
 from zabby.core.six import b, u, string_types
+from zabby.core.utils import sh
+from zabby.hostos import HostOS, batched
 from zabby.agent import (AgentRequestHandler, set_protocol, set_data_source,
                          ZBXDProtocol, DataSource, KeyParser,
                          ArgumentParserWithQuoting)
@@ -76,6 +78,15 @@ class TestProtocol():
         assert_not_in('e+', decoded_message)
         assert_not_in('E+', decoded_message)
 
+    @patch('locale.getpreferredencoding', Mock(return_value='UTF-8'))
+    def test_non_ascii_command_output_is_sent_as_utf8(self):
+        value = sh(r'printf "caf\303\251"')()
+
+        message = self.protocol._calculate_message(value)
+
+        assert_equal(self.protocol.HEADER + struct.pack('<q', 5) +
+                     b'caf\xc3\xa9', message)
+
 
 class TestDataSource():
     def setup(self):
@@ -128,6 +139,60 @@ class TestDataSource():
         assert_equal(self.data_source.DEFAULT_VALUE, value)
 
 
+class CountingHostOS(HostOS):
+    def __init__(self):
+        super(CountingHostOS, self).__init__()
+        self.reads = 0
+
+    @batched
+    def stats(self):
+        self.reads += 1
+        return self.reads
+
+
+class TestDataSourceProcessMany():
+    def setup(self):
+        self.config = Mock()
+        self.config.items = {
+            'first': lambda argument: 'first ' + argument,
+            'second': lambda: 'second',
+        }
+        self.host_os = MagicMock()
+
+        self.data_source = DataSource(KeyParser(), self.config, self.host_os)
+
+    def test_returns_results_in_order_of_keys(self):
+        values = self.data_source.process_many(
+            ['first[a]', 'second', 'first[b]'])
+
+        assert_equal(['first a', 'second', 'first b'], values)
+
+    def test_returns_default_value_for_failed_keys(self):
+        values = self.data_source.process_many(
+            ['unknown', 'first[unterminated', 'second'])
+
+        assert_equal([self.data_source.DEFAULT_VALUE,
+                      self.data_source.DEFAULT_VALUE, 'second'], values)
+
+    def test_keys_of_different_functions_share_host_os_reads(self):
+        host_os = CountingHostOS()
+        self.config.items = {
+            'first': lambda argument: host_os.stats(),
+            'second': lambda: host_os.stats(),
+        }
+        data_source = DataSource(KeyParser(), self.config, host_os)
+
+        data_source.process_many(['first[a]', 'first[b]', 'second'])
+
+        assert_equal(1, host_os.reads)
+        assert_equal({'stats': (1, 2)}, host_os.read_stats())
+
+    def test_works_without_host_os(self):
+        data_source = DataSource(KeyParser(), self.config)
+
+        assert_equal(['second'], data_source.process_many(['second']))
+
+
 class TestKeyParser():
     def setUp(self):
         self.parser = KeyParser()
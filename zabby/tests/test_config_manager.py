@@ -24,6 +24,12 @@ class TestConfigManager():
         self.config_module.listen_host = '0.0.0.0'
         self.config_module.listen_port = 10052
         self.config_module.item_files = list()
+        self.config_module.collector_history = dict()
+        self.config_module.state_dir = None
+        self.config_module.process_pool_size = 0
+        self.config_module.coalescing_ttl = 0
+        self.config_module.helper_pool_size = 0
+        self.config_module.process_walker_workers = 0
 
         self._patcher = patch('logging.config')
         self.mock_logging_conf = self._patcher.start()
@@ -71,6 +77,48 @@ class TestConfigManager():
         assert_is_instance(host, string_types)
         assert_is_instance(port, integer_types)
 
+    def test_contains_collector_history(self):
+        history = {'cpu_times': [(1, 60), (5, 900)]}
+        self.config_module.collector_history = history
+        self.config_manager.update_config()
+
+        assert_equal(history, self.config_manager.collector_history)
+
+    def test_throws_exception_if_collector_history_is_invalid(self):
+        self.config_module.collector_history = {'cpu_times': [(5, 900),
+                                                              (1, 60)]}
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_contains_state_dir(self):
+        self.config_module.state_dir = CONFIG_DIR
+        self.config_manager.update_config()
+
+        assert_equal(CONFIG_DIR, self.config_manager.state_dir)
+
+    def test_throws_exception_if_state_dir_is_not_a_string(self):
+        self.config_module.state_dir = 0
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_throws_exception_if_process_pool_size_is_not_integer(self):
+        self.config_module.process_pool_size = '2'
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_throws_exception_if_coalescing_ttl_is_negative(self):
+        self.config_module.coalescing_ttl = -1
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_throws_exception_if_coalescing_ttl_is_not_a_number(self):
+        self.config_module.coalescing_ttl = '1'
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_throws_exception_if_helper_pool_size_is_not_integer(self):
+        self.config_module.helper_pool_size = '2'
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
+    def test_throws_exception_if_process_walker_workers_is_not_integer(self):
+        self.config_module.process_walker_workers = '4'
+        assert_raises(ConfigurationError, self.config_manager.update_config)
+
     def test_loads_items_from_item_files(self):
         self.config_manager.update_config()
 
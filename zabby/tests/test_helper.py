@@ -0,0 +1,97 @@
+import os
+import signal
+import threading
+
+from mock import patch
+from nose.tools import assert_equal, assert_raises, assert_false
+
+from zabby.core import utils
+from zabby.core.exceptions import OperatingSystemError
+from zabby.core.helper import HelperPool
+from zabby.core.utils import sh, start_helper_pool, stop_helper_pool
+
+
+class TestHelperPool():
+    def setup(self):
+        self.pool = HelperPool(1)
+
+    def teardown(self):
+        self.pool.stop()
+
+    def kill_helper(self):
+        helper = self.pool._helpers.get()
+        os.kill(helper.pid, signal.SIGKILL)
+        helper.wait()
+        self.pool._helpers.put(helper)
+
+    def test_runs_command(self):
+        assert_equal(('out\n', ''), self.pool.run('echo out', 1.0, 1024))
+
+    def test_raises_exception_if_command_fails(self):
+        assert_raises(OperatingSystemError, self.pool.run, 'sleep 10', 0.1,
+                      1024)
+
+    def test_replaces_helper_that_has_died(self):
+        self.kill_helper()
+
+        assert_raises(OperatingSystemError, self.pool.run, 'echo out', 1.0,
+                      1024)
+        assert_equal(('out\n', ''), self.pool.run('echo out', 1.0, 1024))
+
+    def test_does_not_reuse_helper_that_could_not_be_restarted(self):
+        self.kill_helper()
+
+        with patch.object(self.pool, '_spawn', side_effect=OSError()):
+            assert_raises(OperatingSystemError, self.pool.run, 'echo out',
+                          1.0, 1024)
+
+        assert_equal(('out\n', ''), self.pool.run('echo out', 1.0, 1024))
+
+    def test_runs_command_itself_if_stopped_while_waiting_for_helper(self):
+        pool = HelperPool(1)
+        helper = pool._helpers.get()
+        outputs = list()
+        waiting = threading.Thread(target=lambda: outputs.append(
+            pool.run('sh -c "echo $PPID"', 1.0, 1024)))
+        waiting.start()
+        stopping = threading.Thread(target=pool.stop)
+        stopping.start()
+
+        waiting.join(5.0)
+        pool._helpers.put(helper)
+        stopping.join(5.0)
+
+        assert_equal([(str(os.getpid()) + '\n', '')], outputs)
+
+    def test_is_not_usable_after_stop(self):
+        pool = HelperPool(1)
+        pool.stop()
+
+        assert_false(pool.is_usable())
+
+
+class TestShInHelperPool():
+    def setup(self):
+        start_helper_pool(1)
+
+    def teardown(self):
+        stop_helper_pool()
+
+    def test_sh_runs_command_in_helper(self):
+        helper = utils._helper_pool._helpers.queue[0]
+
+        out = sh('sh -c "echo $PPID"')()
+
+        assert_equal(str(helper.pid), out)
+
+    def test_non_ascii_output_is_returned_as_if_run_directly(self):
+        command = sh(r'printf "caf\303\251"')
+        from_helper = command()
+        stop_helper_pool()
+
+        assert_equal(command(), from_helper)
+
+    def test_sh_runs_command_directly_after_pool_is_stopped(self):
+        stop_helper_pool()
+
+        assert_equal(str(os.getpid()), sh('sh -c "echo $PPID"')())
@@ -0,0 +1,135 @@
+import re
+import threading
+
+from nose.tools import assert_equal, assert_true
+
+from zabby.core.probe import ProbeEngine, Service
+from zabby.tests import assert_less, StandInServer, closed_port
+
+ECHO = Service(None, False, b'ping\n', re.compile(b'^ping\n'), None, True)
+GREETING = Service(None, True, None, re.compile(b'^hello'), b'bye\n', False)
+CONNECT = Service(None, False, None, None, None, False)
+
+
+def echo(conn):
+    while True:
+        data = conn.recv(4096)
+        if not data:
+            return
+        conn.sendall(data)
+
+
+def greet(conn):
+    conn.sendall(b'hello\n')
+    conn.recv(4096)
+
+
+def silent(conn):
+    conn.recv(4096)
+
+
+class TestProbeEngine():
+    def setup(self):
+        self.engine = ProbeEngine()
+        self.servers = list()
+
+    def teardown(self):
+        self.engine.stop()
+        for server in self.servers:
+            server.close()
+
+    def serve(self, handle):
+        server = StandInServer(handle)
+        self.servers.append(server)
+        return server
+
+    def test_returns_elapsed_time_if_service_responds(self):
+        server = self.serve(echo)
+
+        elapsed = self.engine.check(ECHO, '127.0.0.1', server.port, 1.0)
+
+        assert_less(0, elapsed)
+
+    def test_receives_greeting(self):
+        server = self.serve(greet)
+
+        assert_true(self.engine.check(GREETING, '127.0.0.1', server.port,
+                                      1.0))
+
+    def test_only_connects_if_nothing_is_expected(self):
+        server = self.serve(silent)
+
+        assert_true(self.engine.check(CONNECT, '127.0.0.1', server.port,
+                                      1.0))
+
+    def test_returns_none_if_connection_is_refused(self):
+        assert_equal(None, self.engine.check(ECHO, '127.0.0.1',
+                                             closed_port(), 1.0))
+
+    def test_returns_none_if_service_does_not_respond_in_time(self):
+        server = self.serve(silent)
+
+        assert_equal(None, self.engine.check(ECHO, '127.0.0.1', server.port,
+                                             0.1))
+
+    def test_returns_none_if_response_does_not_match(self):
+        server = self.serve(greet)
+
+        assert_equal(None, self.engine.check(ECHO, '127.0.0.1', server.port,
+                                             1.0))
+
+    def test_checks_run_concurrently(self):
+        server = self.serve(silent)
+        results = list()
+
+        def check():
+            results.append(self.engine.check(ECHO, '127.0.0.1', server.port,
+                                             0.3))
+
+        threads = [threading.Thread(target=check) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2.0)
+
+        assert_equal([None] * 10, results)
+
+    def test_reuses_connections_if_pooling_is_enabled(self):
+        self.engine.pool_connections = True
+        server = self.serve(echo)
+
+        for _ in range(3):
+            assert_true(self.engine.check(ECHO, '127.0.0.1', server.port,
+                                          1.0))
+
+        assert_equal(1, server.connections)
+
+    def test_reconnects_if_idle_connection_was_closed(self):
+        self.engine.pool_connections = True
+        closing_server = self.serve(lambda conn: conn.sendall(conn.recv(5)))
+
+        for _ in range(2):
+            assert_true(self.engine.check(ECHO, '127.0.0.1',
+                                          closing_server.port, 1.0))
+
+        assert_equal(2, closing_server.connections)
+
+    def test_keeps_running_after_unexpected_error_in_probe(self):
+        server = self.serve(echo)
+        start = self.engine._start
+        failures = [RuntimeError('unexpected')]
+
+        def failing_start(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return start(*args, **kwargs)
+
+        self.engine._start = failing_start
+
+        assert_equal(None, self.engine.check(ECHO, '127.0.0.1', server.port,
+                                             1.0))
+        assert_true(self.engine.check(ECHO, '127.0.0.1', server.port, 1.0))
+
+    def test_does_not_block_if_wakeup_pipe_is_full(self):
+        for _ in range(100000):
+            self.engine._wake_up()
@@ -1,6 +1,13 @@
+import json
+import operator
+import os
+import threading
+import time
+import warnings
 from types import FunctionType
 from mock import patch, Mock, ANY, call, sentinel
-from nose.tools import assert_raises, assert_equal, assert_true, assert_false
+from nose.tools import (assert_raises, assert_equal, assert_true, assert_false,
+                        assert_not_equal)
 
 from zabby.tests import (assert_is_instance, ensure_removed,
                          ensure_contains_only_formatted_lines,
@@ -11,7 +18,11 @@ from zabby.core.six import integer_types, string_types, u, b
 from zabby.core.utils import (SIZE_CONVERSION_MODES, validate_mode,
                               convert_size, lines_from_file, lists_from_file,
                               dict_from_file, to_bytes, sh, tcp_communication,
-                              exception_guard)
+                              exception_guard, in_process_pool, TimedCache,
+                              start_process_pool, stop_process_pool,
+                              discovery_json, compile_filter,
+                              filter_names, DiscoveryCache, sh_field,
+                              parse_key_values, CommandResults)
 
 
 def test_validate_mode_raises_exception_if_mode_is_not_available():
@@ -105,106 +116,281 @@ class TestToBytes():
         assert_is_instance(value, integer_types)
 
 
-COMMAND = 'command'
-COMMAND_WITH_ARGUMENTS = 'command {0}'
-STDOUT = 'stdout\n'
-STDERR = 'stderr\n'
-ARGUMENT = 'argument'
+class TestDiscoveryJson():
+    def test_wraps_macro_names(self):
+        entries = [{'FSNAME': '/', 'FSTYPE': 'ext4'}]
 
+        discovery = json.loads(discovery_json(entries))
 
-class TestSh():
+        assert_equal({'data': [{'{#FSNAME}': '/', '{#FSTYPE}': 'ext4'}]},
+                     discovery)
+
+    def test_returns_empty_data_if_there_are_no_entries(self):
+        assert_equal({'data': []}, json.loads(discovery_json([])))
+
+
+class TestCompileFilter():
+    def test_matches_whole_value(self):
+        compiled_filter = compile_filter('ext4|xfs')
+
+        assert_true(compiled_filter.match('xfs'))
+        assert_false(compiled_filter.match('ext4dev'))
+
+    def test_raises_exception_if_pattern_is_invalid(self):
+        assert_raises(WrongArgumentError, compile_filter, '(')
+
+
+class TestFilterNames():
     def setup(self):
-        self._patcher_popen = patch('zabby.core.utils.Popen')
+        self.names = set(['eth0', 'eth1', 'veth0a', 'lo'])
 
-        self.process = Mock()
-        self.process.communicate.return_value = (STDOUT, '')
+    def test_returns_sorted_names_if_there_are_no_filters(self):
+        assert_equal(sorted(self.names), filter_names(self.names))
 
-        self.mock_popen = self._patcher_popen.start()
-        self.mock_popen.return_value = self.process
+    def test_includes_only_matching_names(self):
+        assert_equal(['eth0', 'eth1'], filter_names(self.names, 'eth.*'))
 
-        self._patcher_time = patch('zabby.core.utils.time')
-        self.mock_time = self._patcher_time.start()
+    def test_excludes_matching_names(self):
+        assert_equal(['eth0', 'eth1', 'lo'],
+                     filter_names(self.names, exclude='veth.*'))
 
-    def teardown(self):
-        self._patcher_popen.stop()
-        self._patcher_time.stop()
 
+class TestDiscoveryCache():
+    def setup(self):
+        self.cache = DiscoveryCache()
+        self.build = Mock(return_value='{}')
+
+    def test_builds_only_once_for_equal_snapshots(self):
+        self.cache.get('key', set(['a']), self.build)
+        self.cache.get('key', set(['a']), self.build)
+
+        assert_equal(1, self.build.call_count)
+
+    def test_builds_again_when_snapshot_changes(self):
+        self.cache.get('key', set(['a']), self.build)
+        self.cache.get('key', set(['a', 'b']), self.build)
+
+        assert_equal(2, self.build.call_count)
+
+    def test_keys_are_cached_separately(self):
+        self.cache.get('key', set(['a']), self.build)
+        self.cache.get('other', set(['a']), self.build)
+
+        assert_equal(2, self.build.call_count)
+
+
+COMMAND = 'echo stdout'
+COMMAND_WITH_ARGUMENTS = 'echo {0}'
+SHELL_COMMAND = 'echo stdout | tr a-z A-Z'
+ERROR_COMMAND = 'echo stdout; echo stderr >&2'
+SILENT_COMMAND = 'true'
+STDOUT = 'stdout'
+ARGUMENT = 'argument'
+
+
+class TestSh():
     def test_returns_a_function(self):
         f = sh(COMMAND)
         assert_is_instance(f, FunctionType)
 
-    def test_function_runs_command_when_called(self):
-        sh(COMMAND)()
-        command = self.mock_popen.call_args[0][0]
-        assert_equal(command, COMMAND)
-        self.process.communicate.assert_called_once_with()
-
     def test_command_output_is_returned(self):
         result = sh(COMMAND)()
-        assert_true(not result.endswith('\n'))
-        assert_in(result, STDOUT)
+        assert_equal(STDOUT, result)
+
+    def test_command_without_shell_syntax_is_executed_directly(self):
+        with patch('zabby.core.utils.Popen', wraps=utils.Popen) as mock_popen:
+            sh(COMMAND)()
+
+        assert_equal(['echo', 'stdout'], mock_popen.call_args[0][0])
+        assert_false(mock_popen.call_args[1]['shell'])
+
+    def test_command_with_shell_syntax_is_executed_with_shell(self):
+        result = sh(SHELL_COMMAND)()
+        assert_equal(STDOUT.upper(), result)
+
+    def test_shell_builtin_is_executed_with_shell(self):
+        assert_true(sh('ulimit -n')().isdigit())
+
+    def test_wait_step_is_deprecated(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            sh(COMMAND, wait_step=0.1)
+
+        assert_equal([DeprecationWarning],
+                     [warning.category for warning in caught])
 
     @patch('zabby.core.utils.logging')
     def test_command_errors_are_logged(self, mock_logging):
         mock_logger = Mock()
         mock_logging.getLogger.return_value = mock_logger
-        self.process.communicate.return_value = (STDOUT, STDERR)
 
-        sh(COMMAND)()
+        sh(ERROR_COMMAND)()
         mock_logger.warn.assert_called_once_with(ANY)
 
-    def test_function_accepts_arguments(self):
-        sh(COMMAND)(ARGUMENT)
-
     def test_function_inserts_arguments_into_command(self):
-        sh(COMMAND_WITH_ARGUMENTS)(ARGUMENT)
-        command = self.mock_popen.call_args[0][0]
-        assert_in(ARGUMENT, command)
+        result = sh(COMMAND_WITH_ARGUMENTS)(ARGUMENT)
+        assert_equal(ARGUMENT, result)
 
     def test_calling_command_that_accepts_arguments_without_them(self):
         f = sh(COMMAND_WITH_ARGUMENTS)
         assert_raises(WrongArgumentError, f)
 
-    def test_calling_command_without_timeout_does_not_poll(self):
-        sh(COMMAND, timeout=None)()
-
-        assert_false(self.process.poll.called)
+    def test_calling_command_without_timeout(self):
+        assert_equal(STDOUT, sh(COMMAND, timeout=None)())
 
-    def test_raises_exception_if_poll_never_succeed(self):
-        self.process.poll.return_value = None
+    def test_raises_exception_if_command_does_not_complete_in_time(self):
+        command = sh('sleep 10', timeout=0.1)
 
-        command = sh(COMMAND, timeout=10.0)
+        started = time.time()
         assert_raises(OperatingSystemError, command)
+        assert_less(time.time() - started, 5)
 
-    def test_does_not_raise_exception_if_poll_eventually_succeed(self):
-        self.process.poll.side_effect = [None, 0]
+    def test_waits_with_timeout_without_timeout_expired(self):
+        command = sh('exec >/dev/null 2>&1; sleep 10', timeout=0.1,
+                     raise_on_empty_out=False)
 
-        wait_step = 0.1
-        sh(COMMAND, timeout=10.0, wait_step=wait_step)()
+        with patch('zabby.core.utils.TimeoutExpired', None):
+            started = time.time()
+            assert_raises(OperatingSystemError, command)
+        assert_less(time.time() - started, 5)
 
-        self.mock_time.sleep.assert_called_with(wait_step)
+    def test_kills_children_of_timed_out_command(self):
+        command = sh('sleep 10 & echo $!; wait', timeout=0.5,
+                     raise_on_empty_out=False)
 
-    def test_raises_exception_if_command_does_not_produce_output(self):
-        self.process.communicate.return_value = ('', '')
+        with patch('zabby.core.utils.os.killpg',
+                   wraps=os.killpg) as mock_killpg:
+            assert_raises(OperatingSystemError, command)
 
-        f = sh(COMMAND)
+        assert_equal(1, mock_killpg.call_count)
+
+    def test_raises_exception_if_command_writes_too_much(self):
+        command = sh('yes', timeout=10.0, max_output_size=1024)
+        assert_raises(OperatingSystemError, command)
+
+    def test_raises_exception_if_command_can_not_be_executed(self):
+        command = sh('/not/existing/command')
+        assert_raises(OperatingSystemError, command)
+
+    def test_raises_exception_if_command_does_not_produce_output(self):
+        f = sh(SILENT_COMMAND)
         assert_raises(OperatingSystemError, f)
 
     def test_raises_exception_if_command_produces_errors(self):
-        self.process.communicate.return_value = (STDOUT, STDERR)
-
-        f = sh(COMMAND, raise_on_nonempty_err=True)
+        f = sh(ERROR_COMMAND, raise_on_nonempty_err=True)
         assert_raises(OperatingSystemError, f)
 
-    def test_communicate_with_completed_process(self):
+
+class TestShCache():
+    def setup(self):
+        utils._command_results.clear()
+        self._patcher_run = patch('zabby.core.utils._run')
+        self.mock_run = self._patcher_run.start()
+        self.mock_run.return_value = (STDOUT, '')
+
+    def teardown(self):
+        self._patcher_run.stop()
+        utils._command_results.clear()
+
+    def test_command_is_run_every_time_without_cache_ttl(self):
+        sh(COMMAND)()
         sh(COMMAND)()
-        self.process.communicate.assert_called_once_with()
 
-    def test_communicate_with_timed_out_process(self):
-        self.process.poll.return_value = None
-        command = sh(COMMAND, timeout=10.0)
+        assert_equal(2, self.mock_run.call_count)
+
+    def test_functions_with_the_same_command_share_output(self):
+        sh(COMMAND, cache_ttl=10)()
+        sh(COMMAND, cache_ttl=10)()
+
+        assert_equal(1, self.mock_run.call_count)
+
+    def test_differently_formatted_commands_are_run_separately(self):
+        command = sh(COMMAND_WITH_ARGUMENTS, cache_ttl=10)
+        command('first')
+        command('second')
+
+        assert_equal(2, self.mock_run.call_count)
+
+    def test_failures_are_shared(self):
+        self.mock_run.side_effect = OperatingSystemError
+        command = sh(COMMAND, cache_ttl=10)
+
+        assert_raises(OperatingSystemError, command)
         assert_raises(OperatingSystemError, command)
-        self.process.communicate.assert_called_once_with()
+        assert_equal(1, self.mock_run.call_count)
+
+
+class TestCommandResults():
+    def setup(self):
+        self.results = CommandResults()
+        self.run = Mock(side_effect=lambda: self.run.call_count)
+        self.now = 0
+        self._patcher_monotonic = patch('zabby.core.utils.monotonic',
+                                        lambda: self.now)
+        self._patcher_monotonic.start()
+
+    def teardown(self):
+        self._patcher_monotonic.stop()
+
+    def get(self):
+        return self.results.get(COMMAND, 10, 10, self.run)
+
+    def wait_for_refresh(self):
+        while self.results._refreshing:
+            time.sleep(0.001)
+
+    def test_result_is_returned_until_it_expires(self):
+        self.get()
+        self.now = 9
+
+        assert_equal(1, self.get())
+
+    def test_stale_result_is_returned_while_command_is_run_again(self):
+        self.get()
+        self.now = 15
+
+        assert_equal(1, self.get())
+        self.wait_for_refresh()
+        assert_equal(2, self.get())
+
+    def test_command_is_run_synchronously_after_result_becomes_too_old(self):
+        self.get()
+        self.now = 25
+
+        assert_equal(2, self.get())
+
+    def test_locks_of_expired_results_are_forgotten(self):
+        self.results.get('expiring', 10, 0, self.run)
+        self.now = 25
+        self.get()
+
+        assert_equal([COMMAND], list(self.results._command_locks))
+
+
+class TestShField():
+    def setup(self):
+        self._patcher_run = patch('zabby.core.utils._run')
+        self.mock_run = self._patcher_run.start()
+        self.mock_run.return_value = ('Uptime: 10  Threads: 2', '')
+
+    def teardown(self):
+        self._patcher_run.stop()
+
+    def test_returns_field_of_parsed_output(self):
+        assert_equal('2', sh_field(COMMAND)('Threads'))
+
+    def test_raises_exception_for_missing_field(self):
+        assert_raises(WrongArgumentError, sh_field(COMMAND), 'missing')
+
+    def test_uses_supplied_parser(self):
+        field = sh_field(COMMAND, parse=lambda out: {'length': len(out)})
+
+        assert_equal(22, field('length'))
+
+
+def test_parse_key_values():
+    assert_equal({'Slow queries': '0', 'a': '1'},
+                 parse_key_values('Slow queries: 0\na = 1\nignored'))
 
 
 PORT = 8080
@@ -275,3 +461,102 @@ class TestExceptionGuard():
 
     def test_passes_arguments(self):
         assert_equal(sentinel, exception_guard(lambda x: x)(sentinel))
+
+
+class TestInProcessPool():
+    def teardown(self):
+        stop_process_pool()
+
+    def test_calls_function_in_calling_process_without_pool(self):
+        assert_equal(os.getpid(), in_process_pool(os.getpid)())
+
+    def test_calls_function_in_worker_process(self):
+        start_process_pool(1)
+        assert_not_equal(os.getpid(), in_process_pool(os.getpid)())
+
+    def test_passes_arguments(self):
+        start_process_pool(1)
+        assert_equal(6, in_process_pool(operator.mul)(2, 3))
+
+    def test_raises_exception_raised_by_function(self):
+        start_process_pool(1)
+        assert_raises(WrongArgumentError, in_process_pool(validate_mode),
+                      'mode', [])
+
+    def test_raises_exception_if_function_does_not_complete_in_time(self):
+        start_process_pool(1)
+        f = in_process_pool(time.sleep, timeout=0.1)
+        assert_raises(OperatingSystemError, f, 1)
+
+    def test_replaces_busy_worker_after_timeout(self):
+        start_process_pool(1)
+        assert_raises(OperatingSystemError,
+                      in_process_pool(time.sleep, timeout=0.1), 5)
+
+        assert_equal(6, in_process_pool(operator.mul, timeout=2.0)(2, 3))
+
+    def test_timeout_does_not_affect_calls_in_other_workers(self):
+        start_process_pool(2)
+        results = list()
+        running = threading.Thread(target=lambda: results.append(
+            in_process_pool(time.sleep, timeout=5.0)(0.5)))
+        running.start()
+        time.sleep(0.1)
+
+        assert_raises(OperatingSystemError,
+                      in_process_pool(time.sleep, timeout=0.1), 5)
+        running.join(5.0)
+
+        assert_equal([None], results)
+
+    def test_raises_exception_if_result_is_too_large(self):
+        f = in_process_pool(operator.mul, max_result_size=10)
+        assert_raises(OperatingSystemError, f, 'a', 11)
+
+        start_process_pool(1)
+        assert_raises(OperatingSystemError, f, 'a', 11)
+
+
+class TestTimedCache():
+    def setup(self):
+        self.now = 0.0
+        self._patcher = patch('zabby.core.utils.monotonic', lambda: self.now)
+        self._patcher.start()
+
+        self.cache = TimedCache(10, max_size=2)
+
+    def teardown(self):
+        self._patcher.stop()
+
+    def test_returns_default_for_missing_key(self):
+        assert_equal(sentinel, self.cache.get('key', sentinel))
+
+    def test_returns_value_until_it_expires(self):
+        self.cache.set('key', 'value')
+        self.now += 9
+        assert_equal('value', self.cache.get('key'))
+        self.now += 1
+        assert_equal(None, self.cache.get('key'))
+
+    def test_does_not_grow_over_max_size(self):
+        for key in range(3):
+            self.cache.set(key, key)
+        assert_equal(2, len(self.cache._entries))
+        assert_equal(2, self.cache.get(2))
+
+    def test_forgets_expired_values_first(self):
+        self.cache.set('expired', 0)
+        self.now += 10
+        self.cache.set('fresh', 1)
+        self.cache.set('new', 2)
+        assert_equal(1, self.cache.get('fresh'))
+
+
+def test_libc_monotonic_is_not_affected_by_time_steps():
+    libc_monotonic = utils._libc_monotonic()
+    before = libc_monotonic()
+
+    with patch('time.time', Mock(return_value=0.0)):
+        after = libc_monotonic()
+
+    assert_true(before <= after)